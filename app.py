@@ -1,37 +1,65 @@
 # app.py
-import base64
 import asyncio
 import os
+import re
 import json
-import requests
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, render_template_string, send_file
 from database.database import ChecklistDatabase, init_database
-from services.whatsapp import enviar_mensagem_whatsapp
+from database.provisionar import ler_csv, ler_json
+from services.cache_llm import CacheLLM
+from services.deduplicacao import deduplicador
+from services.duplicatas import FotoParecida, detector_duplicatas
+from services.fila import FilaWebhook
+from services.limites import LimitadorWebhook
+from services.estado_fluxo import ConflitoEstado, criar_flow_state_store
+from services.eventos import barramento_eventos, formatar_sse
+from services.exportacao import exportador_evidencias
+from services.fotos import armazem_fotos, detectar_mime, hash_valido, ler_ref
+from services.midia import ErroMidia, baixador_midia
+from services.ocr import verificador_ocr
+from services.processamento_imagem import processador_imagens
+from services.definicoes import definicao_checklist
+from services.intencoes import MotorIntencoes
+from services.observabilidade import configurar_logs, definir_rastreio, medir, rastreio, registro_metricas
+from services.whatsapp import enviador_whatsapp, enviar_mensagem
 
 # === Integração com LLM ===
 from langchain_openai import ChatOpenAI
-from pydantic import BaseModel, Field
-from typing import List, Literal, Union
+from typing import Optional, Tuple
 
 # Modelos de ações possíveis
-class MarcarConferido(BaseModel):
-    action: Literal["marcar_conferido"]
-    itens: List[str]
+from services.acoes import AcoesChecklist, MarcarConferido, ReiniciarChecklist, VerificarFaltantes
 
-class VerificarFaltantes(BaseModel):
-    action: Literal["verificar_faltantes"]
+# Logs estruturados (LOG_NIVEL, LOG_FORMATO), escritos por uma thread própria
+configurar_logs()
+logger = logging.getLogger("app")
 
-class ReiniciarChecklist(BaseModel):
-    action: Literal["reiniciar_checklist"]
+# LLM
+LLM_MODELO = "gpt-3.5-turbo"
+PROMPT_VERSAO = "1"  # Incrementar ao alterar o prompt (invalida o cache)
+llm = ChatOpenAI(model=LLM_MODELO, temperature=0)
 
-AcoesChecklist = Union[MarcarConferido, VerificarFaltantes, ReiniciarChecklist]
+# Cache das interpretações (memória + SQLite)
+cache_interpretacao = CacheLLM(modelo=LLM_MODELO, versao_prompt=PROMPT_VERSAO)
+
+
+def _converter_acao(resultado: dict) -> Optional[AcoesChecklist]:
+    if resultado["action"] == "marcar_conferido":
+        return MarcarConferido(**resultado)
+    elif resultado["action"] == "verificar_faltantes":
+        return VerificarFaltantes(action="verificar_faltantes")
+    elif resultado["action"] == "reiniciar_checklist":
+        return ReiniciarChecklist(action="reiniciar_checklist")
+    return None
 
-# LLM
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
 
-def interpretar_mensagem_usuario(texto: str):
-    prompt = f"""
+def _prompt_interpretacao(texto: str) -> str:
+    return f"""
 Você é um agente inteligente que interpreta mensagens de WhatsApp durante um checklist técnico para aplicação de provas do CEBRASPE.
 
 Seu papel é identificar se o usuário deseja:
@@ -47,55 +75,126 @@ Sempre responda no formato JSON estruturado:
 
 Mensagem original do usuário: \"{texto.strip()}\"
 """
+
+
+def _ler_interpretacao(texto: str, resposta) -> Optional[AcoesChecklist]:
+    if isinstance(resposta, list):
+        resposta_str = json.dumps(resposta)
+    else:
+        resposta_str = resposta
+
+    resultado = json.loads(resposta_str)
+    acao = _converter_acao(resultado)
+    if acao is not None:
+        # Falha ao gravar no cache não invalida a interpretação
+        try:
+            cache_interpretacao.guardar(texto, acao.model_dump())
+        except Exception as e:
+            logger.warning("⚠️ Erro ao gravar no cache do LLM: %s", e)
+    return acao
+
+
+def _interpretacao_em_cache(texto: str, span: dict):
+    # Retorna (True, ação) quando o texto já foi interpretado antes
     try:
-        resposta = llm.invoke(prompt).content
-        if isinstance(resposta, list):
-            resposta_str = json.dumps(resposta)
-        else:
-            resposta_str = resposta
-
-        resultado = json.loads(resposta_str)
-        if resultado["action"] == "marcar_conferido":
-            return MarcarConferido(**resultado)
-        elif resultado["action"] == "verificar_faltantes":
-            return VerificarFaltantes(action="verificar_faltantes")
-        elif resultado["action"] == "reiniciar_checklist":
-            return ReiniciarChecklist(action="reiniciar_checklist")
+        em_cache = cache_interpretacao.obter(texto)
+        if em_cache is not None:
+            span["tipo"] = "cache"
+            return True, _converter_acao(em_cache)
     except Exception as e:
-        print(f"⚠️ Erro ao interpretar mensagem: {e}")
+        logger.warning("⚠️ Erro ao consultar o cache do LLM: %s", e)
+    span["tipo"] = "llm"
+    return False, None
+
+
+def interpretar_mensagem_usuario(texto: str, span: Optional[dict] = None):
+    # `span` (de medir) recebe a origem da interpretação: cache ou llm
+    span = span if span is not None else {}
+    encontrada, acao = _interpretacao_em_cache(texto, span)
+    if encontrada:
+        return acao
+    try:
+        return _ler_interpretacao(texto, llm.invoke(_prompt_interpretacao(texto)).content)
+    except Exception as e:
+        logger.warning("⚠️ Erro ao interpretar mensagem: %s", e)
+    return None
+
+
+async def interpretar_mensagem_usuario_async(texto: str, span: Optional[dict] = None):
+    """
+    Versão assíncrona (llm.ainvoke): a espera pelo LLM não ocupa uma thread
+    """
+    span = span if span is not None else {}
+    encontrada, acao = await asyncio.to_thread(_interpretacao_em_cache, texto, span)
+    if encontrada:
+        return acao
+    try:
+        resposta = await llm.ainvoke(_prompt_interpretacao(texto))
+        return await asyncio.to_thread(_ler_interpretacao, texto, resposta.content)
+    except Exception as e:
+        logger.warning("⚠️ Erro ao interpretar mensagem: %s", e)
     return None
 
 
 # === FLASK SETUP ===
 app = Flask(__name__)
 
+# Processa o evento dentro da requisição, sem a fila (útil para depuração)
+WEBHOOK_SINCRONO = os.getenv("WEBHOOK_SINCRONO") == "1"
+
+# Segundos que o painel fica em cache (muitos coordenadores atualizando ao mesmo tempo)
+PAINEL_CACHE_SEGUNDOS = float(os.getenv("PAINEL_CACHE_SEGUNDOS", "5"))
+
+# Intervalo dos comentários de keep-alive no /eventos (segundos)
+EVENTOS_HEARTBEAT = float(os.getenv("EVENTOS_HEARTBEAT", "15"))
+
+# Álbuns: fotos seguidas do mesmo remetente são processadas em lote (0 = uma foto por vez, na ordem).
+# Cada foto espera ALBUM_JANELA segundos na fila para que as demais fotos do álbum cheguem
+ALBUM_JANELA = float(os.getenv("ALBUM_JANELA", "0"))
+ALBUM_DOWNLOADS = int(os.getenv("ALBUM_DOWNLOADS", "4"))  # downloads simultâneos das fotos de um álbum
+
 # === FLUXOS DE CHECKLIST ===
-FLUXO_DIA1 = [
-    "envelope_sala_dia1", "lista_presenca_dia1", "ata_sala_dia1", "avaliacao_especializada_dia1",
-    "envelope_coordenacao_dia1", "cartao_resposta_reserva_dia1", "ata_sala_reserva_dia1",
-    "lista_presenca_reserva_dia1", "avaliacao_especializada_reserva_dia1", "envelope_porta_objetos_dia1",
-    "envelope_sala_extra_dia1", "manuais", "crachas", "relacao_candidatos_salas",
-    "alicate", "canetas", "pinceis", "fita_adesiva"
-]
+# Itens, rótulos e ordem de cada dia vêm da definição versionada (services/definicoes.py)
+logger.info(
+    "📋 Checklist %s v%s carregado", definicao_checklist.nome, definicao_checklist.versao,
+    extra={"definicao": definicao_checklist.resumo()},
+)
+
+# Estado do fluxo por sessão: {"dia": n, "indice": 0, "versao": n} (ver ESTADO_FLUXO_BACKEND)
+estado_fluxo = criar_flow_state_store()
+
+# Interpretador local: resolve as mensagens comuns sem chamar o LLM
+motor_intencoes = MotorIntencoes(definicao_checklist)
 
-FLUXO_DIA2 = [
-    "envelope_sala_dia2", "lista_presenca_dia2", "ata_sala_dia2", "avaliacao_especializada_dia2",
-    "envelope_coordenacao_dia2", "cartao_resposta_reserva_dia2", "ata_sala_reserva_dia2",
-    "lista_presenca_reserva_dia2", "avaliacao_especializada_reserva_dia2", "folha_rascunho_reserva",
-    "envelope_porta_objetos_dia2", "envelope_sala_extra_dia2", "envelope_folhas_rascunho",
-    "manuais", "crachas", "relacao_candidatos_salas", "alicate", "canetas", "pinceis", "fita_adesiva"
-]
 
-estado_fluxo = {}  # {sessao_id: {"dia": 1 ou 2, "indice": 0}}
+def resolver_intencao(texto: str, dia: int = 1) -> Optional[AcoesChecklist]:
+    """
+    Tenta o interpretador local e só consulta o LLM quando a confiança é baixa
+    """
+    with medir("intencao") as span:
+        acao = motor_intencoes.interpretar(texto, dia)
+        if acao is not None:
+            span["tipo"] = "local"
+            return acao
+        return interpretar_mensagem_usuario(texto, span)
+
+
+async def resolver_intencao_async(texto: str, dia: int = 1) -> Optional[AcoesChecklist]:
+    with medir("intencao") as span:
+        acao = motor_intencoes.interpretar(texto, dia)
+        if acao is not None:
+            span["tipo"] = "local"
+            return acao
+        return await interpretar_mensagem_usuario_async(texto, span)
 
 
 def iniciar_checklist(sessao_id: str, dia=1):
-    if ChecklistDatabase.buscar_checklist_dia1(sessao_id):
-        print(f"📌 Checklist já iniciado para {sessao_id}")
+    if ChecklistDatabase.existe_checklist(sessao_id, dia=dia):
+        logger.info("📌 Checklist já iniciado para %s", sessao_id)
         return "já iniciado"
-    ChecklistDatabase.criar_checklist_dia1(sessao_id=sessao_id)
-    estado_fluxo[sessao_id] = {"dia": dia, "indice": 0}
-    print(f"✅ Checklist iniciado para {sessao_id}")
+    ChecklistDatabase.criar_checklist(sessao_id, dia)
+    estado_fluxo.definir(sessao_id, dia, 0)
+    logger.info("✅ Checklist iniciado para %s", sessao_id)
     return "iniciado"
 
 
@@ -104,172 +203,711 @@ def home():
     return "<h1>✅ Bot Checklist CEBRASPE está ativo josé!</h1>"
 
 
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    print("\n📩 Novo Webhook Recebido")
-    try:
-        dados = request.get_json()
-        print(f"📦 Dados:\n{json.dumps(dados, indent=2, ensure_ascii=False)}")
+@app.route("/whatsapp/estatisticas", methods=["GET"])
+def estatisticas_whatsapp():
+    return jsonify(enviador_whatsapp.estatisticas()), 200
 
-        if dados.get("event") != "messages.upsert":
-            return jsonify({"status": "ignorado"}), 200
 
-        mensagem = dados["data"]["message"]
-        remetente = dados["data"]["key"]["remoteJid"]
-        sessao_id = remetente
-
-        if "conversation" in mensagem:
-            texto = mensagem["conversation"].strip().lower()
-            print(f"💬 {remetente}: {texto}")
-
-            # 🌞 Detecta início de checklist
-            if "iniciar" in texto:
-                if "dia 2" in texto:
-                    if not ChecklistDatabase.buscar_checklist_dia2(sessao_id):
-                        ChecklistDatabase.criar_checklist_dia2(sessao_id)
-                    estado_fluxo[sessao_id] = {"dia": 2, "indice": 0}
-                    primeiro_item = FLUXO_DIA2[0].replace("_", " ")
-                    asyncio.run(enviar_mensagem_whatsapp(remetente, f"🗓️ Checklist do *Dia 2* iniciado. Envie a imagem de: *{primeiro_item}*"))
-                    return jsonify({"status": "checklist dia 2 iniciado"}), 200
-                else:
-                    if not ChecklistDatabase.buscar_checklist_dia1(sessao_id):
-                        ChecklistDatabase.criar_checklist_dia1(sessao_id)
-                    estado_fluxo[sessao_id] = {"dia": 1, "indice": 0}
-                    primeiro_item = FLUXO_DIA1[0].replace("_", " ")
-                    asyncio.run(enviar_mensagem_whatsapp(remetente, f"🗓️ Checklist do *Dia 1* iniciado. Envie a imagem de: *{primeiro_item}*"))
-                    return jsonify({"status": "checklist dia 1 iniciado"}), 200
-
-
-            # 🤖 Interpretação por IA
-            acao = interpretar_mensagem_usuario(texto)
-
-            if isinstance(acao, MarcarConferido):
-                dia = estado_fluxo.get(sessao_id, {}).get("dia", 1)
-                for item in acao.itens:
-                    if dia == 1:
-                        ChecklistDatabase.atualizar_item_dia1(sessao_id, item.lower().replace(" ", "_"), presente=True)
-                    else:
-                        ChecklistDatabase.atualizar_item_dia2(sessao_id, item.lower().replace(" ", "_"), presente=True)
-                asyncio.run(enviar_mensagem_whatsapp(remetente, f"✅ Itens conferidos: {', '.join(acao.itens)}"))
-                return jsonify({"status": "conferido"}), 200
-
-            elif isinstance(acao, VerificarFaltantes):
-                dia = estado_fluxo.get(sessao_id, {}).get("dia", 1)
-                checklist = (
-                    ChecklistDatabase.buscar_checklist_dia1(sessao_id)
-                    if dia == 1 else
-                    ChecklistDatabase.buscar_checklist_dia2(sessao_id)
-                )
+@app.route("/intencoes/metricas", methods=["GET"])
+def metricas_intencoes():
+    return jsonify({
+        "interpretador_local": motor_intencoes.metricas(),
+        "cache_llm": cache_interpretacao.metricas(),
+    }), 200
 
-                if not checklist:
-                    asyncio.run(enviar_mensagem_whatsapp(
-                        remetente,
-                        "⚠️ Checklist ainda não iniciado. Envie 'iniciar' para começar."
-                    ))
-                else:
-                    faltando = [
-                        k.replace("_presente", "").replace("_", " ").capitalize()
-                        for k, v in checklist.items()
-                        if "_presente" in k and not v
-                    ]
-                    if faltando:
-                        lista_formatada = '\n'.join(f"• {item}" for item in faltando)
-                        mensagem = f"📋 *Itens faltando:*\n{lista_formatada}"
-                    else:
-                        mensagem = "🎉 Todos os itens já foram conferidos!"
-                    asyncio.run(enviar_mensagem_whatsapp(remetente, mensagem))
-
-                return jsonify({"status": "faltantes verificados"}), 200
-
-
-
-            elif isinstance(acao, ReiniciarChecklist):
-                dia = estado_fluxo.get(sessao_id, {}).get("dia", 1)
-                if dia == 1:
-                    ChecklistDatabase.resetar_checklist(sessao_id)
-                else:
-                    ChecklistDatabase.resetar_checklist_dia2(sessao_id)
-                estado_fluxo[sessao_id] = {"dia": dia, "indice": 0}
-                primeiro_item = (FLUXO_DIA1 if dia == 1 else FLUXO_DIA2)[0].replace("_", " ")
-                asyncio.run(enviar_mensagem_whatsapp(remetente, f"♻️ Checklist do *Dia {dia}* reiniciado. Envie a imagem de: *{primeiro_item}*"))
-                return jsonify({"status": "checklist reiniciado"}), 200
 
-            else:
-                asyncio.run(enviar_mensagem_whatsapp(remetente, "🤖 Não entendi. Tente algo como 'já conferi a lista de presença' ou 'o que falta?'"))
-                return jsonify({"status": "mensagem irreconhecida"}), 200
+@app.route("/ocr/estatisticas", methods=["GET"])
+def estatisticas_ocr():
+    return jsonify(verificador_ocr.estatisticas()), 200
 
-        if "imageMessage" in mensagem:
-            image_data = mensagem["imageMessage"]
-            file_url = image_data.get("url")
-            caption = image_data.get("caption", "documento_nao_identificado").lower().replace(" ", "_")
 
-            if not file_url:
-                return jsonify({"erro": "imagem sem URL"}), 400
+@app.route("/fotos/<hash_foto>", methods=["GET"])
+def ver_foto(hash_foto):
+    """
+    Entrega a foto em streaming, direto do armazenamento (sem passar pelo banco)
+    """
+    if not hash_valido(hash_foto) or not armazem_fotos.existe(hash_foto):
+        return jsonify({"erro": "foto não encontrada"}), 404
 
-            estado = estado_fluxo.get(sessao_id)
-            if not estado:
-                asyncio.run(enviar_mensagem_whatsapp(remetente, "⚠️ Envie 'iniciar' para começar o checklist."))
-                return jsonify({"status": "sem checklist ativo"}), 200
+    with armazem_fotos.abrir(hash_foto) as arquivo:
+        mime_type = detectar_mime(arquivo.read(16)) or "application/octet-stream"
 
-            fluxo = FLUXO_DIA1 if estado["dia"] == 1 else FLUXO_DIA2
-            esperado = fluxo[estado["indice"]]
+    return Response(
+        armazem_fotos.ler_em_blocos(hash_foto),
+        mimetype=mime_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
 
-            if caption != esperado:
-                asyncio.run(enviar_mensagem_whatsapp(
-                    remetente,
-                    f"⚠️ Esperado: *{esperado.replace('_', ' ')}*. Corrija a legenda da foto antes de reenviar."
-                ))
-                return jsonify({"status": "item inesperado"}), 200
 
-            try:
-                resposta = requests.get(file_url)
-                if resposta.status_code != 200:
-                    raise Exception(f"Erro HTTP {resposta.status_code}")
-
-                # --- NOVO TRECHO: DETECTAR O TIPO MIME DA IMAGEM ---
-                content_type = resposta.headers.get('Content-Type')
-                if not content_type or not content_type.startswith("image/"):
-                    # Fallback para JPEG se não for uma imagem ou tipo desconhecido
-                    # Ou você pode optar por rejeitar a imagem
-                    mime_type = "image/jpeg"
-                    print(f"⚠️ Aviso: Content-Type desconhecido ou não-imagem ({content_type}). Assumindo image/jpeg.")
-                else:
-                    mime_type = content_type
-                # --- FIM DO NOVO TRECHO ---
+@app.route("/fotos/duplicadas", methods=["GET"])
+def fotos_duplicadas():
+    """
+    Fotos aceitas apesar de parecidas com outra da sessão ou do local (?dia=1&local_aplicacao=...)
+    """
+    return jsonify(detector_duplicatas.listar_sinalizadas(
+        request.args.get("dia", definicao_checklist.primeiro_dia, type=int), request.args.get("local_aplicacao"),
+    )), 200
 
-                foto_base64 = base64.b64encode(resposta.content).decode("utf-8")
-                # Use o mime_type detectado
-                data_uri = f"data:{mime_type};base64,{foto_base64}"
 
-                if estado["dia"] == 1:
-                    ChecklistDatabase.atualizar_item_dia1(sessao_id, caption, presente=True, foto=data_uri)
-                else:
-                    ChecklistDatabase.atualizar_item_dia2(sessao_id, caption, presente=True, foto=data_uri)
+@app.route("/fotos/<hash_foto>/miniatura", methods=["GET"])
+def ver_miniatura(hash_foto):
+    """
+    Entrega a miniatura da foto (ou a própria foto, se ainda não foi processada)
+    """
+    if not hash_valido(hash_foto):
+        return jsonify({"erro": "foto não encontrada"}), 404
+    miniatura = ler_ref(processador_imagens.buscar_derivadas(hash_foto).get("miniatura"))
+    return ver_foto(miniatura.hash if miniatura else hash_foto)
 
-                # Avança para o próximo item
-                estado["indice"] += 1
 
-                if estado["indice"] < len(fluxo):
-                    proximo = fluxo[estado["indice"]].replace("_", " ")
-                    asyncio.run(enviar_mensagem_whatsapp(remetente, f"📸 Agora envie: *{proximo}*"))
+@app.route("/checklists/provisionar", methods=["POST"])
+def provisionar_checklists():
+    """
+    Cria em massa os checklists de um roster (JSON ou CSV no corpo da requisição).
+    Idempotente: reenviar o mesmo roster apenas atualiza aplicador e local
+    """
+    try:
+        if request.mimetype in ("text/csv", "text/plain"):
+            linhas = ler_csv(request.get_data(as_text=True))
+        else:
+            linhas = ler_json(request.get_data(as_text=True))
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    resultado = ChecklistDatabase.provisionar(linhas)
+    return jsonify({"linhas": len(linhas), **resultado}), 200
+
+
+PAINEL_HTML = """<!doctype html>
+<html lang="pt-br"><head><meta charset="utf-8"><title>Painel Checklist CEBRASPE</title>
+<meta http-equiv="refresh" content="30">
+<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:1.5em}
+td,th{border:1px solid #ccc;padding:4px 8px;text-align:left}</style></head><body>
+<h1>📊 Painel Checklist CEBRASPE</h1><p>Atualizado em {{ painel.gerado_em }} (UTC)</p>
+{% for dia, resumo in painel.dias.items() %}
+<h2>Dia {{ dia }}: {{ resumo.sessoes_concluidas }}/{{ resumo.sessoes }} concluídos ({{ (resumo.progresso * 100)|round(1) }}% dos itens)</h2>
+<p>Tempo até a conclusão (min): p50 {{ resumo.tempo_conclusao_minutos.p50 }},
+p90 {{ resumo.tempo_conclusao_minutos.p90 }}, p99 {{ resumo.tempo_conclusao_minutos.p99 }}</p>
+<table><tr><th>Local</th><th>Sessões</th><th>Concluídas</th><th>Progresso</th></tr>
+{% for local in resumo.locais %}<tr><td>{{ local.local_aplicacao or "(sem local)" }}</td><td>{{ local.sessoes }}</td>
+<td>{{ local.sessoes_concluidas }}</td><td>{{ (local.progresso * 100)|round(1) }}%</td></tr>{% endfor %}</table>
+<table><tr><th>Item</th><th>Conferidos</th><th>%</th></tr>
+{% for item in resumo.itens %}<tr><td>{{ item.rotulo }}</td><td>{{ item.conferidos }}</td>
+<td>{{ (item.percentual * 100)|round(1) }}%</td></tr>{% endfor %}</table>
+<h3>⏸️ Sessões paradas há mais de {{ painel.parada_minutos }} min: {{ resumo.sessoes_paradas }}</h3>
+<table><tr><th>Sessão</th><th>Local</th><th>Itens conferidos</th><th>Última atividade</th></tr>
+{% for sessao in resumo.paradas %}<tr><td>{{ sessao.sessao_id }}</td><td>{{ sessao.local_aplicacao or "" }}</td>
+<td>{{ sessao.itens_conferidos }}</td><td>{{ sessao.ultima_atividade }}</td></tr>{% endfor %}</table>
+{% else %}<p>Nenhum checklist registrado.</p>{% endfor %}
+</body></html>"""
+
+_painel_cache = {"gerado": 0.0, "dados": None}
+_painel_lock = threading.Lock()
+
+
+def obter_painel() -> dict:
+    """
+    Painel dos agregados, reaproveitado por PAINEL_CACHE_SEGUNDOS (uma consulta por janela)
+    """
+    with _painel_lock:
+        if _painel_cache["dados"] is None or time.monotonic() - _painel_cache["gerado"] > PAINEL_CACHE_SEGUNDOS:
+            _painel_cache["dados"] = ChecklistDatabase.buscar_painel()
+            _painel_cache["gerado"] = time.monotonic()
+        return _painel_cache["dados"]
+
+
+@app.route("/painel", methods=["GET"])
+def painel():
+    """
+    Progresso dos checklists por local e por item, sessões paradas e tempo até a conclusão.
+    JSON por padrão; ?formato=html para a página
+    """
+    dados = obter_painel()
+    if request.args.get("formato") == "html":
+        return render_template_string(PAINEL_HTML, painel=dados)
+    return jsonify(dados), 200
+
+
+@app.route("/exportacoes/sessoes/<sessao_id>/<int:dia>.zip", methods=["GET"])
+def exportar_sessao(sessao_id, dia):
+    """
+    Pacote de evidências da sessão: fotos originais, relatório HTML e manifesto (ZIP).
+    Reaproveitado do cache enquanto o checklist não muda
+    """
+    if dia not in definicao_checklist.dias:
+        return jsonify({"erro": "dia inexistente"}), 404
+    caminho = exportador_evidencias.exportar_sessao(sessao_id, dia)
+    if caminho is None:
+        return jsonify({"erro": "checklist não encontrado"}), 404
+    return send_file(caminho, mimetype="application/zip", as_attachment=True,
+                     download_name=f"checklist_{sessao_id.split('@')[0]}_dia{dia}.zip")
+
+
+@app.route("/exportacoes/locais/<int:dia>.zip", methods=["GET"])
+def exportar_local(dia):
+    """
+    Pacote de evidências de todas as sessões de um local (?local_aplicacao=...).
+    Gerado em segundo plano: 202 enquanto o pacote é montado, o ZIP quando estiver pronto
+    """
+    if dia not in definicao_checklist.dias:
+        return jsonify({"erro": "dia inexistente"}), 404
+    estado = exportador_evidencias.solicitar_local(request.args.get("local_aplicacao"), dia)
+    if estado["status"] == "pronto":
+        return send_file(estado["arquivo"], mimetype="application/zip", as_attachment=True,
+                         download_name=f"checklist_local_dia{dia}.zip")
+    if estado["status"] == "vazio":
+        return jsonify({"erro": "nenhum checklist no local"}), 404
+    if estado["status"] == "erro":
+        return jsonify(estado), 500
+    return jsonify(estado), 202, {"Retry-After": "5"}
+
+
+@app.route("/exportacoes/estatisticas", methods=["GET"])
+def estatisticas_exportacoes():
+    return jsonify(exportador_evidencias.estatisticas()), 200
+
+
+@app.route("/eventos", methods=["GET"])
+def eventos():
+    """
+    Server-Sent Events com as alterações dos checklists.
+    Filtros opcionais: ?sessao_id=...&local_aplicacao=...&dia=1. Retoma a partir do Last-Event-ID.
+
+    Cada cliente ocioso custa só um buffer no barramento: com um servidor cooperativo
+    (gunicorn -k gevent) ou pela entrada ASGI, não ocupa uma thread por conexão
+    """
+    filtro = {
+        "sessao_id": request.args.get("sessao_id"),
+        "local_aplicacao": request.args.get("local_aplicacao"),
+        "dia": request.args.get("dia", type=int),
+    }
+    ultimo_id = request.headers.get("Last-Event-ID") or request.args.get("desde")
+    assinatura = barramento_eventos.assinar(
+        filtro, desde=int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+    )
+    if assinatura is None:
+        return jsonify({"erro": "limite de assinantes atingido"}), 503
+
+    def transmitir():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                pendentes = assinatura.receber(EVENTOS_HEARTBEAT)
+                if not pendentes:
+                    yield ": ping\n\n"
+                for evento in pendentes:
+                    yield formatar_sse(evento)
+        finally:
+            barramento_eventos.cancelar(assinatura)
+
+    return Response(
+        transmitir(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/eventos/estatisticas", methods=["GET"])
+def estatisticas_eventos():
+    return jsonify(barramento_eventos.estatisticas()), 200
+
+
+# === PROCESSAMENTO DOS EVENTOS (executado pelos workers da fila) ===
+
+# Valor padrão de `acao`: a intenção é resolvida durante o processamento
+RESOLVER = object()
+
+
+def dia_atual(sessao_id: str) -> int:
+    return (estado_fluxo.obter(sessao_id) or {}).get("dia", 1)
+
+
+def intencao_pendente(dados: dict) -> Optional[Tuple[str, int]]:
+    """
+    (texto, dia) quando o evento é um texto que passará pela interpretação; None caso contrário.
+    Permite à entrada ASGI resolver a intenção (LLM assíncrono) antes do processamento
+    """
+    mensagem = dados["data"]["message"]
+    if "conversation" not in mensagem:
+        return None
+    texto = mensagem["conversation"].strip().lower()
+    if re.search(r"\biniciar\b", texto):
+        return None
+    return texto, dia_atual(dados["data"]["key"]["remoteJid"])
+
+
+def processar_evento(dados: dict, acao=RESOLVER) -> dict:
+    """
+    Processa um evento messages.upsert já validado.
+    Exceções fazem o evento voltar para a fila e ser reprocessado com backoff.
+    """
+    mensagem = dados["data"]["message"]
+    tipo = "texto" if "conversation" in mensagem else "imagem" if "imageMessage" in mensagem else "outro"
+    token = definir_rastreio(dados)
+    try:
+        with medir("evento", tipo=tipo):
+            return _processar_mensagem(dados, acao)
+    finally:
+        rastreio.reset(token)
+
+
+def _processar_mensagem(dados: dict, acao) -> dict:
+    mensagem = dados["data"]["message"]
+    remetente = dados["data"]["key"]["remoteJid"]
+    sessao_id = remetente
+
+    if "conversation" in mensagem:
+        texto = mensagem["conversation"].strip().lower()
+        logger.info("💬 Mensagem recebida", extra={"remetente": remetente, "texto": texto})
+
+        # 🌞 Detecta início de checklist ("reiniciar" segue para a interpretação)
+        if re.search(r"\biniciar\b", texto):
+            numero = re.search(r"\bdia\s*(\d+)", texto)
+            dia = int(numero.group(1)) if numero else definicao_checklist.primeiro_dia
+            checklist = definicao_checklist.dias.get(dia)
+            if checklist is None:
+                dias = ", ".join(str(d) for d in definicao_checklist.dias)
+                enviar_mensagem(remetente, f"⚠️ O checklist não tem o *Dia {dia}*. Dias disponíveis: {dias}.")
+                return {"status": "dia inexistente"}
+            with medir("banco", tipo="criar_checklist"):
+                if not ChecklistDatabase.existe_checklist(sessao_id, dia=dia):
+                    ChecklistDatabase.criar_checklist(sessao_id, dia)
+            estado_fluxo.definir(sessao_id, dia, 0)
+            primeiro_item = checklist.rotulos[checklist.fluxo[0]]
+            enviar_mensagem(remetente, f"🗓️ Checklist do *Dia {dia}* iniciado. Envie a imagem de: *{primeiro_item}*")
+            return {"status": f"checklist dia {dia} iniciado"}
+
+        # 🤖 Interpretação (regras locais, com fallback para o LLM)
+        dia = dia_atual(sessao_id)
+        checklist = definicao_checklist.dia(dia)
+        if acao is RESOLVER:
+            acao = resolver_intencao(texto, dia)
+
+        if isinstance(acao, MarcarConferido):
+            # Uma única transação: cria o checklist se preciso e marca todos os itens
+            # O motor local já devolve as chaves; os nomes vindos do LLM passam pelo índice de aliases
+            itens = [item for item in map(checklist.resolver, acao.itens) if item]
+            with medir("banco", tipo="marcar_varios"):
+                marcados = ChecklistDatabase.marcar_varios(sessao_id, dia, itens, criar=True)
+            if not marcados:
+                enviar_mensagem(remetente, f"🤖 Não encontrei esses itens no checklist do *Dia {dia}*.")
+                return {"status": "itens desconhecidos"}
+            enviar_mensagem(remetente, f"✅ Itens conferidos: {', '.join(checklist.rotulos[item] for item in marcados)}")
+            return {"status": "conferido"}
+
+        elif isinstance(acao, VerificarFaltantes):
+            # Lê só a presença dos itens: nunca carrega as fotos
+            presencas = ChecklistDatabase.buscar_presencas(sessao_id, dia=dia)
+
+            if presencas is None:
+                enviar_mensagem(
+                    remetente,
+                    "⚠️ Checklist ainda não iniciado. Envie 'iniciar' para começar."
+                )
+            else:
+                faltando = [
+                    checklist.rotulo(item)
+                    for item, presente in presencas.items()
+                    if not presente and item not in checklist.opcionais
+                ]
+                if faltando:
+                    lista_formatada = '\n'.join(f"• {item}" for item in faltando)
+                    mensagem = f"📋 *Itens faltando:*\n{lista_formatada}"
                 else:
-                    asyncio.run(enviar_mensagem_whatsapp(remetente, "🎉 Checklist concluído com sucesso!"))
-                    del estado_fluxo[sessao_id]
+                    mensagem = "🎉 Todos os itens já foram conferidos!"
+                enviar_mensagem(remetente, mensagem)
 
-                return jsonify({"status": "imagem processada"}), 200
+            return {"status": "faltantes verificados"}
 
-            except Exception as e:
-                print(f"❌ Erro ao processar imagem: {e}")
-                asyncio.run(enviar_mensagem_whatsapp(remetente, f"❌ Erro ao processar a imagem. Tente novamente.\n\nErro: {e}"))
-                return jsonify({"erro": str(e)}), 500
 
-        return jsonify({"status": "tipo de mensagem não tratado"}), 200
+
+        elif isinstance(acao, ReiniciarChecklist):
+            with medir("banco", tipo="resetar"):
+                # O dia 1 mantém o status ao reiniciar; os demais dias são reabertos
+                ChecklistDatabase.resetar_checklist(sessao_id, dia, reabrir=dia != 1)
+            estado_fluxo.definir(sessao_id, dia, 0)
+            primeiro_item = checklist.rotulos[checklist.fluxo[0]]
+            enviar_mensagem(remetente, f"♻️ Checklist do *Dia {dia}* reiniciado. Envie a imagem de: *{primeiro_item}*")
+            return {"status": "checklist reiniciado"}
+
+        else:
+            enviar_mensagem(remetente, "🤖 Não entendi. Tente algo como 'já conferi a lista de presença' ou 'o que falta?'")
+            return {"status": "mensagem irreconhecida"}
+
+    if "imageMessage" in mensagem:
+        image_data = mensagem["imageMessage"]
+        file_url = image_data.get("url")
+        legenda = image_data.get("caption") or ""
+
+        if not file_url:
+            return {"erro": "imagem sem URL"}
+
+        estado = estado_fluxo.obter(sessao_id)
+        if not estado:
+            enviar_mensagem(remetente, "⚠️ Envie 'iniciar' para começar o checklist.")
+            return {"status": "sem checklist ativo"}
+
+        checklist = definicao_checklist.dia(estado["dia"])
+        fluxo = checklist.fluxo
+        esperado = fluxo[estado["indice"]]
+
+        # A legenda pode ser a chave, o rótulo ou um alias do item
+        if checklist.resolver(legenda) != esperado:
+            enviar_mensagem(
+                remetente,
+                f"⚠️ Esperado: *{checklist.rotulos[esperado]}*. Corrija a legenda da foto antes de reenviar."
+            )
+            return {"status": "item inesperado"}
+
+        # Download em streaming direto para o armazenamento; o banco guarda só a referência
+        try:
+            with medir("download", tipo="imagem"):
+                foto_ref = str(baixador_midia.baixar(file_url))
+        except ErroMidia as e:
+            if e.temporario:
+                raise
+            enviar_mensagem(remetente, f"⚠️ Não foi possível usar esta imagem: {e}. Envie outra foto de *{checklist.rotulos[esperado]}*.")
+            return {"status": "imagem recusada"}
+
+        # Foto repetida de outro item ou de outro aplicador do local (hash perceptual no pool de processos)
+        with medir("duplicatas", tipo="imagem"):
+            parecida = detector_duplicatas.verificar(sessao_id, estado["dia"], {esperado: foto_ref}).get(esperado)
+        if parecida is not None and detector_duplicatas.rejeita:
+            enviar_mensagem(
+                remetente,
+                f"⚠️ Esta foto é {descrever_parecida(parecida, checklist)}. Envie a foto de *{checklist.rotulos[esperado]}*."
+            )
+            return {"status": "foto repetida"}
+
+        with medir("banco", tipo="atualizar_item"):
+            ChecklistDatabase.atualizar_item(sessao_id, estado["dia"], esperado, presente=True, foto=foto_ref)
+
+        # Redimensiona, recomprime e gera a miniatura em segundo plano (pool de processos)
+        processador_imagens.agendar(sessao_id, estado["dia"], esperado, foto_ref)
+
+        # Avança para o próximo item (compare-and-set: outro worker pode ter alterado o estado)
+        proximo_indice = estado["indice"] + 1
+
+        if proximo_indice < len(fluxo):
+            if not estado_fluxo.comparar_e_definir(sessao_id, estado["versao"], estado["dia"], proximo_indice):
+                raise ConflitoEstado(f"Estado da sessão {sessao_id} alterado durante o processamento")
+            proximo = checklist.rotulos[fluxo[proximo_indice]]
+            enviar_mensagem(remetente, f"📸 Agora envie: *{proximo}*")
+        else:
+            if not estado_fluxo.remover(sessao_id, estado["versao"]):
+                raise ConflitoEstado(f"Estado da sessão {sessao_id} alterado durante o processamento")
+            with medir("banco", tipo="finalizar"):
+                ChecklistDatabase.finalizar_checklist(sessao_id, estado["dia"])
+            enviar_mensagem(remetente, "🎉 Checklist concluído com sucesso!")
+
+        return {"status": "imagem processada"}
+
+    return {"status": "tipo de mensagem não tratado"}
+
+
+def descrever_parecida(parecida: FotoParecida, checklist) -> str:
+    if parecida.mesma_sessao:
+        return f"igual à foto de *{checklist.rotulo(parecida.item)}*"
+    return "igual a uma foto já enviada por outro aplicador do local"
+
+
+# === ÁLBUNS (fotos seguidas do mesmo remetente, reservadas juntas pela fila) ===
+
+downloads_album = ThreadPoolExecutor(max_workers=ALBUM_DOWNLOADS, thread_name_prefix="download-album")
+
+
+def eh_foto_album(dados: dict) -> bool:
+    return ALBUM_JANELA > 0 and "imageMessage" in dados["data"]["message"]
+
+
+def processar_album(eventos: list) -> dict:
+    """
+    Processa as fotos de um álbum: cada foto vale para o item da legenda (chave, rótulo ou alias)
+    ou, sem legenda, para o próximo item pendente do fluxo. Downloads em paralelo, um único
+    commit e uma única resposta com o progresso
+    """
+    token = definir_rastreio(eventos[0])
+    try:
+        with medir("evento", tipo="album"):
+            return _processar_album(eventos)
+    finally:
+        rastreio.reset(token)
+
+
+def _processar_album(eventos: list) -> dict:
+    remetente = eventos[0]["data"]["key"]["remoteJid"]
+    sessao_id = remetente
+    logger.info("🖼️ Álbum recebido", extra={"remetente": remetente, "fotos": len(eventos)})
+
+    estado = estado_fluxo.obter(sessao_id)
+    if not estado:
+        enviar_mensagem(remetente, "⚠️ Envie 'iniciar' para começar o checklist.")
+        return {"status": "sem checklist ativo"}
+    dia = estado["dia"]
+    checklist = definicao_checklist.dia(dia)
+    presencas = ChecklistDatabase.buscar_presencas(sessao_id, dia=dia) or {}
+    pendentes = [item for item in checklist.fluxo if not presencas.get(item)]
+
+    # Item de cada foto: primeiro as legendas; as fotos sem legenda ocupam os pendentes que sobrarem
+    fotos, sem_legenda, recusadas = {}, [], []
+    for numero, dados in enumerate(eventos, start=1):
+        imagem = dados["data"]["message"]["imageMessage"]
+        legenda = (imagem.get("caption") or "").strip()
+        if not imagem.get("url"):
+            recusadas.append(f"foto {numero}: sem URL")
+        elif not legenda:
+            sem_legenda.append(imagem["url"])
+        elif (item := checklist.resolver(legenda)) is None:
+            recusadas.append(f"foto {numero}: legenda \"{legenda}\" não reconhecida")
+        else:
+            fotos[item] = imagem["url"]  # a última foto do mesmo item prevalece
+    livres = [item for item in pendentes if item not in fotos]
+    fotos.update(zip(livres, sem_legenda))
+    if len(sem_legenda) > len(livres):
+        recusadas.append(f"{len(sem_legenda) - len(livres)} foto(s) sem legenda e sem itens pendentes")
+
+    # Downloads em paralelo (os limites globais e por host do baixador continuam valendo)
+    referencias = {}
+    with medir("download", tipo="album"):
+        futuros = {item: downloads_album.submit(baixador_midia.baixar, url) for item, url in fotos.items()}
+        for item, futuro in futuros.items():
+            try:
+                referencias[item] = str(futuro.result())
+            except ErroMidia as e:
+                if e.temporario:
+                    raise
+                recusadas.append(f"{checklist.rotulos[item]}: {e}")
+
+    with medir("duplicatas", tipo="album"):
+        # Na ordem do fluxo: entre fotos iguais do álbum, fica a do primeiro item
+        parecidas = detector_duplicatas.verificar(
+            sessao_id, dia, dict(sorted(referencias.items(), key=lambda par: checklist.posicao[par[0]])),
+        )
+    if detector_duplicatas.rejeita:
+        for item, parecida in parecidas.items():
+            del referencias[item]
+            recusadas.append(f"{checklist.rotulos[item]}: {descrever_parecida(parecida, checklist)}")
+
+    if referencias:
+        with medir("banco", tipo="album"):
+            with ChecklistDatabase.unidade(sessao_id, dia) as unidade:
+                unidade.criar()
+                for item, foto_ref in referencias.items():
+                    unidade.atualizar_item(item, presente=True, foto=foto_ref)
+        for item, foto_ref in referencias.items():
+            processador_imagens.agendar(sessao_id, dia, item, foto_ref)
+
+    # Próximo item: o primeiro pendente na ordem do fluxo (compare-and-set, como no envio de uma foto)
+    restantes = [item for item in pendentes if item not in referencias]
+    if referencias and restantes:
+        if not estado_fluxo.comparar_e_definir(sessao_id, estado["versao"], dia, checklist.indice_fluxo[restantes[0]]):
+            raise ConflitoEstado(f"Estado da sessão {sessao_id} alterado durante o processamento")
+    elif not restantes:
+        if not estado_fluxo.remover(sessao_id, estado["versao"]):
+            raise ConflitoEstado(f"Estado da sessão {sessao_id} alterado durante o processamento")
+        with medir("banco", tipo="finalizar"):
+            ChecklistDatabase.finalizar_checklist(sessao_id, dia)
+
+    linhas = []
+    if referencias:
+        registradas = sorted(referencias, key=checklist.posicao.__getitem__)
+        linhas.append(f"📸 {len(registradas)} foto(s) registrada(s): {', '.join(checklist.rotulos[item] for item in registradas)}")
+    if recusadas:
+        linhas.append("⚠️ Não usadas:\n" + "\n".join(f"• {motivo}" for motivo in recusadas))
+    if restantes:
+        linhas.append(f"📋 Faltam {len(restantes)} item(ns). Agora envie: *{checklist.rotulos[restantes[0]]}*")
+    else:
+        linhas.append("🎉 Checklist concluído com sucesso!")
+    enviar_mensagem(remetente, "\n".join(linhas))
+    return {"status": "album processado", "fotos": len(referencias), "recusadas": len(recusadas)}
+
+
+def notificar_falha(dados: dict, erro: str):
+    """
+    Avisa o aplicador quando o evento esgotou as tentativas de processamento
+    """
+    remetente = dados["data"]["key"]["remoteJid"]
+    enviar_mensagem(remetente, f"❌ Erro ao processar sua mensagem. Tente novamente.\n\nErro: {erro}")
+
+
+fila_webhook = FilaWebhook(
+    processar_evento, ao_falhar=notificar_falha, processar_lote=processar_album, agrupavel=eh_foto_album,
+)
+limitador_webhook = LimitadorWebhook(fila_webhook.pendentes)
+
+# Métricas do /metrics além dos histogramas por etapa
+webhook_respostas = registro_metricas.contador(
+    "checklist_webhook_respostas_total", "Eventos recebidos no /webhook por resultado", ("status",)
+)
+registro_metricas.medidor(
+    "checklist_fila_pendentes", "Eventos aguardando ou em processamento na fila", fila_webhook.pendentes
+)
+registro_metricas.medidor(
+    "checklist_eventos_assinantes", "Clientes conectados ao /eventos",
+    lambda: barramento_eventos.estatisticas()["assinantes"],
+)
+
+
+@app.route("/metrics", methods=["GET"])
+def metricas():
+    """
+    Métricas no formato texto do Prometheus (histogramas por etapa, contadores e medidores)
+    """
+    return Response(registro_metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/limites", methods=["GET"])
+def limites():
+    """
+    Limites configurados e estado atual dos token buckets (para ajuste)
+    """
+    return jsonify(limitador_webhook.estado(request.args.get("remetentes", 20, type=int))), 200
+
+
+@app.route("/webhook/estatisticas", methods=["GET"])
+def estatisticas_webhook():
+    return jsonify({
+        "fila_pendentes": fila_webhook.pendentes(),
+        "deduplicacao": deduplicador.metricas(),
+    }), 200
+
+
+def validar_evento(dados: dict) -> Optional[str]:
+    """
+    Valida a estrutura mínima de um evento messages.upsert. Retorna a mensagem de erro ou None
+    """
+    data = dados.get("data")
+    if not isinstance(data, dict):
+        return "campo 'data' ausente"
+    if not isinstance(data.get("message"), dict):
+        return "campo 'data.message' ausente"
+    if not isinstance(data.get("key"), dict) or not data["key"].get("remoteJid"):
+        return "campo 'data.key.remoteJid' ausente"
+    return None
+
+
+def ler_webhook(corpo: bytes) -> Tuple[Optional[dict], Optional[Tuple[dict, int]]]:
+    """
+    Decodifica e valida o corpo do /webhook (compartilhado com a entrada ASGI).
+    Retorna (dados, None) para um evento a processar ou (None, (resposta, status))
+    """
+    with medir("parse"):
+        try:
+            dados = json.loads(corpo)
+        except ValueError:
+            dados = None
+        erro = "JSON inválido" if not isinstance(dados, dict) else None
+        if erro is None and dados.get("event") == "messages.upsert":
+            erro = validar_evento(dados)
+    if erro:
+        webhook_respostas.incrementar(status="invalido")
+        return None, ({"erro": erro}, 400)
+    if dados.get("event") != "messages.upsert":
+        webhook_respostas.incrementar(status="ignorado")
+        return None, ({"status": "ignorado"}, 200)
+    return dados, None
+
+
+def admitir_evento(dados: dict, sincrono: bool = WEBHOOK_SINCRONO) -> Tuple[dict, int, dict]:
+    """
+    Deduplicação, rate limiting e enfileiramento de um evento válido (compartilhado com a entrada ASGI).
+    Com `sincrono` o evento aceito não é enfileirado: retorna {"status": "aceito"} e quem chama o processa
+    """
+    token = definir_rastreio(dados)
+    try:
+        remetente = dados["data"]["key"]["remoteJid"]
+        imagem = "imageMessage" in dados["data"]["message"]
+        logger.debug("📩 Novo webhook recebido", extra={"remetente": remetente, "imagem": imagem})
+
+        # Reentrega do Evolution API: responde sem refazer nenhum trabalho
+        if not deduplicador.registrar(dados):
+            webhook_respostas.incrementar(status="duplicado")
+            return {"status": "duplicado"}, 200, {}
+
+        # Rate limiting por remetente e global, com backpressure pela profundidade da fila
+        decisao = limitador_webhook.avaliar(remetente, imagem)
+        if decisao.avisar:
+            if decisao.aceitar:
+                # No modo álbum as fotos excedentes seguem no mesmo lote: o resumo do álbum basta
+                if not eh_foto_album(dados):
+                    enviar_mensagem(remetente, "⏳ Recebi muitas fotos seguidas. Elas serão processadas em ordem, aguarde.")
+            else:
+                enviar_mensagem(remetente, "⏳ Muitas mensagens seguidas. Aguarde alguns segundos e envie novamente.")
+        if not decisao.aceitar:
+            if decisao.motivo == "fila cheia":
+                # O Evolution API reentrega depois: a reentrega não pode ser tratada como duplicada
+                deduplicador.esquecer(dados)
+                webhook_respostas.incrementar(status="fila_cheia")
+                return {"erro": "fila cheia"}, 503, {"Retry-After": str(decisao.retry_after)}
+            webhook_respostas.incrementar(status="limitado")
+            return {"status": "limitado", "motivo": decisao.motivo}, 200, {}
+
+        if sincrono:
+            return {"status": "aceito"}, 200, {}
+
+        try:
+            # Persiste o evento e responde imediatamente; os workers fazem o resto
+            # Fotos esperam a janela do álbum (se ativa) para serem processadas junto com as seguintes
+            atraso = max(decisao.atraso, ALBUM_JANELA) if imagem else decisao.atraso
+            evento_id = fila_webhook.enfileirar(dados, atraso=atraso)
+        except Exception:
+            # O evento não foi aceito: a próxima reentrega deve ser processada
+            deduplicador.esquecer(dados)
+            raise
+        fila_webhook.iniciar()
+        webhook_respostas.incrementar(status="atrasado" if decisao.atraso else "enfileirado")
+        resposta = {"status": "enfileirado", "evento_id": evento_id}
+        if decisao.atraso:
+            resposta["atraso"] = round(decisao.atraso, 1)
+        return resposta, 200, {}
+    finally:
+        rastreio.reset(token)
+
+
+def processar_sincrono(dados: dict, acao=RESOLVER) -> dict:
+    """
+    Processa um evento admitido com WEBHOOK_SINCRONO, dentro da requisição
+    """
+    try:
+        resultado = processar_evento(dados, acao)
+    except Exception:
+        deduplicador.esquecer(dados)
+        raise
+    webhook_respostas.incrementar(status="processado")
+    return resultado
+
+
+@app.route("/webhook", methods=["POST"])
+def webhook():
+    try:
+        dados, resposta = ler_webhook(request.get_data())
+        if resposta:
+            return jsonify(resposta[0]), resposta[1]
+
+        corpo, status, cabecalhos = admitir_evento(dados)
+        if corpo.get("status") == "aceito":
+            corpo = processar_sincrono(dados)
+        return jsonify(corpo), status, cabecalhos
 
     except Exception as e:
-        print(f"❌ Erro no webhook: {e}")
+        webhook_respostas.incrementar(status="erro")
+        logger.exception("❌ Erro no webhook: %s", e)
         return jsonify({"erro": str(e)}), 500
 
 
-if __name__ == "__main__":
+def iniciar_servicos():
+    """
+    Prepara o banco e inicia os workers da fila na subida do servidor: eventos pendentes
+    ou órfãos de um reinício voltam a ser processados sem esperar um novo webhook
+    """
     init_database()
+    fila_webhook.iniciar()
+
+
+if __name__ == "__main__":
+    # Com a recarga automática, só o processo filho (WERKZEUG_RUN_MAIN) atende as requisições
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar_servicos()
+    else:
+        init_database()
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,269 @@
+# asgi.py
+"""
+Entrada ASGI (Starlette) da aplicação, para rodar com uvicorn (ver servidor.py).
+
+Mesmas rotas e respostas do app.py (Flask), com handlers assíncronos: o banco é acessado
+em threads (asyncio.to_thread), o LLM por llm.ainvoke e o /eventos espera os eventos no
+próprio event loop. Uma chamada lenta não prende o atendimento dos outros aplicadores.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from jinja2 import Environment
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Route
+
+import app
+from database.database import ChecklistDatabase
+from database.provisionar import ler_csv, ler_json
+from services.duplicatas import detector_duplicatas
+from services.eventos import barramento_eventos, formatar_sse
+from services.exportacao import exportador_evidencias
+from services.fotos import armazem_fotos, detectar_mime, hash_valido, ler_ref
+from services.observabilidade import registro_metricas
+from services.ocr import verificador_ocr
+from services.processamento_imagem import processador_imagens
+from services.whatsapp import enviador_whatsapp
+
+painel_html = Environment(autoescape=True).from_string(app.PAINEL_HTML)
+
+
+async def home(request: Request):
+    return HTMLResponse(app.home())
+
+
+async def webhook(request: Request):
+    try:
+        dados, resposta = app.ler_webhook(await request.body())
+        if resposta:
+            return JSONResponse(*resposta)
+
+        corpo, status, cabecalhos = await asyncio.to_thread(app.admitir_evento, dados)
+        if corpo.get("status") == "aceito":
+            corpo = await processar_sincrono(dados)
+        return JSONResponse(corpo, status, cabecalhos)
+
+    except Exception as e:
+        app.webhook_respostas.incrementar(status="erro")
+        app.logger.exception("❌ Erro no webhook: %s", e)
+        return JSONResponse({"erro": str(e)}, 500)
+
+
+async def processar_sincrono(dados: dict) -> dict:
+    """
+    WEBHOOK_SINCRONO: resolve a intenção no event loop (llm.ainvoke) e processa o resto em uma thread
+    """
+    acao = app.RESOLVER
+    try:
+        pendente = await asyncio.to_thread(app.intencao_pendente, dados)
+        if pendente is not None:
+            acao = await app.resolver_intencao_async(*pendente)
+    except Exception:
+        app.deduplicador.esquecer(dados)
+        raise
+    return await asyncio.to_thread(app.processar_sincrono, dados, acao)
+
+
+async def eventos(request: Request):
+    """
+    Server-Sent Events: cada cliente ocioso é só uma tarefa esperando no event loop
+    """
+    dia = request.query_params.get("dia")
+    filtro = {
+        "sessao_id": request.query_params.get("sessao_id"),
+        "local_aplicacao": request.query_params.get("local_aplicacao"),
+        "dia": int(dia) if dia and dia.isdigit() else None,
+    }
+    ultimo_id = request.headers.get("Last-Event-ID") or request.query_params.get("desde")
+    assinatura = barramento_eventos.assinar(
+        filtro, desde=int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None,
+        loop=asyncio.get_running_loop(),
+    )
+    if assinatura is None:
+        return JSONResponse({"erro": "limite de assinantes atingido"}, 503)
+
+    async def transmitir():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                pendentes = await assinatura.receber_async(app.EVENTOS_HEARTBEAT)
+                if not pendentes:
+                    yield ": ping\n\n"
+                for evento in pendentes:
+                    yield formatar_sse(evento)
+        finally:
+            barramento_eventos.cancelar(assinatura)
+
+    return StreamingResponse(
+        transmitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def ver_foto(request: Request):
+    hash_foto = request.path_params["hash_foto"]
+    return await asyncio.to_thread(_resposta_foto, hash_foto)
+
+
+async def ver_miniatura(request: Request):
+    hash_foto = request.path_params["hash_foto"]
+    if not hash_valido(hash_foto):
+        return JSONResponse({"erro": "foto não encontrada"}, 404)
+    derivadas = await asyncio.to_thread(processador_imagens.buscar_derivadas, hash_foto)
+    miniatura = ler_ref(derivadas.get("miniatura"))
+    return await asyncio.to_thread(_resposta_foto, miniatura.hash if miniatura else hash_foto)
+
+
+async def fotos_duplicadas(request: Request):
+    dia = request.query_params.get("dia", "")
+    sinalizadas = await asyncio.to_thread(
+        detector_duplicatas.listar_sinalizadas,
+        int(dia) if dia.isdigit() else app.definicao_checklist.primeiro_dia, request.query_params.get("local_aplicacao"),
+    )
+    return JSONResponse(sinalizadas)
+
+
+def _resposta_foto(hash_foto: str) -> Response:
+    # Os blocos do arquivo são lidos pelo Starlette em threads, sem bloquear o event loop
+    if not hash_valido(hash_foto) or not armazem_fotos.existe(hash_foto):
+        return JSONResponse({"erro": "foto não encontrada"}, 404)
+    with armazem_fotos.abrir(hash_foto) as arquivo:
+        mime_type = detectar_mime(arquivo.read(16)) or "application/octet-stream"
+    return StreamingResponse(
+        armazem_fotos.ler_em_blocos(hash_foto),
+        media_type=mime_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+async def provisionar_checklists(request: Request):
+    corpo = (await request.body()).decode("utf-8")
+    tipo = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        linhas = ler_csv(corpo) if tipo in ("text/csv", "text/plain") else ler_json(corpo)
+    except ValueError as e:
+        return JSONResponse({"erro": str(e)}, 400)
+
+    resultado = await asyncio.to_thread(ChecklistDatabase.provisionar, linhas)
+    return JSONResponse({"linhas": len(linhas), **resultado})
+
+
+async def painel(request: Request):
+    dados = await asyncio.to_thread(app.obter_painel)
+    if request.query_params.get("formato") == "html":
+        return HTMLResponse(painel_html.render(painel=dados))
+    return JSONResponse(dados)
+
+
+async def exportar_sessao(request: Request):
+    sessao_id, dia = request.path_params["sessao_id"], request.path_params["dia"]
+    if dia not in app.definicao_checklist.dias:
+        return JSONResponse({"erro": "dia inexistente"}, 404)
+    # Gerar o ZIP lê o banco e copia as fotos: fora do event loop
+    caminho = await asyncio.to_thread(exportador_evidencias.exportar_sessao, sessao_id, dia)
+    if caminho is None:
+        return JSONResponse({"erro": "checklist não encontrado"}, 404)
+    return FileResponse(caminho, media_type="application/zip",
+                        filename=f"checklist_{sessao_id.split('@')[0]}_dia{dia}.zip")
+
+
+async def exportar_local(request: Request):
+    dia = request.path_params["dia"]
+    if dia not in app.definicao_checklist.dias:
+        return JSONResponse({"erro": "dia inexistente"}, 404)
+    estado = await asyncio.to_thread(
+        exportador_evidencias.solicitar_local, request.query_params.get("local_aplicacao"), dia
+    )
+    if estado["status"] == "pronto":
+        return FileResponse(estado["arquivo"], media_type="application/zip",
+                            filename=f"checklist_local_dia{dia}.zip")
+    if estado["status"] == "vazio":
+        return JSONResponse({"erro": "nenhum checklist no local"}, 404)
+    if estado["status"] == "erro":
+        return JSONResponse(estado, 500)
+    return JSONResponse(estado, 202, {"Retry-After": "5"})
+
+
+async def estatisticas_exportacoes(request: Request):
+    return JSONResponse(exportador_evidencias.estatisticas())
+
+
+async def metricas(request: Request):
+    # Os medidores consultam o banco (profundidade da fila)
+    texto = await asyncio.to_thread(registro_metricas.exportar)
+    return Response(texto, media_type="text/plain; version=0.0.4")
+
+
+async def estatisticas_whatsapp(request: Request):
+    return JSONResponse(enviador_whatsapp.estatisticas())
+
+
+async def metricas_intencoes(request: Request):
+    return JSONResponse({
+        "interpretador_local": app.motor_intencoes.metricas(),
+        "cache_llm": app.cache_interpretacao.metricas(),
+    })
+
+
+async def estatisticas_ocr(request: Request):
+    return JSONResponse(verificador_ocr.estatisticas())
+
+
+async def estatisticas_eventos(request: Request):
+    return JSONResponse(barramento_eventos.estatisticas())
+
+
+async def limites(request: Request):
+    remetentes = request.query_params.get("remetentes", "20")
+    estado = await asyncio.to_thread(
+        app.limitador_webhook.estado, int(remetentes) if remetentes.isdigit() else 20
+    )
+    return JSONResponse(estado)
+
+
+async def estatisticas_webhook(request: Request):
+    pendentes = await asyncio.to_thread(app.fila_webhook.pendentes)
+    return JSONResponse({"fila_pendentes": pendentes, "deduplicacao": app.deduplicador.metricas()})
+
+
+@asynccontextmanager
+async def ciclo_de_vida(aplicacao: Starlette):
+    await asyncio.to_thread(app.iniciar_servicos)
+    yield
+    await asyncio.to_thread(app.fila_webhook.parar)
+    await asyncio.to_thread(enviador_whatsapp.encerrar)
+    await asyncio.to_thread(exportador_evidencias.encerrar)
+
+
+aplicacao = Starlette(
+    routes=[
+        Route("/", home, methods=["GET"]),
+        Route("/webhook", webhook, methods=["POST"]),
+        Route("/eventos", eventos, methods=["GET"]),
+        Route("/eventos/estatisticas", estatisticas_eventos, methods=["GET"]),
+        Route("/fotos/duplicadas", fotos_duplicadas, methods=["GET"]),
+        Route("/fotos/{hash_foto}", ver_foto, methods=["GET"]),
+        Route("/fotos/{hash_foto}/miniatura", ver_miniatura, methods=["GET"]),
+        Route("/checklists/provisionar", provisionar_checklists, methods=["POST"]),
+        Route("/painel", painel, methods=["GET"]),
+        Route("/exportacoes/sessoes/{sessao_id}/{dia:int}.zip", exportar_sessao, methods=["GET"]),
+        Route("/exportacoes/locais/{dia:int}.zip", exportar_local, methods=["GET"]),
+        Route("/exportacoes/estatisticas", estatisticas_exportacoes, methods=["GET"]),
+        Route("/metrics", metricas, methods=["GET"]),
+        Route("/whatsapp/estatisticas", estatisticas_whatsapp, methods=["GET"]),
+        Route("/intencoes/metricas", metricas_intencoes, methods=["GET"]),
+        Route("/ocr/estatisticas", estatisticas_ocr, methods=["GET"]),
+        Route("/limites", limites, methods=["GET"]),
+        Route("/webhook/estatisticas", estatisticas_webhook, methods=["GET"]),
+    ],
+    lifespan=ciclo_de_vida,
+)
@@ -0,0 +1,83 @@
+"""
+Busca de fotos repetidas: preenche o índice de hashes perceptuais com N fotos (hashes
+aleatórios espalhados por locais e sessões) e mede a latência das buscas, metade por
+fotos quase iguais a uma já registrada (até FOTO_DUPLICADA_DISTANCIA bits) e metade por fotos novas.
+
+Uso (banco temporário):
+    python -m benchmark.busca_duplicatas [--fotos 300000] [--buscas 2000] [--por-local 600]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Latência da busca de fotos repetidas")
+    parser.add_argument("--fotos", type=int, default=300000, help="fotos já registradas")
+    parser.add_argument("--buscas", type=int, default=2000)
+    parser.add_argument("--por-local", type=int, default=600, help="fotos por local de aplicação")
+    parser.add_argument("--itens", type=int, default=18, help="fotos por sessão")
+    return parser.parse_args()
+
+
+def main():
+    args = _argumentos()
+    pasta = tempfile.mkdtemp(prefix="busca_duplicatas_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(pasta, 'duplicatas.db')}"
+    os.environ.setdefault("LOG_NIVEL", "WARNING")
+
+    # Importado depois de definir DATABASE_URL: o engine é criado na importação
+    from sqlalchemy import insert, text
+
+    from database import FotoAssinatura, get_db, init_database
+    from services.duplicatas import bandas, detector_duplicatas
+
+    init_database()
+    aleatorio = random.Random(42)
+    fotos = []
+    for numero in range(args.fotos):
+        valor = aleatorio.getrandbits(64)
+        fotos.append({
+            "sessao_id": f"s{numero // args.itens:06d}", "dia": 1, "item_key": f"item{numero % args.itens}",
+            "local_aplicacao": f"local{numero // args.por_local:04d}", "foto_hash": f"{numero:064x}",
+            "dhash": f"{valor:016x}", **dict(zip(("banda0", "banda1", "banda2", "banda3"), bandas(valor))),
+        })
+    inicio = time.perf_counter()
+    with get_db() as db:
+        for posicao in range(0, len(fotos), 10000):
+            db.execute(insert(FotoAssinatura.__table__), fotos[posicao:posicao + 10000])
+    print(f"📥 {args.fotos} fotos registradas em {time.perf_counter() - inicio:.1f}s")
+
+    latencias, encontradas, falsos = [], 0, 0
+    with get_db() as db:
+        db.execute(text("ANALYZE"))
+        for numero in range(args.buscas):
+            original = aleatorio.choice(fotos)
+            quase_igual = numero % 2 == 0
+            valor = int(original["dhash"], 16)
+            if quase_igual:
+                for bit in aleatorio.sample(range(64), aleatorio.randint(0, detector_duplicatas.distancia_maxima)):
+                    valor ^= 1 << bit
+            else:
+                valor = aleatorio.getrandbits(64)
+            # Outro item de uma sessão nova no mesmo local
+            inicio = time.perf_counter()
+            parecida = detector_duplicatas.buscar(db, "nova", 1, original["local_aplicacao"], "item0", valor)
+            latencias.append(time.perf_counter() - inicio)
+            if quase_igual:
+                encontradas += parecida is not None
+            else:
+                falsos += parecida is not None
+
+    latencias.sort()
+    metade = args.buscas // 2
+    print(f"🔎 {args.buscas} buscas: p50 {statistics.median(latencias) * 1000:.3f} ms, "
+          f"p99 {latencias[int(len(latencias) * 0.99) - 1] * 1000:.3f} ms")
+    print(f"   quase iguais encontradas: {encontradas}/{args.buscas - metade}, fotos novas sinalizadas: {falsos}/{metade}")
+
+
+if __name__ == "__main__":
+    main()
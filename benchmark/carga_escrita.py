@@ -0,0 +1,82 @@
+"""
+Teste de carga de escrita: N sessões simultâneas preenchendo o checklist do dia 1,
+como os workers do webhook fariam. Mede a vazão de escrita e os erros de lock.
+
+Uso (o banco padrão é um arquivo temporário, para não tocar no banco da aplicação):
+    python -m benchmark.carga_escrita [--sessoes 50] [--threads 16] [--url sqlite:///./carga.db]
+
+Compare perfis trocando as variáveis de ambiente, por exemplo:
+    SQLITE_BEGIN=DEFERRED SQLITE_SYNCHRONOUS=FULL python -m benchmark.carga_escrita
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Carga de escrita concorrente no banco do checklist")
+    parser.add_argument("--sessoes", type=int, default=50, help="sessões simultâneas")
+    parser.add_argument("--threads", type=int, default=16, help="workers escrevendo ao mesmo tempo")
+    parser.add_argument("--url", default=None, help="DATABASE_URL (padrão: SQLite temporário)")
+    return parser.parse_args()
+
+
+def main():
+    args = _argumentos()
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        pasta = tempfile.mkdtemp(prefix="carga_escrita_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(pasta, 'carga.db')}"
+
+    # Importado depois de definir DATABASE_URL: o engine é criado na importação
+    from database import ChecklistDatabase, init_database
+    from database.database import DATABASE_URL, engine
+    from services.definicoes import definicao_checklist
+
+    init_database()
+    itens = definicao_checklist.dia(1).chaves
+    latencias = []
+    erros = []
+    lock = threading.Lock()
+
+    def preencher(numero: int):
+        sessao_id = f"carga{numero:05d}@s.whatsapp.net"
+        try:
+            ChecklistDatabase.criar_checklist_dia1(sessao_id)
+            for item in itens:
+                inicio = time.perf_counter()
+                ChecklistDatabase.atualizar_item_dia1(sessao_id, item, True, f"sha256:{'0' * 64};1;image/jpeg")
+                with lock:
+                    latencias.append(time.perf_counter() - inicio)
+            ChecklistDatabase.finalizar_checklist_dia1(sessao_id)
+        except Exception as e:
+            with lock:
+                erros.append(f"{sessao_id}: {e}")
+
+    print(f"🏋️ {args.sessoes} sessões, {args.threads} threads, {len(itens)} itens cada")
+    print(f"   banco: {DATABASE_URL} ({engine.dialect.name})")
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(preencher, range(args.sessoes)))
+    duracao = time.perf_counter() - inicio
+
+    escritas = len(latencias)
+    print(f"✅ {escritas} escritas de item em {duracao:.2f}s ({escritas / duracao:.0f} escritas/s)")
+    if latencias:
+        ordenadas = sorted(latencias)
+        p95 = ordenadas[int(len(ordenadas) * 0.95) - 1] if len(ordenadas) >= 20 else ordenadas[-1]
+        print(f"   latência: média {statistics.mean(latencias) * 1000:.1f} ms, "
+              f"p95 {p95 * 1000:.1f} ms, máx {ordenadas[-1] * 1000:.1f} ms")
+    if erros:
+        print(f"❌ {len(erros)} sessão(ões) com erro, ex.: {erros[0]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
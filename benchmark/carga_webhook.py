@@ -0,0 +1,313 @@
+"""
+Teste de carga do webhook com tráfego de manhã de prova: cada sessão envia "iniciar", as
+fotos do dia 1 na ordem, perguntas ("o que falta?"), confirmações por texto e mensagens
+livres que vão para o LLM; parte dos eventos é reentregue, como o Evolution API faz.
+
+A aplicação roda de verdade (servidor HTTP, fila e workers), com banco temporário e os
+serviços externos simulados (benchmark/servidores_falsos.py). O relatório traz vazão,
+latência do /webhook e de ponta a ponta (p50/p95/p99), duração por etapa (/metrics),
+crescimento do banco e das fotos e memória.
+
+Uso:
+    python -m benchmark.carga_webhook [--sessoes 50] [--concorrencia 16] [--latencia-llm 0.5]
+    python -m benchmark.carga_webhook --salvar-baseline        # grava benchmark/baseline.json
+    python -m benchmark.carga_webhook --comparar               # sai com código 1 se houver regressão
+
+Os limites por remetente e da fila ficam desligados (a carga é sintética); --com-limites os
+mantém, e os eventos recusados com 503 são reenviados depois do Retry-After.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import servidores_falsos
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Métricas comparadas com o baseline: (chave, maior_melhor). O p99 do /webhook fica de fora:
+# com alguns milhares de amostras ele varia demais entre execuções na mesma máquina
+METRICAS_COMPARADAS = (
+    ("vazao_eventos_s", True),
+    ("webhook_ms.p95", False),
+    ("ponta_a_ponta_ms.p50", False),
+    ("ponta_a_ponta_ms.p95", False),
+    ("banco_kb_por_sessao", False),
+    ("memoria_pico_mb", False),
+)
+
+PERGUNTAS = ["o que falta?", "quais itens faltam", "falta alguma coisa?"]
+CONFIRMACOES = ["já conferi canetas e alicate", "conferi a fita adesiva", "pinceis ok"]
+LIVRES = [
+    "bom dia, a sala {n} já está aberta, posso seguir?",
+    "o coordenador da sala {n} pediu para esperar, continuo depois",
+    "chegaram os fiscais da sala {n}",
+]
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Carga do webhook com serviços externos simulados")
+    parser.add_argument("--sessoes", type=int, default=50, help="aplicadores enviando ao mesmo tempo")
+    parser.add_argument("--concorrencia", type=int, default=16, help="conexões simultâneas ao /webhook")
+    parser.add_argument("--reentregas", type=float, default=0.1, help="fração de eventos reentregues")
+    parser.add_argument("--textos", type=int, default=4, help="mensagens de texto por sessão, além de 'iniciar'")
+    parser.add_argument("--latencia-llm", type=float, default=0.5, help="segundos por chamada ao LLM")
+    parser.add_argument("--latencia-envio", type=float, default=0.02, help="segundos por sendText")
+    parser.add_argument("--latencia-midia", type=float, default=0.05, help="segundos por download")
+    parser.add_argument("--lado-imagem", type=int, default=1200, help="px do maior lado das fotos simuladas")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--porta", type=int, default=18300, help="porta dos serviços simulados (e as duas seguintes)")
+    parser.add_argument("--porta-app", type=int, default=18310)
+    parser.add_argument("--com-limites", action="store_true", help="mantém o rate limiting do webhook")
+    parser.add_argument("--album-janela", type=float, default=0, help="ALBUM_JANELA (segundos; 0 = fotos uma a uma)")
+    parser.add_argument("--prazo", type=float, default=600, help="segundos esperando a fila esvaziar")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--comparar", action="store_true", help="compara com o baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="variação aceita antes de acusar regressão")
+    return parser.parse_args()
+
+
+def _percentis(valores: list) -> dict:
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordenados = sorted(valores)
+
+    def percentil(p):
+        return round(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))], 1)
+
+    return {"p50": percentil(0.50), "p95": percentil(0.95), "p99": percentil(0.99), "max": round(ordenados[-1], 1)}
+
+
+def _tamanho(caminhos) -> int:
+    total = 0
+    for caminho in caminhos:
+        if os.path.isfile(caminho):
+            total += os.path.getsize(caminho)
+        elif os.path.isdir(caminho):
+            for raiz, _, arquivos in os.walk(caminho):
+                total += sum(os.path.getsize(os.path.join(raiz, nome)) for nome in arquivos)
+    return total
+
+
+def _memoria_atual_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for linha in status:
+                if linha.startswith("VmRSS:"):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+
+
+def _gerar_trafego(args, fluxo: list) -> list:
+    """
+    Uma lista de eventos por sessão, na ordem em que o aplicador os envia
+    """
+    aleatorio = random.Random(args.semente)
+    sessoes = []
+    for numero in range(args.sessoes):
+        remote_jid = f"55619{numero:08d}@s.whatsapp.net"
+        mensagens = [{"imageMessage": {
+            "url": servidores_falsos.url_midia(args.porta, f"{numero}/{item}.jpg"), "caption": item,
+        }} for item in fluxo]
+        for _ in range(args.textos):
+            texto = aleatorio.choice([
+                aleatorio.choice(PERGUNTAS),
+                aleatorio.choice(CONFIRMACOES),
+                aleatorio.choice(LIVRES).format(n=aleatorio.randint(1, 400)),
+            ])
+            mensagens.insert(aleatorio.randint(0, len(mensagens)), {"conversation": texto})
+        mensagens.insert(0, {"conversation": "iniciar"})
+
+        eventos = []
+        for indice, mensagem in enumerate(mensagens):
+            evento = {
+                "event": "messages.upsert",
+                "data": {"key": {"remoteJid": remote_jid, "id": f"carga-{numero}-{indice}"}, "message": mensagem},
+            }
+            eventos.append(evento)
+            if aleatorio.random() < args.reentregas:
+                eventos.append(evento)
+        sessoes.append(eventos)
+    return sessoes
+
+
+def _obter(relatorio: dict, chave: str):
+    valor = relatorio
+    for parte in chave.split("."):
+        valor = (valor or {}).get(parte)
+    return valor
+
+
+def comparar(relatorio: dict, baseline: dict, tolerancia: float) -> list:
+    """
+    Métricas piores que o baseline além da tolerância
+    """
+    regressoes = []
+    for chave, maior_melhor in METRICAS_COMPARADAS:
+        atual, referencia = _obter(relatorio, chave), _obter(baseline, chave)
+        if atual is None or not referencia:
+            continue
+        variacao = (atual - referencia) / referencia
+        if (maior_melhor and variacao < -tolerancia) or (not maior_melhor and variacao > tolerancia):
+            regressoes.append(f"{chave}: {referencia} → {atual} ({variacao:+.0%})")
+    return regressoes
+
+
+def main():
+    args = _argumentos()
+    pasta = tempfile.mkdtemp(prefix="carga_webhook_")
+    banco = os.path.join(pasta, "carga.db")
+    fotos = os.path.join(pasta, "fotos")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{banco}",
+        "FOTOS_DIR": fotos,
+        "LOG_NIVEL": os.getenv("LOG_NIVEL", "WARNING"),
+        **servidores_falsos.variaveis_ambiente(args.porta),
+    })
+    os.environ.setdefault("IMAGEM_PROCESSAMENTO", "0")
+    os.environ.pop("WEBHOOK_SINCRONO", None)
+    os.environ["ALBUM_JANELA"] = str(args.album_janela)
+    if not args.com_limites:
+        os.environ.update({"LIMITE_REMETENTE_TAXA": "1000000", "LIMITE_REMETENTE_RAJADA": "1000000",
+                           "LIMITE_GLOBAL_TAXA": "1000000", "LIMITE_GLOBAL_RAJADA": "1000000",
+                           "LIMITE_FILA_MAXIMA": "1000000"})
+    servidor_falso = servidores_falsos.iniciar(
+        args.porta, args.latencia_envio, args.latencia_midia, args.latencia_llm, args.lado_imagem,
+    )
+
+    # Importado depois das variáveis de ambiente: engine e serviços são criados na importação
+    import httpx
+    from werkzeug.serving import make_server
+
+    import app
+    from database import init_database
+    from database.database import get_db
+    from database.models import EventoWebhook
+    from services.definicoes import definicao_checklist
+    from services.observabilidade import DURACAO_ETAPA
+
+    init_database()
+    logging.getLogger("werkzeug").setLevel(os.environ["LOG_NIVEL"])  # sem uma linha por requisição
+    servidor_app = make_server("127.0.0.1", args.porta_app, app.app, threaded=True)
+    threading.Thread(target=servidor_app.serve_forever, daemon=True).start()
+
+    sessoes = _gerar_trafego(args, definicao_checklist.dia(1).fluxo)
+    total = sum(len(eventos) for eventos in sessoes)
+    arquivos_banco = [banco, banco + "-wal"]
+    tamanho_banco, tamanho_fotos = _tamanho(arquivos_banco), _tamanho([fotos])
+    print(f"🏋️ {args.sessoes} sessões, {total} eventos, {args.concorrencia} conexões "
+          f"(LLM {args.latencia_llm}s, envio {args.latencia_envio}s, mídia {args.latencia_midia}s)")
+
+    latencias, status = [], {}
+    lock = threading.Lock()
+    cliente = httpx.Client(base_url=f"http://127.0.0.1:{args.porta_app}", timeout=60,
+                           limits=httpx.Limits(max_connections=args.concorrencia))
+
+    def enviar_sessao(eventos: list):
+        for evento in eventos:
+            while True:
+                inicio = time.perf_counter()
+                resposta = cliente.post("/webhook", json=evento)
+                duracao = (time.perf_counter() - inicio) * 1000
+                chave = (resposta.json() or {}).get("status") or str(resposta.status_code)
+                with lock:
+                    latencias.append(duracao)
+                    status[chave] = status.get(chave, 0) + 1
+                if resposta.status_code != 503:
+                    break
+                # Fila cheia: reentrega depois do Retry-After, como o Evolution API
+                time.sleep(float(resposta.headers.get("Retry-After", "1")))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        list(executor.map(enviar_sessao, sessoes))
+    duracao_envio = time.perf_counter() - inicio
+
+    while app.fila_webhook.pendentes() and time.perf_counter() - inicio < args.prazo:
+        time.sleep(0.1)
+    duracao_total = time.perf_counter() - inicio
+    time.sleep(max(args.latencia_envio * 2, 0.5))  # respostas ainda no enviador assíncrono
+
+    with get_db() as db:
+        concluidos = db.query(EventoWebhook.recebido_em, EventoWebhook.atualizado_em).filter(
+            EventoWebhook.status == 'concluido'
+        ).all()
+        pendentes = db.query(EventoWebhook).filter(EventoWebhook.status != 'concluido').count()
+    ponta_a_ponta = [(fim - recebido).total_seconds() * 1000 for recebido, fim in concluidos]
+    completos = sum(
+        1 for numero in range(args.sessoes)
+        if app.ChecklistDatabase.listar_faltantes(f"55619{numero:08d}@s.whatsapp.net") == []
+    )
+    externos = servidores_falsos.contadores(args.porta)
+    crescimento_banco = _tamanho(arquivos_banco) - tamanho_banco
+    crescimento_fotos = _tamanho([fotos]) - tamanho_fotos
+
+    relatorio = {
+        "parametros": {chave: valor for chave, valor in vars(args).items()
+                       if chave not in ("baseline", "salvar_baseline", "comparar", "tolerancia", "porta", "porta_app")},
+        "eventos": total,
+        "respostas": status,
+        "processados": len(concluidos),
+        "nao_processados": pendentes,
+        "checklists_completos": completos,
+        "duracao_envio_s": round(duracao_envio, 2),
+        "duracao_total_s": round(duracao_total, 2),
+        "vazao_webhook_req_s": round(total / duracao_envio, 1),
+        "vazao_eventos_s": round(len(concluidos) / duracao_total, 1),
+        "webhook_ms": _percentis(latencias),
+        "ponta_a_ponta_ms": _percentis(ponta_a_ponta),
+        "etapas_ms": {
+            f"{serie['etapa']}:{serie['tipo']}" if serie["tipo"] else serie["etapa"]: {
+                "contagem": serie["contagem"],
+                "media": round(serie["media"] * 1000, 2),
+                "p95": round(serie["p95"] * 1000, 2),
+            }
+            for serie in DURACAO_ETAPA.resumo() if serie["resultado"] == "ok"
+        },
+        "chamadas_externas": externos,
+        "banco_kb": round(crescimento_banco / 1024, 1),
+        "banco_kb_por_sessao": round(crescimento_banco / 1024 / args.sessoes, 1),
+        "fotos_mb": round(crescimento_fotos / 1024 / 1024, 1),
+        "memoria_atual_mb": _memoria_atual_mb(),
+        "memoria_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+    servidor_app.shutdown()
+    app.fila_webhook.parar()
+    app.enviador_whatsapp.encerrar()
+    servidor_falso.terminate()
+
+    if args.salvar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+            arquivo.write("\n")
+        print(f"💾 Baseline salvo em {args.baseline}")
+
+    if args.comparar:
+        with open(args.baseline, encoding="utf-8") as arquivo:
+            baseline = json.load(arquivo)
+        if baseline.get("parametros") != relatorio["parametros"]:
+            print("⚠️ Parâmetros diferentes dos do baseline: a comparação é só indicativa")
+        regressoes = comparar(relatorio, baseline, args.tolerancia)
+        if regressoes:
+            print("❌ Regressões em relação ao baseline:\n" + "\n".join(f"   {linha}" for linha in regressoes))
+            sys.exit(1)
+        print(f"✅ Sem regressões em relação ao baseline (tolerância {args.tolerancia:.0%})")
+
+    if pendentes or completos < args.sessoes:
+        print(f"❌ {pendentes} evento(s) não processado(s); {completos}/{args.sessoes} checklists completos")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
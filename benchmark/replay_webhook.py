@@ -0,0 +1,99 @@
+"""
+Replay de reentregas do webhook: envia cada evento uma vez e depois reenvia todos
+várias vezes (como o Evolution API faz em timeouts). Compara CPU e chamadas externas
+(downloads de imagem e mensagens enviadas) das duas fases.
+
+Uso (banco temporário; Evolution API e servidor de mídia simulados):
+    python -m benchmark.replay_webhook [--sessoes 10] [--repeticoes 20]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmark import servidores_falsos
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Replay de reentregas do webhook")
+    parser.add_argument("--sessoes", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=20, help="reentregas de cada evento")
+    parser.add_argument("--porta", type=int, default=18181, help="porta dos serviços simulados (usa também as duas seguintes)")
+    return parser.parse_args()
+
+
+def main():
+    args = _argumentos()
+    pasta = tempfile.mkdtemp(prefix="replay_webhook_")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(pasta, 'replay.db')}",
+        "FOTOS_DIR": os.path.join(pasta, "fotos"),
+        "WEBHOOK_SINCRONO": "1",
+        "IMAGEM_PROCESSAMENTO": "0",
+        "LOG_NIVEL": os.getenv("LOG_NIVEL", "WARNING"),
+        **servidores_falsos.variaveis_ambiente(args.porta),
+    })
+    servidor = servidores_falsos.iniciar(args.porta, lado_imagem=64)
+
+    # Importado depois das variáveis de ambiente: engine e serviços são criados na importação
+    import app
+    from database import init_database
+    from services.definicoes import definicao_checklist
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_database()
+    cliente = app.app.test_client()
+
+    eventos = []
+    for numero in range(args.sessoes):
+        remote_jid = f"55119{numero:08d}@s.whatsapp.net"
+        mensagens = [{"conversation": "iniciar"}]
+        mensagens += [
+            {"imageMessage": {"url": servidores_falsos.url_midia(args.porta, f"{numero}/{item}.jpg"), "caption": item}}
+            for item in definicao_checklist.dia(1).fluxo
+        ]
+        mensagens.append({"conversation": "o que falta?"})
+        for indice, mensagem in enumerate(mensagens):
+            eventos.append({
+                "event": "messages.upsert",
+                "data": {"key": {"remoteJid": remote_jid, "id": f"{numero}-{indice}"}, "message": mensagem},
+            })
+
+    def fase(lote):
+        antes = servidores_falsos.contadores(args.porta)
+        inicio_cpu, inicio = time.process_time(), time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            respostas = [cliente.post("/webhook", json=evento).get_json() for evento in lote]
+        cpu, duracao = time.process_time() - inicio_cpu, time.perf_counter() - inicio
+        time.sleep(1)  # envios pendentes do enviador assíncrono
+        depois = servidores_falsos.contadores(args.porta)
+        return {
+            "eventos": len(lote),
+            "cpu_ms_por_evento": round(cpu * 1000 / len(lote), 3),
+            "duracao_s": round(duracao, 2),
+            "downloads": depois["downloads"] - antes["downloads"],
+            "envios": depois["envios"] - antes["envios"],
+            "duplicados": sum(1 for resposta in respostas if resposta.get("status") == "duplicado"),
+        }
+
+    originais = fase(eventos)
+    reentregas = fase(eventos * args.repeticoes)
+    concluidos = sum(
+        1 for numero in range(args.sessoes)
+        if app.ChecklistDatabase.listar_faltantes(f"55119{numero:08d}@s.whatsapp.net") == []
+    )
+
+    print(json.dumps({"originais": originais, "reentregas": reentregas}, indent=2, ensure_ascii=False))
+    print(f"✅ {concluidos}/{args.sessoes} checklists completos; "
+          f"CPU por reentrega: {reentregas['cpu_ms_por_evento'] / originais['cpu_ms_por_evento']:.1%} "
+          f"do evento original; chamadas externas nas reentregas: "
+          f"{reentregas['downloads'] + reentregas['envios']}")
+    app.enviador_whatsapp.encerrar()
+    servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Serviços externos simulados para os benchmarks, num processo separado (não entram na
+medição de CPU e memória da aplicação):
+
+- Evolution API (POST /message/sendText/<instância>) na `porta`
+- Servidor de mídia (GET /<qualquer caminho>) na `porta + 1`: cada URL devolve um JPEG diferente
+- LLM compatível com a API da OpenAI (POST /v1/chat/completions) na `porta + 2`
+
+Cada serviço tem latência configurável. GET /contadores (em qualquer porta) devolve
+{"envios", "downloads", "llm"}.
+"""
+import io
+import json
+import multiprocessing
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# JPEG mínimo válido o bastante para os magic bytes (sem Pillow)
+IMAGEM_MINIMA = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+
+
+def _imagem_base(lado: int) -> bytes:
+    """
+    Foto de celular simulada (ruído comprime mal, como uma foto real). Sem Pillow, o JPEG mínimo
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return IMAGEM_MINIMA
+    buffer = io.BytesIO()
+    Image.effect_noise((lado, lado * 3 // 4), 64).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _resposta_llm(prompt: str) -> dict:
+    # Mesmo contrato do prompt de app.interpretar_mensagem_usuario
+    mensagem = re.search(r'Mensagem original do usuário: "(.*)"', prompt, re.S)
+    texto = (mensagem.group(1) if mensagem else prompt).lower()
+    if "falt" in texto:
+        return {"action": "verificar_faltantes"}
+    if "reinic" in texto or "recome" in texto:
+        return {"action": "reiniciar_checklist"}
+    return {"action": "marcar_conferido", "itens": []}
+
+
+def _executar(porta: int, latencia_envio: float, latencia_midia: float, latencia_llm: float, lado_imagem: int):
+    contadores = {"envios": 0, "downloads": 0, "llm": 0}
+    lock = threading.Lock()
+    imagem = _imagem_base(lado_imagem)
+
+    def contar(chave: str):
+        with lock:
+            contadores[chave] += 1
+
+    class Base(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como os serviços reais
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, corpo: bytes, tipo: str = "application/json"):
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _corpo(self) -> dict:
+            return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/contadores":
+                with lock:
+                    return self._responder(json.dumps(contadores).encode())
+            self.responder_get()
+
+        def responder_get(self):
+            self.send_error(404)
+
+    class Evolution(Base):
+        def do_POST(self):
+            self._corpo()
+            time.sleep(latencia_envio)
+            contar("envios")
+            self._responder(json.dumps({"key": {"id": str(time.time_ns())}, "status": "PENDING"}).encode())
+
+    class Midia(Base):
+        def responder_get(self):
+            time.sleep(latencia_midia)
+            contar("downloads")
+            # Bytes depois do marcador de fim são ignorados pelos decodificadores: cada URL vira um arquivo distinto
+            self._responder(imagem + self.path.encode(), "image/jpeg")
+
+    class Llm(Base):
+        def do_POST(self):
+            corpo = self._corpo()
+            prompt = "\n".join(str(mensagem.get("content", "")) for mensagem in corpo.get("messages", []))
+            time.sleep(latencia_llm)
+            contar("llm")
+            self._responder(json.dumps({
+                "id": f"chatcmpl-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": corpo.get("model", "falso"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(_resposta_llm(prompt))},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode())
+
+    servidores = [
+        ThreadingHTTPServer(("127.0.0.1", porta + deslocamento), manipulador)
+        for deslocamento, manipulador in enumerate((Evolution, Midia, Llm))
+    ]
+    for servidor in servidores[1:]:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    servidores[0].serve_forever()
+
+
+def iniciar(porta: int, latencia_envio: float = 0.0, latencia_midia: float = 0.0,
+            latencia_llm: float = 0.0, lado_imagem: int = 1200) -> multiprocessing.Process:
+    """
+    Sobe os três serviços em um processo filho e espera ficarem prontos
+    """
+    processo = multiprocessing.Process(
+        target=_executar, args=(porta, latencia_envio, latencia_midia, latencia_llm, lado_imagem), daemon=True,
+    )
+    processo.start()
+    for _ in range(100):
+        try:
+            contadores(porta)
+            break
+        except OSError:
+            time.sleep(0.1)
+    return processo
+
+
+def contadores(porta: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{porta}/contadores", timeout=5) as resposta:
+        return json.loads(resposta.read())
+
+
+def variaveis_ambiente(porta: int) -> dict:
+    """
+    Variáveis que apontam a aplicação para os serviços simulados
+    """
+    return {
+        "EVOLUTION_API_URL": f"http://127.0.0.1:{porta}",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{porta + 2}/v1",
+        "OPENAI_API_KEY": "chave-falsa",
+    }
+
+
+def url_midia(porta: int, caminho: str) -> str:
+    return f"http://127.0.0.1:{porta + 1}/{caminho}"
@@ -2,7 +2,26 @@
 Pacote do banco de dados para o Checklist CEBRASPE
 """
 
-from .models import Base, ChecklistDia1, ChecklistDia2
+from .models import (
+    Base,
+    ChecklistDia1,
+    ChecklistDia2,
+    ChecklistSessao,
+    ChecklistItem,
+    EventoWebhook,
+    EventoWebhookFalho,
+    MensagemPendente,
+    MensagemRecebida,
+    CacheInterpretacao,
+    EstadoFluxo,
+    FotoDerivada,
+    FotoAssinatura,
+    TextoOcr,
+    PainelLocal,
+    PainelItem,
+    PainelSessao,
+    PainelDuracao
+)
 from .database import (
     init_database, 
     get_db, 
@@ -17,6 +36,21 @@ __all__ = [
     'Base',
     'ChecklistDia1', 
     'ChecklistDia2',
+    'ChecklistSessao',
+    'ChecklistItem',
+    'EventoWebhook',
+    'EventoWebhookFalho',
+    'MensagemPendente',
+    'MensagemRecebida',
+    'CacheInterpretacao',
+    'EstadoFluxo',
+    'FotoDerivada',
+    'FotoAssinatura',
+    'TextoOcr',
+    'PainelLocal',
+    'PainelItem',
+    'PainelSessao',
+    'PainelDuracao',
     
     # Database functions
     'init_database',
@@ -0,0 +1,68 @@
+"""
+Migra as fotos gravadas como data URI (base64) nas colunas *_foto para o
+armazenamento de fotos, deixando no banco apenas a referência (hash;tamanho;mime)
+
+Uso:
+    python -m database.migrar_fotos [--vacuum]
+"""
+import base64
+import sys
+
+from sqlalchemy import text
+
+from services.fotos import armazem_fotos
+
+from .database import engine, get_db
+from .models import ChecklistDia1, ChecklistDia2
+
+
+def _converter_data_uri(valor: str) -> str:
+    """
+    Grava o conteúdo de um data URI no armazenamento e devolve a referência
+    """
+    cabecalho, conteudo = valor.split(",", 1)
+    mime = cabecalho[len("data:"):].split(";", 1)[0] or None
+    return str(armazem_fotos.salvar(base64.b64decode(conteudo), mime))
+
+
+def migrar_tabela(modelo) -> int:
+    """
+    Converte, linha a linha, as fotos de uma tabela de checklist. Retorna o total de fotos migradas
+    """
+    colunas_foto = [c for c in modelo.__table__.columns if c.name.endswith("_foto")]
+    with get_db() as db:
+        ids = [linha.id for linha in db.query(modelo.id).all()]
+
+    migradas = 0
+    for checklist_id in ids:
+        with get_db() as db:
+            linha = db.query(*colunas_foto).filter(modelo.id == checklist_id).first()
+            novos_valores = {}
+            for coluna, valor in zip(colunas_foto, linha):
+                if valor and valor.startswith("data:"):
+                    novos_valores[coluna.name] = _converter_data_uri(valor)
+            if novos_valores:
+                db.query(modelo).filter(modelo.id == checklist_id).update(novos_valores, synchronize_session=False)
+                migradas += len(novos_valores)
+    return migradas
+
+
+def migrar_fotos(vacuum: bool = False):
+    total = 0
+    for modelo in (ChecklistDia1, ChecklistDia2):
+        migradas = migrar_tabela(modelo)
+        print(f"📦 {modelo.__tablename__}: {migradas} foto(s) migrada(s)")
+        total += migradas
+
+    if vacuum and engine.dialect.name == "sqlite":
+        # Devolve ao sistema de arquivos o espaço ocupado pelos data URIs
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+        print("🧹 VACUUM concluído")
+
+    print(f"✅ Migração concluída: {total} foto(s) movida(s) para o armazenamento")
+    return total
+
+
+if __name__ == "__main__":
+    migrar_fotos(vacuum="--vacuum" in sys.argv)
@@ -0,0 +1,89 @@
+"""
+Migra os checklists do esquema antigo (checklist_dia1/checklist_dia2, uma coluna por item)
+para o esquema normalizado (checklist_sessao + checklist_item).
+
+Sessões que já existem no esquema novo são mantidas. Fotos ainda gravadas como
+data URI são movidas para o armazenamento de fotos durante a migração.
+
+Uso:
+    python -m database.migrar_normalizado
+"""
+from sqlalchemy import insert, inspect
+from sqlalchemy.orm import undefer_group
+
+from .database import ChecklistDatabase, engine, get_db, init_database
+from .migrar_fotos import _converter_data_uri
+from .models import ITENS_LEGADOS, ChecklistDia1, ChecklistDia2, ChecklistItem, ChecklistSessao
+
+TAMANHO_LOTE = 200
+
+
+def _migrar_tabela(modelo, dia: int) -> int:
+    if not inspect(engine).has_table(modelo.__tablename__):
+        return 0
+
+    with get_db() as db:
+        existentes = {
+            sessao_id for (sessao_id,) in
+            db.query(ChecklistSessao.sessao_id).filter(ChecklistSessao.dia == dia)
+        }
+        ids = [linha.id for linha in db.query(modelo.id).order_by(modelo.id)]
+
+    migradas = 0
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+        with get_db() as db:
+            antigos = (
+                db.query(modelo)
+                .options(undefer_group("fotos"), undefer_group("observacoes"))
+                .filter(modelo.id.in_(lote))
+                .all()
+            )
+            sessoes, itens = [], []
+            for antigo in antigos:
+                if antigo.sessao_id in existentes:
+                    continue
+                sessoes.append({
+                    "sessao_id": antigo.sessao_id,
+                    "dia": dia,
+                    "aplicador_nome": antigo.aplicador_nome,
+                    "local_aplicacao": antigo.local_aplicacao,
+                    "data_aplicacao": antigo.data_aplicacao,
+                    "timestamp_inicio": antigo.timestamp_inicio,
+                    "timestamp_fim": antigo.timestamp_fim,
+                    "status_checklist": antigo.status_checklist,
+                })
+                for item in ITENS_LEGADOS[dia]:
+                    foto = getattr(antigo, f"{item}_foto")
+                    if foto and foto.startswith("data:"):
+                        foto = _converter_data_uri(foto)
+                    itens.append({
+                        "sessao_id": antigo.sessao_id,
+                        "dia": dia,
+                        "item_key": item,
+                        "presente": bool(getattr(antigo, f"{item}_presente")),
+                        "foto_ref": foto,
+                        "observacao": getattr(antigo, f"{item}_observacao"),
+                    })
+            if sessoes:
+                db.execute(insert(ChecklistSessao), sessoes)
+                db.execute(insert(ChecklistItem), itens)
+                migradas += len(sessoes)
+    return migradas
+
+
+def migrar_normalizado():
+    init_database()
+    total = 0
+    for modelo, dia in ((ChecklistDia1, 1), (ChecklistDia2, 2)):
+        migradas = _migrar_tabela(modelo, dia)
+        print(f"📦 {modelo.__tablename__}: {migradas} checklist(s) migrado(s)")
+        total += migradas
+    if total:
+        ChecklistDatabase.recalcular_painel()
+    print(f"✅ Migração concluída: {total} checklist(s) no esquema normalizado")
+    return total
+
+
+if __name__ == "__main__":
+    migrar_normalizado()
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, Index, ForeignKeyConstraint
+from sqlalchemy.orm import declarative_base, deferred
 from sqlalchemy.sql import func
 
 Base = declarative_base()
 
+# As colunas *_foto e *_observacao são "deferred" (grupos "fotos" e "observacoes"):
+# só são lidas do banco quando acessadas ou quando a consulta usa undefer_group().
+
 class ChecklistDia1(Base):
     __tablename__ = 'checklist_dia1'
     
@@ -20,97 +23,97 @@ class ChecklistDia1(Base):
     # === ENVELOPES DE MATERIAL DE SALA - DIA 1 ===
     # Envelope - 1º dia de aplicação (sala)
     envelope_sala_dia1_presente = Column(Boolean)
-    envelope_sala_dia1_foto = Column(Text)  # Path da foto
-    envelope_sala_dia1_observacao = Column(Text)
+    envelope_sala_dia1_foto = deferred(Column(Text), group="fotos")  # Referência da foto (sha256:hash;tamanho;mime)
+    envelope_sala_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Lista de presença do 1º dia
     lista_presenca_dia1_presente = Column(Boolean)
-    lista_presenca_dia1_foto = Column(Text)
-    lista_presenca_dia1_observacao = Column(Text)
+    lista_presenca_dia1_foto = deferred(Column(Text), group="fotos")
+    lista_presenca_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Ata de sala do 1º dia
     ata_sala_dia1_presente = Column(Boolean)
-    ata_sala_dia1_foto = Column(Text)
-    ata_sala_dia1_observacao = Column(Text)
+    ata_sala_dia1_foto = deferred(Column(Text), group="fotos")
+    ata_sala_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Avaliação de atendimento especializado
     avaliacao_especializada_dia1_presente = Column(Boolean)
-    avaliacao_especializada_dia1_foto = Column(Text)
-    avaliacao_especializada_dia1_observacao = Column(Text)
+    avaliacao_especializada_dia1_foto = deferred(Column(Text), group="fotos")
+    avaliacao_especializada_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPES DE COORDENAÇÃO - DIA 1 ===
     # Envelope - 1º dia de aplicação (coordenação)
     envelope_coordenacao_dia1_presente = Column(Boolean)
-    envelope_coordenacao_dia1_foto = Column(Text)
-    envelope_coordenacao_dia1_observacao = Column(Text)
+    envelope_coordenacao_dia1_foto = deferred(Column(Text), group="fotos")
+    envelope_coordenacao_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Cartão-resposta reserva
     cartao_resposta_reserva_dia1_presente = Column(Boolean)
-    cartao_resposta_reserva_dia1_foto = Column(Text)
-    cartao_resposta_reserva_dia1_observacao = Column(Text)
+    cartao_resposta_reserva_dia1_foto = deferred(Column(Text), group="fotos")
+    cartao_resposta_reserva_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Ata de sala reserva (coordenação)
     ata_sala_reserva_dia1_presente = Column(Boolean)
-    ata_sala_reserva_dia1_foto = Column(Text)
-    ata_sala_reserva_dia1_observacao = Column(Text)
+    ata_sala_reserva_dia1_foto = deferred(Column(Text), group="fotos")
+    ata_sala_reserva_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Lista de presença reserva (coordenação)
     lista_presenca_reserva_dia1_presente = Column(Boolean)
-    lista_presenca_reserva_dia1_foto = Column(Text)
-    lista_presenca_reserva_dia1_observacao = Column(Text)
+    lista_presenca_reserva_dia1_foto = deferred(Column(Text), group="fotos")
+    lista_presenca_reserva_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Avaliação especializada reserva (coordenação)
     avaliacao_especializada_reserva_dia1_presente = Column(Boolean)
-    avaliacao_especializada_reserva_dia1_foto = Column(Text)
-    avaliacao_especializada_reserva_dia1_observacao = Column(Text)
+    avaliacao_especializada_reserva_dia1_foto = deferred(Column(Text), group="fotos")
+    avaliacao_especializada_reserva_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPES AUXILIARES - DIA 1 ===
     # Envelope de porta-objetos - 1º dia
     envelope_porta_objetos_dia1_presente = Column(Boolean)
-    envelope_porta_objetos_dia1_foto = Column(Text)
-    envelope_porta_objetos_dia1_observacao = Column(Text)
+    envelope_porta_objetos_dia1_foto = deferred(Column(Text), group="fotos")
+    envelope_porta_objetos_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # Envelope de Sala Extra - 1º dia
     envelope_sala_extra_dia1_presente = Column(Boolean)
-    envelope_sala_extra_dia1_foto = Column(Text)
-    envelope_sala_extra_dia1_observacao = Column(Text)
+    envelope_sala_extra_dia1_foto = deferred(Column(Text), group="fotos")
+    envelope_sala_extra_dia1_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPE TRANSPARENTE ===
     # Manuais
     manuais_presente = Column(Boolean)
-    manuais_foto = Column(Text)
-    manuais_observacao = Column(Text)
+    manuais_foto = deferred(Column(Text), group="fotos")
+    manuais_observacao = deferred(Column(Text), group="observacoes")
     
     # Crachás
     crachas_presente = Column(Boolean)
-    crachas_foto = Column(Text)
-    crachas_observacao = Column(Text)
+    crachas_foto = deferred(Column(Text), group="fotos")
+    crachas_observacao = deferred(Column(Text), group="observacoes")
     
     # Relação de candidatos e salas
     relacao_candidatos_salas_presente = Column(Boolean)
-    relacao_candidatos_salas_foto = Column(Text)
-    relacao_candidatos_salas_observacao = Column(Text)
+    relacao_candidatos_salas_foto = deferred(Column(Text), group="fotos")
+    relacao_candidatos_salas_observacao = deferred(Column(Text), group="observacoes")
     
     # === ITENS DE USO GERAL ===
     # Alicate
     alicate_presente = Column(Boolean)
-    alicate_foto = Column(Text)
-    alicate_observacao = Column(Text)
+    alicate_foto = deferred(Column(Text), group="fotos")
+    alicate_observacao = deferred(Column(Text), group="observacoes")
     
     # 3 canetas esferográficas
     canetas_presente = Column(Boolean)
-    canetas_foto = Column(Text)
-    canetas_observacao = Column(Text)
+    canetas_foto = deferred(Column(Text), group="fotos")
+    canetas_observacao = deferred(Column(Text), group="observacoes")
     
     # 2 pincéis
     pinceis_presente = Column(Boolean)
-    pinceis_foto = Column(Text)
-    pinceis_observacao = Column(Text)
+    pinceis_foto = deferred(Column(Text), group="fotos")
+    pinceis_observacao = deferred(Column(Text), group="observacoes")
     
     # 1 fita adesiva
     fita_adesiva_presente = Column(Boolean)
-    fita_adesiva_foto = Column(Text)
-    fita_adesiva_observacao = Column(Text)
+    fita_adesiva_foto = deferred(Column(Text), group="fotos")
+    fita_adesiva_observacao = deferred(Column(Text), group="observacoes")
     
     def __repr__(self):
         return f"<ChecklistDia1(sessao_id='{self.sessao_id}', aplicador='{self.aplicador_nome}', status='{self.status_checklist}')>"
@@ -132,107 +135,411 @@ class ChecklistDia2(Base):
     # === ENVELOPES DE MATERIAL DE SALA - DIA 2 ===
     # Envelope - 2º dia de aplicação (sala)
     envelope_sala_dia2_presente = Column(Boolean)
-    envelope_sala_dia2_foto = Column(Text)
-    envelope_sala_dia2_observacao = Column(Text)
+    envelope_sala_dia2_foto = deferred(Column(Text), group="fotos")
+    envelope_sala_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Lista de presença do 2º dia
     lista_presenca_dia2_presente = Column(Boolean)
-    lista_presenca_dia2_foto = Column(Text)
-    lista_presenca_dia2_observacao = Column(Text)
+    lista_presenca_dia2_foto = deferred(Column(Text), group="fotos")
+    lista_presenca_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Ata de sala do 2º dia
     ata_sala_dia2_presente = Column(Boolean)
-    ata_sala_dia2_foto = Column(Text)
-    ata_sala_dia2_observacao = Column(Text)
+    ata_sala_dia2_foto = deferred(Column(Text), group="fotos")
+    ata_sala_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Avaliação de atendimento especializado
     avaliacao_especializada_dia2_presente = Column(Boolean)
-    avaliacao_especializada_dia2_foto = Column(Text)
-    avaliacao_especializada_dia2_observacao = Column(Text)
+    avaliacao_especializada_dia2_foto = deferred(Column(Text), group="fotos")
+    avaliacao_especializada_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPES DE COORDENAÇÃO - DIA 2 ===
     # Envelope - 2º dia de aplicação (coordenação)
     envelope_coordenacao_dia2_presente = Column(Boolean)
-    envelope_coordenacao_dia2_foto = Column(Text)
-    envelope_coordenacao_dia2_observacao = Column(Text)
+    envelope_coordenacao_dia2_foto = deferred(Column(Text), group="fotos")
+    envelope_coordenacao_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Cartão-resposta reserva
     cartao_resposta_reserva_dia2_presente = Column(Boolean)
-    cartao_resposta_reserva_dia2_foto = Column(Text)
-    cartao_resposta_reserva_dia2_observacao = Column(Text)
+    cartao_resposta_reserva_dia2_foto = deferred(Column(Text), group="fotos")
+    cartao_resposta_reserva_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Ata de sala reserva (coordenação)
     ata_sala_reserva_dia2_presente = Column(Boolean)
-    ata_sala_reserva_dia2_foto = Column(Text)
-    ata_sala_reserva_dia2_observacao = Column(Text)
+    ata_sala_reserva_dia2_foto = deferred(Column(Text), group="fotos")
+    ata_sala_reserva_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Lista de presença reserva (coordenação)
     lista_presenca_reserva_dia2_presente = Column(Boolean)
-    lista_presenca_reserva_dia2_foto = Column(Text)
-    lista_presenca_reserva_dia2_observacao = Column(Text)
+    lista_presenca_reserva_dia2_foto = deferred(Column(Text), group="fotos")
+    lista_presenca_reserva_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Avaliação especializada reserva (coordenação)
     avaliacao_especializada_reserva_dia2_presente = Column(Boolean)
-    avaliacao_especializada_reserva_dia2_foto = Column(Text)
-    avaliacao_especializada_reserva_dia2_observacao = Column(Text)
+    avaliacao_especializada_reserva_dia2_foto = deferred(Column(Text), group="fotos")
+    avaliacao_especializada_reserva_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Folha de rascunho reserva
     folha_rascunho_reserva_presente = Column(Boolean)
-    folha_rascunho_reserva_foto = Column(Text)
-    folha_rascunho_reserva_observacao = Column(Text)
+    folha_rascunho_reserva_foto = deferred(Column(Text), group="fotos")
+    folha_rascunho_reserva_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPES AUXILIARES - DIA 2 ===
     # Envelope de porta-objetos - 2º dia
     envelope_porta_objetos_dia2_presente = Column(Boolean)
-    envelope_porta_objetos_dia2_foto = Column(Text)
-    envelope_porta_objetos_dia2_observacao = Column(Text)
+    envelope_porta_objetos_dia2_foto = deferred(Column(Text), group="fotos")
+    envelope_porta_objetos_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Envelope de Sala Extra - 2º dia
     envelope_sala_extra_dia2_presente = Column(Boolean)
-    envelope_sala_extra_dia2_foto = Column(Text)
-    envelope_sala_extra_dia2_observacao = Column(Text)
+    envelope_sala_extra_dia2_foto = deferred(Column(Text), group="fotos")
+    envelope_sala_extra_dia2_observacao = deferred(Column(Text), group="observacoes")
     
     # Envelope de folhas de rascunho por sala
     envelope_folhas_rascunho_presente = Column(Boolean)
-    envelope_folhas_rascunho_foto = Column(Text)
-    envelope_folhas_rascunho_observacao = Column(Text)
+    envelope_folhas_rascunho_foto = deferred(Column(Text), group="fotos")
+    envelope_folhas_rascunho_observacao = deferred(Column(Text), group="observacoes")
     
     # === ENVELOPE TRANSPARENTE ===
     # Manuais
     manuais_presente = Column(Boolean)
-    manuais_foto = Column(Text)
-    manuais_observacao = Column(Text)
+    manuais_foto = deferred(Column(Text), group="fotos")
+    manuais_observacao = deferred(Column(Text), group="observacoes")
     
     # Crachás
     crachas_presente = Column(Boolean)
-    crachas_foto = Column(Text)
-    crachas_observacao = Column(Text)
+    crachas_foto = deferred(Column(Text), group="fotos")
+    crachas_observacao = deferred(Column(Text), group="observacoes")
     
     # Relação de candidatos e salas
     relacao_candidatos_salas_presente = Column(Boolean)
-    relacao_candidatos_salas_foto = Column(Text)
-    relacao_candidatos_salas_observacao = Column(Text)
+    relacao_candidatos_salas_foto = deferred(Column(Text), group="fotos")
+    relacao_candidatos_salas_observacao = deferred(Column(Text), group="observacoes")
     
     # === ITENS DE USO GERAL ===
     # Alicate
     alicate_presente = Column(Boolean)
-    alicate_foto = Column(Text)
-    alicate_observacao = Column(Text)
+    alicate_foto = deferred(Column(Text), group="fotos")
+    alicate_observacao = deferred(Column(Text), group="observacoes")
     
     # 3 canetas esferográficas
     canetas_presente = Column(Boolean)
-    canetas_foto = Column(Text)
-    canetas_observacao = Column(Text)
+    canetas_foto = deferred(Column(Text), group="fotos")
+    canetas_observacao = deferred(Column(Text), group="observacoes")
     
     # 2 pincéis
     pinceis_presente = Column(Boolean)
-    pinceis_foto = Column(Text)
-    pinceis_observacao = Column(Text)
+    pinceis_foto = deferred(Column(Text), group="fotos")
+    pinceis_observacao = deferred(Column(Text), group="observacoes")
     
     # 1 fita adesiva
     fita_adesiva_presente = Column(Boolean)
-    fita_adesiva_foto = Column(Text)
-    fita_adesiva_observacao = Column(Text)
+    fita_adesiva_foto = deferred(Column(Text), group="fotos")
+    fita_adesiva_observacao = deferred(Column(Text), group="observacoes")
     
     def __repr__(self):
-        return f"<ChecklistDia2(sessao_id='{self.sessao_id}', aplicador='{self.aplicador_nome}', status='{self.status_checklist}')>" 
\ No newline at end of file
+        return f"<ChecklistDia2(sessao_id='{self.sessao_id}', aplicador='{self.aplicador_nome}', status='{self.status_checklist}')>"
+
+
+# === Esquema normalizado: uma linha por sessão/dia e uma linha por item ===
+# As tabelas checklist_dia1/checklist_dia2 acima são o esquema antigo (uma coluna por item),
+# mantidas apenas para a migração (database/migrar_normalizado.py). Os itens de cada dia vêm
+# da definição do checklist (services/definicoes.py).
+
+def _itens_do_modelo(modelo) -> list:
+    return [c.name[:-len("_presente")] for c in modelo.__table__.columns if c.name.endswith("_presente")]
+
+
+# Itens das colunas do esquema antigo, por dia
+ITENS_LEGADOS = {1: _itens_do_modelo(ChecklistDia1), 2: _itens_do_modelo(ChecklistDia2)}
+
+
+class ChecklistSessao(Base):
+    __tablename__ = 'checklist_sessao'
+
+    # Identificação (uma linha por sessão e dia)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sessao_id = Column(String(100), nullable=False)
+    dia = Column(Integer, nullable=False)
+    aplicador_nome = Column(String(255))
+    local_aplicacao = Column(String(255))
+    data_aplicacao = Column(DateTime, default=func.now())
+    timestamp_inicio = Column(DateTime, default=func.now())
+    timestamp_fim = Column(DateTime)
+    status_checklist = Column(String(50), default='iniciado')  # iniciado, em_progresso, concluido
+
+    __table_args__ = (
+        Index('ux_checklist_sessao_sessao_dia', 'sessao_id', 'dia', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<ChecklistSessao(sessao_id='{self.sessao_id}', dia={self.dia}, status='{self.status_checklist}')>"
+
+
+class ChecklistItem(Base):
+    __tablename__ = 'checklist_item'
+
+    # Um item do checklist de uma sessão/dia
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sessao_id = Column(String(100), nullable=False)
+    dia = Column(Integer, nullable=False)
+    item_key = Column(String(100), nullable=False)  # ex.: lista_presenca_dia1
+    presente = Column(Boolean, nullable=False, default=False)
+    confianca = Column(Float)  # Verificação da foto por OCR (0 a 1); None = não verificada
+    foto_ref = Column(String(200))  # Referência da foto (sha256:hash;tamanho;mime)
+    observacao = Column(Text)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['sessao_id', 'dia'],
+            ['checklist_sessao.sessao_id', 'checklist_sessao.dia'],
+            ondelete='CASCADE',
+        ),
+        # Também atende as consultas por (sessao_id, dia), que são prefixo do índice
+        Index('ux_checklist_item_sessao_dia_item', 'sessao_id', 'dia', 'item_key', unique=True),
+        # Agregações por item ("quantas sessões já conferiram X")
+        Index('ix_checklist_item_dia_item_presente', 'dia', 'item_key', 'presente'),
+        # Itens que usam uma foto (antes de remover o original normalizado)
+        Index('ix_checklist_item_foto_ref', 'foto_ref'),
+    )
+
+    def __repr__(self):
+        return f"<ChecklistItem(sessao_id='{self.sessao_id}', dia={self.dia}, item='{self.item_key}', presente={self.presente})>"
+
+
+class EventoWebhook(Base):
+    __tablename__ = 'fila_webhook'
+
+    # Evento recebido do Evolution API, aguardando processamento pelos workers
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    remote_jid = Column(String(100), nullable=False)  # Eventos do mesmo remetente são processados em ordem
+    evento = Column(String(50))
+    payload = Column(Text, nullable=False)  # JSON original do webhook
+    status = Column(String(20), nullable=False, default='pendente')  # pendente, processando, concluido
+    tentativas = Column(Integer, nullable=False, default=0)
+    ultimo_erro = Column(Text)
+    recebido_em = Column(DateTime, default=func.now())
+    disponivel_em = Column(DateTime, default=func.now())  # Próxima tentativa (backoff)
+    atualizado_em = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_fila_webhook_status_disponivel', 'status', 'disponivel_em'),
+        Index('ix_fila_webhook_jid_status', 'remote_jid', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<EventoWebhook(id={self.id}, remote_jid='{self.remote_jid}', status='{self.status}')>"
+
+
+class EventoWebhookFalho(Base):
+    __tablename__ = 'fila_webhook_falhas'
+
+    # Dead-letter: eventos que esgotaram as tentativas de processamento
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    evento_id = Column(Integer, nullable=False)
+    remote_jid = Column(String(100), nullable=False)
+    evento = Column(String(50))
+    payload = Column(Text, nullable=False)
+    tentativas = Column(Integer, nullable=False)
+    erro = Column(Text)
+    recebido_em = Column(DateTime)
+    falhou_em = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<EventoWebhookFalho(evento_id={self.evento_id}, remote_jid='{self.remote_jid}')>"
+
+
+class MensagemPendente(Base):
+    __tablename__ = 'whatsapp_pendentes'
+
+    # Outbox: mensagens que o Evolution API não aceitou, reenviadas em segundo plano
+    # (o evento que as gerou já foi processado e não é repetido)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    telefone = Column(String(100), nullable=False)
+    mensagem = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='pendente')  # pendente, falhou
+    tentativas = Column(Integer, nullable=False, default=1)
+    ultimo_erro = Column(Text)
+    disponivel_em = Column(DateTime, nullable=False)  # Próximo reenvio (backoff)
+    criado_em = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_whatsapp_pendentes_status_disponivel', 'status', 'disponivel_em'),
+    )
+
+    def __repr__(self):
+        return f"<MensagemPendente(id={self.id}, telefone='{self.telefone}', tentativas={self.tentativas})>"
+
+
+class MensagemRecebida(Base):
+    __tablename__ = 'mensagens_recebidas'
+
+    # Mensagens já aceitas pelo webhook (deduplicação das reentregas do Evolution API)
+    remote_jid = Column(String(100), primary_key=True)
+    mensagem_id = Column(String(100), primary_key=True)  # data.key.id
+    recebido_em = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index('ix_mensagens_recebidas_recebido_em', 'recebido_em'),
+    )
+
+    def __repr__(self):
+        return f"<MensagemRecebida(remote_jid='{self.remote_jid}', mensagem_id='{self.mensagem_id}')>"
+
+
+class CacheInterpretacao(Base):
+    __tablename__ = 'cache_interpretacao'
+
+    # Respostas do LLM já interpretadas, por texto normalizado + modelo + versão do prompt
+    chave = Column(String(64), primary_key=True)  # sha256(modelo|versao_prompt|texto_normalizado)
+    texto_normalizado = Column(Text, nullable=False)
+    modelo = Column(String(100), nullable=False)
+    versao_prompt = Column(String(20), nullable=False)
+    resposta = Column(Text, nullable=False)  # JSON da ação
+    acessos = Column(Integer, nullable=False, default=0)
+    criado_em = Column(DateTime, default=func.now())
+    acessado_em = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_cache_interpretacao_acessado_em', 'acessado_em'),
+    )
+
+    def __repr__(self):
+        return f"<CacheInterpretacao(texto='{self.texto_normalizado}', modelo='{self.modelo}')>"
+
+
+class EstadoFluxo(Base):
+    __tablename__ = 'estado_fluxo'
+
+    # Posição de cada sessão no fluxo de fotos (compartilhada entre workers e processos)
+    sessao_id = Column(String(100), primary_key=True)
+    dia = Column(Integer, nullable=False)
+    indice = Column(Integer, nullable=False, default=0)
+    versao = Column(Integer, nullable=False, default=0)  # Incrementada a cada alteração (compare-and-set)
+    # Remoção lógica: a linha fica para a versão continuar crescendo se a sessão recomeçar
+    removido_em = Column(DateTime)
+    atualizado_em = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EstadoFluxo(sessao_id='{self.sessao_id}', dia={self.dia}, indice={self.indice})>"
+
+
+class FotoDerivada(Base):
+    __tablename__ = 'fotos_derivadas'
+
+    # Versões geradas a partir de uma foto original (normalizada, miniatura)
+    hash_origem = Column(String(64), primary_key=True)
+    variante = Column(String(20), primary_key=True)  # normalizada, miniatura
+    foto_ref = Column(String(200), nullable=False)  # sha256:hash;tamanho;mime da versão gerada
+    criado_em = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<FotoDerivada(hash_origem='{self.hash_origem}', variante='{self.variante}')>"
+
+
+class TextoOcr(Base):
+    __tablename__ = 'fotos_ocr'
+
+    # Texto extraído de cada foto por OCR (normalizado), reaproveitado pelo hash da foto
+    foto_hash = Column(String(64), primary_key=True)
+    idioma = Column(String(20), primary_key=True)
+    texto = Column(Text, nullable=False)
+    criado_em = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<TextoOcr(foto_hash='{self.foto_hash}', idioma='{self.idioma}')>"
+
+
+class FotoAssinatura(Base):
+    __tablename__ = 'fotos_assinaturas'
+
+    # Hash perceptual (dHash de 64 bits) da foto de cada item, para achar fotos repetidas.
+    # As 4 faixas de 16 bits são indexadas: fotos a até 3 bits de distância têm ao menos uma faixa igual
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sessao_id = Column(String(100), nullable=False)
+    dia = Column(Integer, nullable=False)
+    local_aplicacao = Column(String(255), nullable=False, default='')  # '' quando não informado
+    item_key = Column(String(100), nullable=False)
+    foto_hash = Column(String(64), nullable=False)  # SHA-256 da foto recebida
+    dhash = Column(String(16), nullable=False)  # hexadecimal
+    banda0 = Column(Integer, nullable=False)
+    banda1 = Column(Integer, nullable=False)
+    banda2 = Column(Integer, nullable=False)
+    banda3 = Column(Integer, nullable=False)
+    duplicada_de = Column(String(200))  # sessao_id/item_key da foto parecida, quando sinalizada
+    distancia = Column(Integer)  # bits diferentes em relação a duplicada_de
+    criado_em = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ux_fotos_assinaturas_sessao_dia_item', 'sessao_id', 'dia', 'item_key', unique=True),
+        Index('ix_fotos_assinaturas_foto_hash', 'foto_hash'),
+        Index('ix_fotos_assinaturas_banda0', 'dia', 'banda0'),
+        Index('ix_fotos_assinaturas_banda1', 'dia', 'banda1'),
+        Index('ix_fotos_assinaturas_banda2', 'dia', 'banda2'),
+        Index('ix_fotos_assinaturas_banda3', 'dia', 'banda3'),
+        Index('ix_fotos_assinaturas_sinalizadas', 'dia', 'local_aplicacao', 'duplicada_de'),
+    )
+
+    def __repr__(self):
+        return f"<FotoAssinatura(sessao_id='{self.sessao_id}', item='{self.item_key}', dhash='{self.dhash}')>"
+
+
+# === Painel de acompanhamento (agregados mantidos a cada alteração do checklist) ===
+
+class PainelLocal(Base):
+    __tablename__ = 'painel_local'
+
+    # Totais por local de aplicação e dia
+    dia = Column(Integer, primary_key=True)
+    local_aplicacao = Column(String(255), primary_key=True)  # '' quando não informado
+    sessoes = Column(Integer, nullable=False, default=0)
+    sessoes_concluidas = Column(Integer, nullable=False, default=0)
+    itens_total = Column(Integer, nullable=False, default=0)
+    itens_conferidos = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PainelLocal(dia={self.dia}, local='{self.local_aplicacao}', sessoes={self.sessoes})>"
+
+
+class PainelItem(Base):
+    __tablename__ = 'painel_item'
+
+    # Quantas sessões já conferiram cada item
+    dia = Column(Integer, primary_key=True)
+    item_key = Column(String(100), primary_key=True)
+    conferidos = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PainelItem(dia={self.dia}, item='{self.item_key}', conferidos={self.conferidos})>"
+
+
+class PainelSessao(Base):
+    __tablename__ = 'painel_sessao'
+
+    # Progresso de cada sessão (para encontrar sessões paradas sem ler os itens)
+    sessao_id = Column(String(100), primary_key=True)
+    dia = Column(Integer, primary_key=True)
+    local_aplicacao = Column(String(255), nullable=False, default='')
+    itens_conferidos = Column(Integer, nullable=False, default=0)
+    concluido = Column(Boolean, nullable=False, default=False)
+    ultima_atividade = Column(DateTime)  # None: checklist provisionado e ainda não usado
+
+    __table_args__ = (
+        Index('ix_painel_sessao_paradas', 'concluido', 'ultima_atividade'),
+    )
+
+    def __repr__(self):
+        return f"<PainelSessao(sessao_id='{self.sessao_id}', dia={self.dia}, conferidos={self.itens_conferidos})>"
+
+
+class PainelDuracao(Base):
+    __tablename__ = 'painel_duracao'
+
+    # Histograma do tempo até a conclusão do checklist (limite superior do balde, em segundos)
+    dia = Column(Integer, primary_key=True)
+    balde = Column(Integer, primary_key=True)
+    contagem = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PainelDuracao(dia={self.dia}, balde={self.balde}, contagem={self.contagem})>"
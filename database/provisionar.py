@@ -0,0 +1,93 @@
+"""
+Provisionamento em massa de checklists a partir de um roster de aplicadores (CSV ou JSON)
+
+Colunas/campos: sessao_id (obrigatório), dia (um dos dias da definição do checklist, padrão 1), aplicador_nome, local_aplicacao.
+Pode ser executado várias vezes: checklists já existentes são atualizados, nunca duplicados.
+
+Uso:
+    python -m database.provisionar roster.csv [--lote 1000]
+    python -m database.provisionar roster.json
+"""
+import csv
+import io
+import json
+import sys
+import time
+from typing import Iterable
+
+from services.definicoes import definicao_checklist
+
+from .database import PROVISIONAMENTO_LOTE, ChecklistDatabase, init_database
+
+
+def validar_linha(linha: dict, numero: int) -> dict:
+    """
+    Normaliza uma linha do roster. Levanta ValueError indicando a linha com problema
+    """
+    sessao_id = str(linha.get("sessao_id") or "").strip()
+    if not sessao_id:
+        raise ValueError(f"linha {numero}: sessao_id ausente")
+
+    dia = linha.get("dia") or 1
+    try:
+        dia = int(dia)
+    except (TypeError, ValueError):
+        raise ValueError(f"linha {numero}: dia inválido ({dia!r})")
+    if dia not in definicao_checklist.dias:
+        raise ValueError(f"linha {numero}: dia inválido ({dia})")
+
+    return {
+        "sessao_id": sessao_id,
+        "dia": dia,
+        "aplicador_nome": (str(linha.get("aplicador_nome") or "").strip() or None),
+        "local_aplicacao": (str(linha.get("local_aplicacao") or "").strip() or None),
+    }
+
+
+def validar_roster(linhas: Iterable[dict]) -> list:
+    return [validar_linha(linha, numero) for numero, linha in enumerate(linhas, start=1)]
+
+
+def ler_csv(texto: str) -> list:
+    # Aceita separador vírgula ou ponto e vírgula (padrão do Excel em português)
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=",;")
+    except csv.Error:
+        dialeto = csv.excel
+    return validar_roster(csv.DictReader(io.StringIO(texto), dialect=dialeto))
+
+
+def ler_json(texto: str) -> list:
+    dados = json.loads(texto)
+    if isinstance(dados, dict):
+        dados = dados.get("checklists", [])
+    if not isinstance(dados, list):
+        raise ValueError("o JSON deve ser uma lista de checklists ou {\"checklists\": [...]}")
+    return validar_roster(dados)
+
+
+def ler_roster(caminho: str) -> list:
+    with open(caminho, encoding="utf-8-sig") as arquivo:
+        texto = arquivo.read()
+    if caminho.lower().endswith(".json"):
+        return ler_json(texto)
+    return ler_csv(texto)
+
+
+def provisionar_arquivo(caminho: str, tamanho_lote: int = PROVISIONAMENTO_LOTE) -> dict:
+    init_database()
+    inicio = time.perf_counter()
+    linhas = ler_roster(caminho)
+    resultado = ChecklistDatabase.provisionar(linhas, tamanho_lote)
+    duracao = time.perf_counter() - inicio
+    print(f"✅ {len(linhas)} linha(s) em {duracao:.1f}s: "
+          f"{resultado['criados']} checklist(s) criado(s), {resultado['atualizados']} atualizado(s)")
+    return resultado
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    lote = int(sys.argv[sys.argv.index("--lote") + 1]) if "--lote" in sys.argv else PROVISIONAMENTO_LOTE
+    provisionar_arquivo(sys.argv[1], lote)
@@ -0,0 +1,17 @@
+from typing import List, Literal, Union
+
+from pydantic import BaseModel
+
+
+# Modelos de ações possíveis
+class MarcarConferido(BaseModel):
+    action: Literal["marcar_conferido"]
+    itens: List[str]
+
+class VerificarFaltantes(BaseModel):
+    action: Literal["verificar_faltantes"]
+
+class ReiniciarChecklist(BaseModel):
+    action: Literal["reiniciar_checklist"]
+
+AcoesChecklist = Union[MarcarConferido, VerificarFaltantes, ReiniciarChecklist]
@@ -0,0 +1,248 @@
+"""
+Cache das interpretações do LLM: LRU em memória apoiado na tabela cache_interpretacao
+
+Pré-carregar o cache a partir do tráfego já recebido (tabela fila_webhook):
+    python -m services.cache_llm --aquecer [--limite 500]
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+
+from database.database import get_db, insert_dialeto
+from database.models import CacheInterpretacao, EventoWebhook
+from services.definicoes import normalizar_texto
+
+# === Configuração (variáveis de ambiente) ===
+CACHE_LLM_MAX_MEMORIA = int(os.getenv("CACHE_LLM_MAX_MEMORIA", "5000"))
+CACHE_LLM_MAX_BANCO = int(os.getenv("CACHE_LLM_MAX_BANCO", "100000"))
+CACHE_LLM_TTL = int(os.getenv("CACHE_LLM_TTL", str(7 * 24 * 3600)))  # segundos
+
+# A cada quantas gravações o banco é podado (TTL e tamanho)
+INTERVALO_LIMPEZA = 500
+
+logger = logging.getLogger(__name__)
+
+
+class CacheLLM:
+    """
+    Cache de duas camadas (memória + SQLite) para as respostas do LLM.
+    A chave considera o texto normalizado, o modelo e a versão do prompt:
+    trocar qualquer um deles invalida as entradas antigas.
+    """
+
+    def __init__(
+        self,
+        modelo: str,
+        versao_prompt: str,
+        max_memoria: int = CACHE_LLM_MAX_MEMORIA,
+        max_banco: int = CACHE_LLM_MAX_BANCO,
+        ttl: int = CACHE_LLM_TTL,
+    ):
+        self.modelo = modelo
+        self.versao_prompt = versao_prompt
+        self.max_memoria = max_memoria
+        self.max_banco = max_banco
+        self.ttl = ttl
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()  # chave -> (expira_em, resposta)
+        self._lock = threading.Lock()
+        self._aquecido = False
+        self._gravacoes = 0
+        # Contadores
+        self.acertos_memoria = 0
+        self.acertos_banco = 0
+        self.falhas = 0
+
+    def chave(self, texto: str) -> str:
+        base = f"{self.modelo}|{self.versao_prompt}|{normalizar_texto(texto)}"
+        return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+    # === Leitura e escrita ===
+
+    def obter(self, texto: str) -> Optional[dict]:
+        """
+        Retorna a resposta em cache (dict da ação) ou None
+        """
+        if not self._aquecido:
+            self.aquecer()
+        chave = self.chave(texto)
+        agora = time.time()
+
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                expira_em, resposta = entrada
+                if expira_em > agora:
+                    self._memoria.move_to_end(chave)
+                    self.acertos_memoria += 1
+                    return resposta
+                del self._memoria[chave]
+
+        limite = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with get_db() as db:
+            registro = db.query(CacheInterpretacao).filter(
+                CacheInterpretacao.chave == chave,
+                CacheInterpretacao.criado_em >= limite,
+            ).first()
+            if registro is None:
+                with self._lock:
+                    self.falhas += 1
+                return None
+            registro.acessos += 1
+            registro.acessado_em = datetime.utcnow()
+            resposta = json.loads(registro.resposta)
+            expira_em = agora + self.ttl - (datetime.utcnow() - registro.criado_em).total_seconds()
+
+        with self._lock:
+            self.acertos_banco += 1
+            self._guardar_memoria(chave, expira_em, resposta)
+        return resposta
+
+    def guardar(self, texto: str, resposta: dict):
+        chave = self.chave(texto)
+        with self._lock:
+            self._guardar_memoria(chave, time.time() + self.ttl, resposta)
+            self._gravacoes += 1
+            limpar = self._gravacoes % INTERVALO_LIMPEZA == 0
+
+        agora = datetime.utcnow()
+        dados = {
+            "texto_normalizado": normalizar_texto(texto),
+            "modelo": self.modelo,
+            "versao_prompt": self.versao_prompt,
+            "resposta": json.dumps(resposta, ensure_ascii=False),
+            "criado_em": agora,
+            "acessado_em": agora,
+        }
+        # Upsert: o mesmo texto pode ser interpretado por dois workers ao mesmo tempo
+        inserir = insert_dialeto()(CacheInterpretacao.__table__).values(chave=chave, acessos=0, **dados)
+        with get_db() as db:
+            db.execute(inserir.on_conflict_do_update(index_elements=["chave"], set_=dados))
+
+        if limpar:
+            self.limpar()
+
+    def _guardar_memoria(self, chave: str, expira_em: float, resposta: dict):
+        # Chamado com self._lock adquirido
+        self._memoria[chave] = (expira_em, resposta)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    # === Manutenção ===
+
+    def aquecer(self, limite: Optional[int] = None) -> int:
+        """
+        Carrega para a memória as entradas mais acessadas do banco
+        """
+        self._aquecido = True
+        limite = limite or self.max_memoria
+        validade = datetime.utcnow() - timedelta(seconds=self.ttl)
+        try:
+            with get_db() as db:
+                registros = (
+                    db.query(CacheInterpretacao.chave, CacheInterpretacao.resposta, CacheInterpretacao.criado_em)
+                    .filter(
+                        CacheInterpretacao.modelo == self.modelo,
+                        CacheInterpretacao.versao_prompt == self.versao_prompt,
+                        CacheInterpretacao.criado_em >= validade,
+                    )
+                    .order_by(CacheInterpretacao.acessos.desc())
+                    .limit(limite)
+                    .all()
+                )
+        except Exception as e:
+            logger.warning("⚠️ Não foi possível aquecer o cache do LLM: %s", e)
+            return 0
+
+        agora = time.time()
+        with self._lock:
+            # Os mais acessados entram por último (ficam no fim da LRU)
+            for chave, resposta, criado_em in reversed(registros):
+                expira_em = agora + self.ttl - (datetime.utcnow() - criado_em).total_seconds()
+                self._guardar_memoria(chave, expira_em, json.loads(resposta))
+        return len(registros)
+
+    def limpar(self) -> int:
+        """
+        Remove do banco as entradas expiradas e as menos acessadas além de max_banco
+        """
+        validade = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with get_db() as db:
+            removidas = db.query(CacheInterpretacao).filter(
+                CacheInterpretacao.criado_em < validade
+            ).delete(synchronize_session=False)
+
+            excedente = db.query(CacheInterpretacao).count() - self.max_banco
+            if excedente > 0:
+                antigas = (
+                    select(CacheInterpretacao.chave)
+                    .order_by(CacheInterpretacao.acessado_em)
+                    .limit(excedente)
+                )
+                removidas += db.query(CacheInterpretacao).filter(
+                    CacheInterpretacao.chave.in_(antigas)
+                ).delete(synchronize_session=False)
+        return removidas
+
+    def metricas(self) -> dict:
+        with self._lock:
+            acertos = self.acertos_memoria + self.acertos_banco
+            total = acertos + self.falhas
+            return {
+                "entradas_memoria": len(self._memoria),
+                "acertos_memoria": self.acertos_memoria,
+                "acertos_banco": self.acertos_banco,
+                "falhas": self.falhas,
+                "taxa_acerto": round(acertos / total, 3) if total else None,
+            }
+
+
+def textos_do_trafego(limite: int = 500) -> list:
+    """
+    Mensagens de texto mais frequentes entre os eventos já recebidos pelo webhook
+    """
+    contagem = Counter()
+    originais = {}
+    with get_db() as db:
+        for (payload,) in db.query(EventoWebhook.payload).yield_per(500):
+            mensagem = json.loads(payload).get("data", {}).get("message", {})
+            texto = mensagem.get("conversation")
+            if not texto:
+                continue
+            normalizado = normalizar_texto(texto)
+            contagem[normalizado] += 1
+            originais.setdefault(normalizado, texto.strip().lower())
+    return [originais[normalizado] for normalizado, _ in contagem.most_common(limite)]
+
+
+def aquecer_com_trafego(limite: int = 500):
+    """
+    Interpreta (e guarda em cache) as mensagens mais frequentes do tráfego passado
+    """
+    from app import cache_interpretacao, interpretar_mensagem_usuario
+
+    textos = textos_do_trafego(limite)
+    novos = 0
+    for texto in textos:
+        if cache_interpretacao.obter(texto) is None:
+            interpretar_mensagem_usuario(texto)
+            novos += 1
+    print(f"🔥 Cache aquecido: {len(textos)} mensagem(ns) frequentes, {novos} interpretada(s) agora")
+    print(cache_interpretacao.metricas())
+
+
+if __name__ == "__main__":
+    if "--aquecer" in sys.argv:
+        limite = int(sys.argv[sys.argv.index("--limite") + 1]) if "--limite" in sys.argv else 500
+        aquecer_com_trafego(limite)
+    else:
+        print(__doc__)
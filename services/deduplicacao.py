@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from database.database import get_db, insert_dialeto
+from database.models import MensagemRecebida
+
+# === Configuração (variáveis de ambiente) ===
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", str(24 * 3600)))  # segundos lembrando cada mensagem
+DEDUP_MAX_MEMORIA = int(os.getenv("DEDUP_MAX_MEMORIA", "20000"))
+
+# A cada quantos registros o banco é podado (TTL)
+INTERVALO_LIMPEZA = 1000
+
+
+class Deduplicador:
+    """
+    Reconhece reentregas do mesmo evento (remoteJid + data.key.id).
+    Consulta primeiro um conjunto limitado em memória (LRU) e depois a tabela
+    mensagens_recebidas, onde o INSERT ... ON CONFLICT DO NOTHING garante que só
+    um worker/processo aceita cada mensagem.
+    """
+
+    def __init__(self, ttl: int = DEDUP_TTL, max_memoria: int = DEDUP_MAX_MEMORIA):
+        self.ttl = ttl
+        self.max_memoria = max_memoria
+        self._memoria: "OrderedDict[tuple, float]" = OrderedDict()  # chave -> expira_em
+        self._lock = threading.Lock()
+        self._registros = 0
+        # Contadores
+        self.novas = 0
+        self.duplicadas_memoria = 0
+        self.duplicadas_banco = 0
+
+    @staticmethod
+    def chave(dados: dict) -> Optional[tuple]:
+        """
+        (remoteJid, id da mensagem) do evento, ou None se o evento não traz o id
+        """
+        chave_msg = dados.get("data", {}).get("key", {})
+        if not chave_msg.get("id") or not chave_msg.get("remoteJid"):
+            return None
+        return chave_msg["remoteJid"], str(chave_msg["id"])
+
+    def registrar(self, dados: dict) -> bool:
+        """
+        Registra a mensagem. Retorna False se ela já foi recebida (reentrega)
+        """
+        chave = self.chave(dados)
+        if chave is None:
+            return True
+        agora = time.time()
+
+        with self._lock:
+            expira_em = self._memoria.get(chave)
+            if expira_em is not None and expira_em > agora:
+                self._memoria.move_to_end(chave)
+                self.duplicadas_memoria += 1
+                return False
+
+        if not self._registrar_banco(chave):
+            with self._lock:
+                self.duplicadas_banco += 1
+                self._lembrar(chave, agora + self.ttl)
+            return False
+
+        with self._lock:
+            self.novas += 1
+            self._lembrar(chave, agora + self.ttl)
+            self._registros += 1
+            limpar = self._registros % INTERVALO_LIMPEZA == 0
+        if limpar:
+            self.limpar()
+        return True
+
+    def _registrar_banco(self, chave: tuple) -> bool:
+        remote_jid, mensagem_id = chave
+        agora = datetime.utcnow()
+        with get_db() as db:
+            inserir = insert_dialeto()(MensagemRecebida.__table__).values(
+                remote_jid=remote_jid, mensagem_id=mensagem_id, recebido_em=agora,
+            ).on_conflict_do_nothing(index_elements=["remote_jid", "mensagem_id"])
+            if db.execute(inserir).rowcount == 1:
+                return True
+            # Já registrada: só vale como nova se o registro anterior expirou
+            return db.query(MensagemRecebida).filter(
+                MensagemRecebida.remote_jid == remote_jid,
+                MensagemRecebida.mensagem_id == mensagem_id,
+                MensagemRecebida.recebido_em < agora - timedelta(seconds=self.ttl),
+            ).update({"recebido_em": agora}, synchronize_session=False) == 1
+
+    def _lembrar(self, chave: tuple, expira_em: float):
+        # Chamado com self._lock adquirido
+        self._memoria[chave] = expira_em
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def esquecer(self, dados: dict):
+        """
+        Desfaz o registro (o evento não chegou a ser aceito): a próxima reentrega será processada
+        """
+        chave = self.chave(dados)
+        if chave is None:
+            return
+        with self._lock:
+            self._memoria.pop(chave, None)
+        with get_db() as db:
+            db.query(MensagemRecebida).filter(
+                MensagemRecebida.remote_jid == chave[0],
+                MensagemRecebida.mensagem_id == chave[1],
+            ).delete(synchronize_session=False)
+
+    def limpar(self) -> int:
+        """
+        Remove do banco os registros mais antigos que o TTL
+        """
+        limite = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with get_db() as db:
+            return db.query(MensagemRecebida).filter(
+                MensagemRecebida.recebido_em < limite
+            ).delete(synchronize_session=False)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas_memoria": len(self._memoria),
+                "novas": self.novas,
+                "duplicadas_memoria": self.duplicadas_memoria,
+                "duplicadas_banco": self.duplicadas_banco,
+            }
+
+
+# Instância compartilhada pela aplicação
+deduplicador = Deduplicador()
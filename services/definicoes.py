@@ -0,0 +1,240 @@
+"""
+Definição dos checklists (itens de cada dia, rótulos, aliases e itens opcionais)
+
+O arquivo versionado (YAML ou JSON, ver definicoes/checklist_cebraspe.yaml) é lido e compilado
+uma única vez, na importação, em um índice imutável: posição de cada item, alias -> item,
+rótulos de exibição e colunas do formato antigo. Handlers e banco só fazem consultas O(1) nele;
+um novo dia ou tipo de prova é só um novo arquivo (CHECKLIST_DEFINICAO), sem mudar o código.
+"""
+import json
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+import yaml
+
+# === Configuração (variáveis de ambiente) ===
+CHECKLIST_DEFINICAO = os.getenv(
+    "CHECKLIST_DEFINICAO",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "definicoes", "checklist_cebraspe.yaml"),
+)
+
+# Palavras de ligação ignoradas ao comparar legendas e aliases ("lista de presença" = "lista presença")
+CONECTIVOS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas"}
+
+PADRAO_CHAVE = re.compile(r"[a-z0-9]+(_[a-z0-9]+)*")
+
+
+# === Normalização de texto ===
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Minúsculas, sem acentos e pontuação, espaços colapsados e "dia 1" -> "dia1"
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^a-z0-9]+", " ", texto)
+    texto = re.sub(r"\bdia (\d)\b", r"dia\1", texto)
+    return " ".join(texto.split())
+
+
+def forma_canonica(texto: str) -> str:
+    """
+    Texto normalizado sem os conectivos: a forma usada nas chaves do índice de aliases
+    """
+    return " ".join(t for t in normalizar_texto(texto).split() if t not in CONECTIVOS)
+
+
+def _singular(palavra: str) -> str:
+    if palavra.endswith("eis"):
+        return palavra[:-3] + "el"
+    if palavra.endswith("ais"):
+        return palavra[:-3] + "al"
+    if palavra.endswith("s") and len(palavra) > 3:
+        return palavra[:-1]
+    return palavra
+
+
+def formas_item(chave: str) -> List[str]:
+    """
+    Formas pelas quais um item pode ser citado a partir da chave (com/sem dia, singular)
+    """
+    tokens = chave.split("_")
+    sem_dia = [t for t in tokens if not re.fullmatch(r"dia\d+", t)]
+    formas = {" ".join(tokens), " ".join(sem_dia)}
+    formas |= {" ".join(_singular(t) for t in forma.split()) for forma in list(formas)}
+    return [forma for forma in formas if forma]
+
+
+# === Índice compilado ===
+
+@dataclass(frozen=True)
+class ItemChecklist:
+    chave: str
+    rotulo: str
+    posicao: int
+    opcional: bool
+    palavras: Tuple[str, ...]  # palavras esperadas no texto da foto (verificação por OCR)
+    # Colunas do formato antigo (<item>_presente, <item>_foto, <item>_observacao)
+    colunas: Tuple[str, str, str]
+
+
+@dataclass(frozen=True)
+class ChecklistDia:
+    dia: int
+    itens: Tuple[ItemChecklist, ...]
+    chaves: Tuple[str, ...]  # todos os itens, na ordem da definição
+    fluxo: Tuple[str, ...]  # itens obrigatórios, na ordem do fluxo de fotos
+    opcionais: FrozenSet[str]
+    posicao: Mapping[str, int]
+    indice_fluxo: Mapping[str, int]  # item -> índice em `fluxo` (o "indice" do estado do fluxo)
+    rotulos: Mapping[str, str]
+    aliases: Mapping[str, str]  # forma canônica -> chave
+    palavras: Mapping[str, Tuple[str, ...]]  # só os itens com palavras definidas
+    colunas: Mapping[str, Tuple[str, str, str]]
+    colunas_presenca: Tuple[str, ...]
+
+    def rotulo(self, chave: str) -> str:
+        # Itens removidos da definição ainda podem existir em checklists antigos
+        return self.rotulos.get(chave, chave)
+
+    def resolver(self, texto: str) -> Optional[str]:
+        """
+        Chave do item citado por `texto` (chave, rótulo ou alias), ou None
+        """
+        if texto in self.posicao:
+            return texto
+        return self.aliases.get(forma_canonica(texto))
+
+
+@dataclass(frozen=True)
+class DefinicaoChecklist:
+    nome: str
+    versao: int
+    origem: str
+    dias: Mapping[int, ChecklistDia]
+
+    @property
+    def primeiro_dia(self) -> int:
+        return next(iter(self.dias))
+
+    def dia(self, numero: int) -> ChecklistDia:
+        checklist = self.dias.get(numero)
+        if checklist is None:
+            raise ValueError(f"Dia {numero} não existe no checklist {self.nome} (v{self.versao})")
+        return checklist
+
+    def resumo(self) -> dict:
+        return {
+            "nome": self.nome,
+            "versao": self.versao,
+            "origem": self.origem,
+            "dias": {dia: {"itens": len(c.chaves), "opcionais": len(c.opcionais)} for dia, c in self.dias.items()},
+        }
+
+
+def _compilar_dia(dia: int, itens: list, origem: str) -> ChecklistDia:
+    if not isinstance(itens, list) or not itens:
+        raise ValueError(f"{origem}: dia {dia} sem itens")
+
+    compilados: List[ItemChecklist] = []
+    for posicao, item in enumerate(itens):
+        if not isinstance(item, dict):
+            raise ValueError(f"{origem}: dia {dia}, item {posicao + 1}: esperado um objeto com 'chave'")
+        chave = str(item.get("chave") or "")
+        if not PADRAO_CHAVE.fullmatch(chave):
+            raise ValueError(f"{origem}: dia {dia}, item {posicao + 1}: chave inválida ({chave!r})")
+        if any(c.chave == chave for c in compilados):
+            raise ValueError(f"{origem}: dia {dia}: item repetido ({chave})")
+        compilados.append(ItemChecklist(
+            chave=chave,
+            rotulo=str(item.get("rotulo") or chave.replace("_", " ").capitalize()),
+            posicao=posicao,
+            opcional=bool(item.get("opcional", False)),
+            palavras=tuple(dict.fromkeys(
+                palavra for texto in item.get("palavras") or [] for palavra in normalizar_texto(str(texto)).split()
+            )),
+            colunas=(f"{chave}_presente", f"{chave}_foto", f"{chave}_observacao"),
+        ))
+
+    fluxo = tuple(item.chave for item in compilados if not item.opcional)
+    if not fluxo:
+        raise ValueError(f"{origem}: dia {dia} sem itens obrigatórios")
+
+    # Formas derivadas da chave e do rótulo: a primeira ocorrência (na ordem do checklist) prevalece
+    aliases: Dict[str, str] = {}
+    for item in compilados:
+        for forma in [*formas_item(item.chave), item.rotulo]:
+            aliases.setdefault(forma_canonica(forma), item.chave)
+    # Aliases explícitos: conflito entre itens diferentes é erro da definição
+    explicitos: Dict[str, str] = {}
+    for item, original in zip(compilados, itens):
+        for alias in original.get("aliases") or []:
+            forma = forma_canonica(str(alias))
+            if explicitos.get(forma, item.chave) != item.chave:
+                raise ValueError(f"{origem}: dia {dia}: alias {alias!r} usado em {explicitos[forma]} e {item.chave}")
+            explicitos[forma] = item.chave
+    for forma, chave in explicitos.items():
+        aliases.setdefault(forma, chave)
+    aliases.pop("", None)
+
+    return ChecklistDia(
+        dia=dia,
+        itens=tuple(compilados),
+        chaves=tuple(item.chave for item in compilados),
+        fluxo=fluxo,
+        opcionais=frozenset(item.chave for item in compilados if item.opcional),
+        posicao=MappingProxyType({item.chave: item.posicao for item in compilados}),
+        indice_fluxo=MappingProxyType({chave: indice for indice, chave in enumerate(fluxo)}),
+        rotulos=MappingProxyType({item.chave: item.rotulo for item in compilados}),
+        aliases=MappingProxyType(aliases),
+        palavras=MappingProxyType({item.chave: item.palavras for item in compilados if item.palavras}),
+        colunas=MappingProxyType({item.chave: item.colunas for item in compilados}),
+        colunas_presenca=tuple(item.colunas[0] for item in compilados),
+    )
+
+
+def compilar_definicao(dados: dict, origem: str = "<definição>") -> DefinicaoChecklist:
+    """
+    Valida a definição lida do arquivo e monta o índice. Levanta ValueError indicando o problema
+    """
+    if not isinstance(dados, dict):
+        raise ValueError(f"{origem}: a definição deve ser um objeto")
+    versao = dados.get("versao")
+    if not isinstance(versao, int):
+        raise ValueError(f"{origem}: 'versao' ausente ou não inteira")
+    dias = dados.get("dias")
+    if not isinstance(dias, dict) or not dias:
+        raise ValueError(f"{origem}: 'dias' ausente ou vazio")
+
+    compilados = {}
+    for dia, conteudo in sorted(dias.items(), key=lambda par: int(par[0])):
+        try:
+            numero = int(dia)
+        except (TypeError, ValueError):
+            raise ValueError(f"{origem}: dia inválido ({dia!r})")
+        itens = conteudo.get("itens") if isinstance(conteudo, dict) else conteudo
+        compilados[numero] = _compilar_dia(numero, itens, origem)
+
+    return DefinicaoChecklist(
+        nome=str(dados.get("nome") or os.path.splitext(os.path.basename(origem))[0]),
+        versao=versao,
+        origem=origem,
+        dias=MappingProxyType(compilados),
+    )
+
+
+def carregar_definicao(caminho: str = CHECKLIST_DEFINICAO) -> DefinicaoChecklist:
+    """
+    Lê e compila um arquivo de definição (.json ou .yaml/.yml)
+    """
+    with open(caminho, encoding="utf-8") as arquivo:
+        dados = json.load(arquivo) if caminho.endswith(".json") else yaml.safe_load(arquivo)
+    return compilar_definicao(dados, caminho)
+
+
+# Instância compartilhada pela aplicação (compilada uma vez, na importação)
+definicao_checklist = carregar_definicao()
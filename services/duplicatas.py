@@ -0,0 +1,214 @@
+"""
+Detecção de fotos repetidas: a mesma foto (ou quase a mesma) enviada para itens diferentes
+só para avançar o fluxo.
+
+Cada foto recebida tem um hash perceptual (dHash de 64 bits) calculado no pool de processos
+das imagens. A busca é multi-índice: o hash é dividido em 4 faixas de 16 bits, cada uma
+indexada no banco; duas fotos a até 3 bits de distância têm pelo menos uma faixa igual, então
+só os poucos candidatos com alguma faixa igual (na mesma sessão ou local) são comparados.
+"""
+import logging
+import os
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_
+
+from database.database import get_db, insert_dialeto
+from database.models import ChecklistSessao, FotoAssinatura
+from services.eventos import barramento_eventos
+from services.fotos import ArmazemFotos, armazem_fotos, ler_ref
+from services.processamento_imagem import Image, ImageOps, ProcessadorImagens, processador_imagens
+
+# === Configuração (variáveis de ambiente) ===
+FOTO_DUPLICADA_ACAO = os.getenv("FOTO_DUPLICADA_ACAO", "sinalizar")  # sinalizar, rejeitar ou desligado
+FOTO_DUPLICADA_DISTANCIA = int(os.getenv("FOTO_DUPLICADA_DISTANCIA", "3"))  # bits (de 64); até 3 a busca é exata
+FOTO_DUPLICADA_PRAZO = float(os.getenv("FOTO_DUPLICADA_PRAZO", "5"))  # s para calcular o hash
+
+BANDAS = (FotoAssinatura.banda0, FotoAssinatura.banda1, FotoAssinatura.banda2, FotoAssinatura.banda3)
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_dhash(armazem: ArmazemFotos, hash_foto: str) -> int:
+    """
+    Executada no pool de processos: foto em tons de cinza reduzida a 9x8; cada bit indica
+    se um pixel é mais claro que o vizinho da direita
+    """
+    with armazem.abrir(hash_foto) as arquivo:
+        imagem = Image.open(arquivo)
+        imagem.draft("L", (72, 64))  # JPEG: decodifica já reduzida
+        imagem = ImageOps.exif_transpose(imagem).convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = imagem.tobytes()
+    valor = 0
+    for linha in range(8):
+        for coluna in range(8):
+            valor = (valor << 1) | (pixels[linha * 9 + coluna] > pixels[linha * 9 + coluna + 1])
+    return valor
+
+
+def bandas(valor: int) -> List[int]:
+    return [(valor >> (16 * indice)) & 0xFFFF for indice in range(len(BANDAS))]
+
+
+def distancia(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass(frozen=True)
+class FotoParecida:
+    sessao_id: str
+    item: str
+    distancia: int
+    mesma_sessao: bool
+
+
+class DetectorDuplicatas:
+    """
+    Calcula o hash das fotos recebidas, procura fotos parecidas da mesma sessão ou do mesmo
+    local (no mesmo dia) e registra as aceitas. As repetidas são sinalizadas ou recusadas
+    """
+
+    def __init__(self, processador: ProcessadorImagens = processador_imagens, armazem: ArmazemFotos = armazem_fotos,
+                 acao: str = FOTO_DUPLICADA_ACAO, distancia_maxima: int = FOTO_DUPLICADA_DISTANCIA,
+                 prazo: float = FOTO_DUPLICADA_PRAZO):
+        self.processador = processador
+        self.armazem = armazem
+        self.acao = acao
+        self.distancia_maxima = distancia_maxima
+        self.prazo = prazo
+
+    @property
+    def habilitado(self) -> bool:
+        return self.acao in ("sinalizar", "rejeitar") and Image is not None
+
+    @property
+    def rejeita(self) -> bool:
+        return self.acao == "rejeitar"
+
+    def verificar(self, sessao_id: str, dia: int, fotos: Dict[str, str]) -> Dict[str, FotoParecida]:
+        """
+        Verifica as fotos {item: foto_ref} de uma sessão, na ordem recebida. Retorna {item: foto parecida}
+        das repetidas; as demais (e as sinalizadas) ficam registradas para as próximas buscas.
+        Se o hash não puder ser calculado a tempo, a foto é aceita sem verificação
+        """
+        if not self.habilitado or not fotos:
+            return {}
+        assinaturas = self._assinaturas({item: ler_ref(foto_ref) for item, foto_ref in fotos.items()})
+
+        parecidas = {}
+        with get_db() as db:
+            local = db.query(ChecklistSessao.local_aplicacao).filter(
+                ChecklistSessao.sessao_id == sessao_id, ChecklistSessao.dia == dia,
+            ).scalar() or ''
+            for item, (foto_hash, valor) in assinaturas.items():
+                parecida = self.buscar(db, sessao_id, dia, local, item, valor)
+                if parecida is not None:
+                    parecidas[item] = parecida
+                    if self.rejeita:
+                        continue
+                self._registrar(db, sessao_id, dia, local, item, foto_hash, valor, parecida)
+
+        for item, parecida in parecidas.items():
+            logger.warning("🔁 Foto repetida", extra={
+                "sessao_id": sessao_id, "dia": dia, "item": item, "acao": self.acao,
+                "parecida": f"{parecida.sessao_id}/{parecida.item}", "distancia": parecida.distancia,
+            })
+            try:
+                barramento_eventos.publicar(
+                    "foto_duplicada", sessao_id=sessao_id, dia=dia, local_aplicacao=local, item=item,
+                    duplicada_de=f"{parecida.sessao_id}/{parecida.item}", distancia=parecida.distancia,
+                    recusada=self.rejeita,
+                )
+            except Exception as e:
+                logger.warning("⚠️ Erro ao publicar evento foto_duplicada: %s", e)
+        return parecidas
+
+    def _assinaturas(self, refs: dict) -> dict:
+        """
+        {item: (sha256, dhash)}: reaproveita o hash de fotos já vistas e calcula os demais em paralelo
+        """
+        hashes = {item: ref.hash for item, ref in refs.items() if ref is not None}
+        with get_db() as db:
+            conhecidos = dict(
+                db.query(FotoAssinatura.foto_hash, FotoAssinatura.dhash)
+                .filter(FotoAssinatura.foto_hash.in_(set(hashes.values())))
+                .distinct()
+            )
+        futuros: Dict[str, Future] = {
+            item: self.processador.executar(calcular_dhash, self.armazem, foto_hash)
+            for item, foto_hash in hashes.items() if foto_hash not in conhecidos
+        }
+
+        assinaturas = {}
+        for item, foto_hash in hashes.items():
+            if foto_hash in conhecidos:
+                assinaturas[item] = (foto_hash, int(conhecidos[foto_hash], 16))
+                continue
+            try:
+                assinaturas[item] = (foto_hash, futuros[item].result(timeout=self.prazo))
+            except Exception as e:
+                logger.warning("⚠️ Foto %s aceita sem verificar repetição: %s", foto_hash[:12], str(e) or type(e).__name__)
+        return assinaturas
+
+    def buscar(self, db, sessao_id: str, dia: int, local_aplicacao: str, item: str, valor: int) -> Optional[FotoParecida]:
+        """
+        Foto mais parecida (até `distancia_maxima` bits) da sessão ou do local, fora o próprio item
+        """
+        escopo = FotoAssinatura.sessao_id == sessao_id
+        if local_aplicacao:
+            escopo = or_(escopo, FotoAssinatura.local_aplicacao == local_aplicacao)
+        candidatos = (
+            db.query(FotoAssinatura.sessao_id, FotoAssinatura.item_key, FotoAssinatura.dhash)
+            .filter(
+                # Cada termo usa um dos índices (dia, bandaN)
+                or_(*(and_(FotoAssinatura.dia == dia, coluna == faixa) for coluna, faixa in zip(BANDAS, bandas(valor)))),
+                escopo,
+                ~and_(FotoAssinatura.sessao_id == sessao_id, FotoAssinatura.item_key == item),
+            )
+        )
+
+        melhor = None
+        for outra_sessao, outro_item, dhash in candidatos:
+            bits = distancia(valor, int(dhash, 16))
+            if bits <= self.distancia_maxima and (melhor is None or bits < melhor.distancia):
+                melhor = FotoParecida(outra_sessao, outro_item, bits, outra_sessao == sessao_id)
+        return melhor
+
+    @staticmethod
+    def _registrar(db, sessao_id: str, dia: int, local_aplicacao: str, item: str, foto_hash: str, valor: int,
+                   parecida: Optional[FotoParecida]):
+        dados = {
+            "local_aplicacao": local_aplicacao, "foto_hash": foto_hash, "dhash": f"{valor:016x}",
+            **{coluna.key: faixa for coluna, faixa in zip(BANDAS, bandas(valor))},
+            "duplicada_de": f"{parecida.sessao_id}/{parecida.item}" if parecida else None,
+            "distancia": parecida.distancia if parecida else None,
+        }
+        inserir = insert_dialeto()(FotoAssinatura.__table__).values(sessao_id=sessao_id, dia=dia, item_key=item, **dados)
+        db.execute(inserir.on_conflict_do_update(index_elements=["sessao_id", "dia", "item_key"], set_=dados))
+
+    @staticmethod
+    def listar_sinalizadas(dia: int, local_aplicacao: Optional[str] = None) -> List[dict]:
+        """
+        Fotos registradas apesar de parecidas com outra (para revisão)
+        """
+        with get_db() as db:
+            consulta = db.query(
+                FotoAssinatura.sessao_id, FotoAssinatura.local_aplicacao, FotoAssinatura.item_key,
+                FotoAssinatura.duplicada_de, FotoAssinatura.distancia, FotoAssinatura.criado_em,
+            ).filter(FotoAssinatura.dia == dia, FotoAssinatura.duplicada_de.isnot(None))
+            if local_aplicacao is not None:
+                consulta = consulta.filter(FotoAssinatura.local_aplicacao == local_aplicacao)
+            return [
+                {
+                    "sessao_id": sessao_id, "local_aplicacao": local or None, "item": item,
+                    "duplicada_de": duplicada_de, "distancia": bits,
+                    "registrada_em": criado_em.isoformat() if criado_em else None,
+                }
+                for sessao_id, local, item, duplicada_de, bits, criado_em in consulta.order_by(FotoAssinatura.id)
+            ]
+
+
+# Instância compartilhada pela aplicação
+detector_duplicatas = DetectorDuplicatas()
@@ -0,0 +1,164 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from database.database import get_db
+from database.models import EstadoFluxo
+
+# Backend do estado do fluxo: "banco" (padrão, durável) ou "memoria" (um único processo)
+ESTADO_FLUXO_BACKEND = os.getenv("ESTADO_FLUXO_BACKEND", "banco")
+
+
+class ConflitoEstado(Exception):
+    """
+    O estado da sessão foi alterado por outro worker entre a leitura e a escrita
+    """
+
+
+class FlowStateStore(ABC):
+    """
+    Interface do armazenamento do estado do fluxo: {"dia", "indice", "versao"} por sessão.
+    A versão permite atualizações atômicas (compare-and-set) entre workers e processos e nunca
+    volta atrás, nem depois de remover a sessão: quem leu o estado antigo não vence a escrita
+    no estado recriado.
+    """
+
+    @abstractmethod
+    def obter(self, sessao_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def definir(self, sessao_id: str, dia: int, indice: int = 0) -> dict:
+        """
+        Grava o estado incondicionalmente (iniciar / reiniciar checklist)
+        """
+        ...
+
+    @abstractmethod
+    def comparar_e_definir(self, sessao_id: str, versao_esperada: int, dia: int, indice: int) -> bool:
+        """
+        Grava o estado apenas se a versão atual for a esperada. Retorna False em caso de conflito
+        """
+        ...
+
+    @abstractmethod
+    def remover(self, sessao_id: str, versao_esperada: Optional[int] = None) -> bool:
+        ...
+
+
+class FlowStateStoreMemoria(FlowStateStore):
+    """
+    Estado em memória, protegido por lock (um único processo)
+    """
+
+    def __init__(self):
+        self._estados: Dict[str, dict] = {}
+        # Última versão das sessões removidas (continua a contagem se a sessão recomeçar)
+        self._removidas: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def obter(self, sessao_id: str) -> Optional[dict]:
+        with self._lock:
+            estado = self._estados.get(sessao_id)
+            return dict(estado) if estado else None
+
+    def definir(self, sessao_id: str, dia: int, indice: int = 0) -> dict:
+        with self._lock:
+            anterior = self._estados.get(sessao_id, {}).get("versao") or self._removidas.pop(sessao_id, 0)
+            self._estados[sessao_id] = {"dia": dia, "indice": indice, "versao": anterior + 1}
+            return dict(self._estados[sessao_id])
+
+    def comparar_e_definir(self, sessao_id: str, versao_esperada: int, dia: int, indice: int) -> bool:
+        with self._lock:
+            atual = self._estados.get(sessao_id)
+            if atual is None or atual["versao"] != versao_esperada:
+                return False
+            self._estados[sessao_id] = {"dia": dia, "indice": indice, "versao": versao_esperada + 1}
+            return True
+
+    def remover(self, sessao_id: str, versao_esperada: Optional[int] = None) -> bool:
+        with self._lock:
+            atual = self._estados.get(sessao_id)
+            if atual is None or (versao_esperada is not None and atual["versao"] != versao_esperada):
+                return False
+            del self._estados[sessao_id]
+            self._removidas[sessao_id] = atual["versao"] + 1
+            return True
+
+
+class FlowStateStoreBanco(FlowStateStore):
+    """
+    Estado na tabela estado_fluxo: sobrevive a reinícios e é compartilhado entre processos
+    """
+
+    def obter(self, sessao_id: str) -> Optional[dict]:
+        with get_db() as db:
+            linha = (
+                db.query(EstadoFluxo.dia, EstadoFluxo.indice, EstadoFluxo.versao)
+                .filter(EstadoFluxo.sessao_id == sessao_id, EstadoFluxo.removido_em.is_(None))
+                .first()
+            )
+            if linha is None:
+                return None
+            return {"dia": linha.dia, "indice": linha.indice, "versao": linha.versao}
+
+    def definir(self, sessao_id: str, dia: int, indice: int = 0) -> dict:
+        for _ in range(3):
+            with get_db() as db:
+                # Também recria uma sessão removida, a partir da última versão dela
+                atualizados = db.query(EstadoFluxo).filter(EstadoFluxo.sessao_id == sessao_id).update({
+                    "dia": dia,
+                    "indice": indice,
+                    "versao": EstadoFluxo.versao + 1,
+                    "removido_em": None,
+                    "atualizado_em": datetime.utcnow(),
+                }, synchronize_session=False)
+                if atualizados:
+                    db.commit()
+                    return self.obter(sessao_id)
+            try:
+                with get_db() as db:
+                    db.add(EstadoFluxo(sessao_id=sessao_id, dia=dia, indice=indice, versao=1))
+                return {"dia": dia, "indice": indice, "versao": 1}
+            except IntegrityError:
+                # Outro processo inseriu a sessão ao mesmo tempo: tenta o UPDATE de novo
+                continue
+        raise ConflitoEstado(f"Não foi possível gravar o estado da sessão {sessao_id}")
+
+    def comparar_e_definir(self, sessao_id: str, versao_esperada: int, dia: int, indice: int) -> bool:
+        with get_db() as db:
+            atualizados = db.query(EstadoFluxo).filter(
+                EstadoFluxo.sessao_id == sessao_id,
+                EstadoFluxo.versao == versao_esperada,
+                EstadoFluxo.removido_em.is_(None),
+            ).update({
+                "dia": dia,
+                "indice": indice,
+                "versao": versao_esperada + 1,
+                "atualizado_em": datetime.utcnow(),
+            }, synchronize_session=False)
+            return atualizados == 1
+
+    def remover(self, sessao_id: str, versao_esperada: Optional[int] = None) -> bool:
+        with get_db() as db:
+            consulta = db.query(EstadoFluxo).filter(
+                EstadoFluxo.sessao_id == sessao_id, EstadoFluxo.removido_em.is_(None),
+            )
+            if versao_esperada is not None:
+                consulta = consulta.filter(EstadoFluxo.versao == versao_esperada)
+            agora = datetime.utcnow()
+            return consulta.update({
+                "versao": EstadoFluxo.versao + 1,
+                "removido_em": agora,
+                "atualizado_em": agora,
+            }, synchronize_session=False) == 1
+
+
+def criar_flow_state_store(backend: str = ESTADO_FLUXO_BACKEND) -> FlowStateStore:
+    if backend == "memoria":
+        return FlowStateStoreMemoria()
+    return FlowStateStoreBanco()
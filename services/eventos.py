@@ -0,0 +1,255 @@
+"""
+Barramento de eventos das alterações do checklist (pub/sub em processo) e broker local opcional
+
+Com vários processos da aplicação, rode o broker e aponte EVENTOS_BROKER para ele:
+    python -m services.eventos --broker [--porta 5055]
+    EVENTOS_BROKER=127.0.0.1:5055 python app.py
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# === Configuração (variáveis de ambiente) ===
+EVENTOS_HISTORICO = int(os.getenv("EVENTOS_HISTORICO", "1000"))  # eventos guardados para Last-Event-ID
+EVENTOS_BUFFER_ASSINANTE = int(os.getenv("EVENTOS_BUFFER_ASSINANTE", "200"))
+EVENTOS_MAX_ASSINANTES = int(os.getenv("EVENTOS_MAX_ASSINANTES", "5000"))
+EVENTOS_BROKER = os.getenv("EVENTOS_BROKER", "")  # host:porta; vazio = somente neste processo
+
+FILTROS = ("sessao_id", "local_aplicacao", "dia")
+
+logger = logging.getLogger(__name__)
+
+
+class Assinatura:
+    """
+    Assinante do barramento: um buffer limitado e um sinal. Não usa thread própria;
+    o consumidor espera com receber() (threads/gevent) ou receber_async() (asyncio)
+    """
+
+    def __init__(self, filtro: dict, tamanho: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.filtro = {chave: valor for chave, valor in filtro.items() if valor is not None}
+        self._fila = deque(maxlen=tamanho)
+        self._lock = threading.Lock()
+        self._sinal = threading.Event()
+        self._loop = loop
+        self._sinal_async = asyncio.Event() if loop is not None else None
+        self.descartados = 0  # eventos perdidos por consumidor lento
+
+    def aceita(self, evento: dict) -> bool:
+        return all(evento.get(chave) == valor for chave, valor in self.filtro.items())
+
+    def _entregar(self, evento: dict):
+        with self._lock:
+            if len(self._fila) == self._fila.maxlen:
+                self.descartados += 1
+            self._fila.append(evento)
+            self._sinal.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._sinal_async.set)
+
+    def _retirar(self) -> List[dict]:
+        with self._lock:
+            eventos = list(self._fila)
+            self._fila.clear()
+            self._sinal.clear()
+            return eventos
+
+    def receber(self, timeout: float) -> List[dict]:
+        """
+        Espera até `timeout` segundos por eventos. Retorna [] se nada chegou
+        """
+        self._sinal.wait(timeout)
+        return self._retirar()
+
+    async def receber_async(self, timeout: float) -> List[dict]:
+        try:
+            await asyncio.wait_for(self._sinal_async.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._sinal_async.clear()
+        return self._retirar()
+
+
+class BarramentoEventos:
+    """
+    Pub/sub em processo. Com EVENTOS_BROKER configurado, os eventos publicados passam
+    pelo broker e chegam aos assinantes de todos os processos (inclusive este)
+    """
+
+    def __init__(self, historico: int = EVENTOS_HISTORICO, max_assinantes: int = EVENTOS_MAX_ASSINANTES):
+        self.max_assinantes = max_assinantes
+        self._assinantes: List[Assinatura] = []
+        self._historico = deque(maxlen=historico)
+        self._sequencia = 0
+        self._lock = threading.Lock()
+        self._broker: Optional["ClienteBroker"] = None
+        self.publicados = 0
+
+    def conectar_broker(self, endereco: str):
+        host, porta = endereco.rsplit(":", 1)
+        self._broker = ClienteBroker(host, int(porta), self._entregar)
+        self._broker.iniciar()
+
+    # === Publicação ===
+
+    def publicar(self, tipo: str, sessao_id: Optional[str] = None, dia: Optional[int] = None,
+                 local_aplicacao: Optional[str] = None, **dados):
+        evento = {
+            "tipo": tipo,
+            "sessao_id": sessao_id,
+            "dia": dia,
+            "local_aplicacao": local_aplicacao or None,
+            "dados": dados,
+            "em": datetime.utcnow().isoformat(),
+        }
+        self.publicados += 1
+        if self._broker is not None and self._broker.enviar(evento):
+            return  # O broker devolve o evento para este processo também
+        self._entregar(evento)
+
+    def _entregar(self, evento: dict):
+        with self._lock:
+            self._sequencia += 1
+            evento = {"id": self._sequencia, **evento}
+            self._historico.append(evento)
+            assinantes = list(self._assinantes)
+        for assinatura in assinantes:
+            if assinatura.aceita(evento):
+                assinatura._entregar(evento)
+
+    # === Assinaturas ===
+
+    def assinar(self, filtro: Optional[dict] = None, desde: Optional[int] = None,
+                loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[Assinatura]:
+        """
+        Cria uma assinatura filtrada por sessao_id, local_aplicacao e/ou dia.
+        `desde` reenvia os eventos do histórico com id maior (Last-Event-ID).
+        Retorna None se o limite de assinantes foi atingido
+        """
+        assinatura = Assinatura(filtro or {}, EVENTOS_BUFFER_ASSINANTE, loop)
+        with self._lock:
+            if len(self._assinantes) >= self.max_assinantes:
+                return None
+            self._assinantes.append(assinatura)
+            pendentes = [evento for evento in self._historico if desde is not None and evento["id"] > desde]
+        for evento in pendentes:
+            if assinatura.aceita(evento):
+                assinatura._entregar(evento)
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura):
+        with self._lock:
+            if assinatura in self._assinantes:
+                self._assinantes.remove(assinatura)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "assinantes": len(self._assinantes),
+                "publicados": self.publicados,
+                "ultimo_id": self._sequencia,
+                "broker": self._broker.conectado if self._broker else None,
+            }
+
+
+def formatar_sse(evento: dict) -> str:
+    """
+    Serializa um evento no formato text/event-stream
+    """
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+# === Broker local (fan-out entre processos) ===
+
+class ClienteBroker:
+    """
+    Conexão de um processo com o broker: envia os eventos publicados e repassa
+    ao barramento local os eventos recebidos. Reconecta sozinho
+    """
+
+    def __init__(self, host: str, porta: int, ao_receber):
+        self.host = host
+        self.porta = porta
+        self.ao_receber = ao_receber
+        self._socket: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conectado(self) -> bool:
+        return self._socket is not None
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, name="eventos-broker", daemon=True).start()
+
+    def enviar(self, evento: dict) -> bool:
+        linha = (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._socket is None:
+                return False
+            try:
+                self._socket.sendall(linha)
+                return True
+            except OSError:
+                self._socket = None
+                return False
+
+    def _executar(self):
+        espera = 1.0
+        while True:
+            try:
+                conexao = socket.create_connection((self.host, self.porta), timeout=5)
+                conexao.settimeout(None)
+                with self._lock:
+                    self._socket = conexao
+                espera = 1.0
+                logger.info("🔌 Conectado ao broker de eventos %s:%d", self.host, self.porta)
+                for linha in conexao.makefile("rb"):
+                    self.ao_receber(json.loads(linha))
+            except OSError as e:
+                logger.warning("⚠️ Broker de eventos indisponível (%s); nova tentativa em %.0fs", e, espera)
+            with self._lock:
+                self._socket = None
+            time.sleep(espera)
+            espera = min(espera * 2, 30)
+
+
+async def _executar_broker(porta: int):
+    clientes: Dict[asyncio.StreamWriter, None] = {}
+
+    async def atender(leitor: asyncio.StreamReader, escritor: asyncio.StreamWriter):
+        clientes[escritor] = None
+        try:
+            while linha := await leitor.readline():
+                for cliente in list(clientes):
+                    cliente.write(linha)
+                await asyncio.gather(*(cliente.drain() for cliente in list(clientes)), return_exceptions=True)
+        finally:
+            clientes.pop(escritor, None)
+            escritor.close()
+
+    servidor = await asyncio.start_server(atender, "127.0.0.1", porta)
+    print(f"📡 Broker de eventos em 127.0.0.1:{porta}")
+    async with servidor:
+        await servidor.serve_forever()
+
+
+# Instância compartilhada pela aplicação
+barramento_eventos = BarramentoEventos()
+if EVENTOS_BROKER:
+    barramento_eventos.conectar_broker(EVENTOS_BROKER)
+
+
+if __name__ == "__main__":
+    if "--broker" in sys.argv:
+        porta = int(sys.argv[sys.argv.index("--porta") + 1]) if "--porta" in sys.argv else 5055
+        asyncio.run(_executar_broker(porta))
+    else:
+        print(__doc__)
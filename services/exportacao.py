@@ -0,0 +1,397 @@
+"""
+Exportação das evidências do checklist: um ZIP com as fotos, o relatório HTML (itens, status,
+horários e observações) e um manifesto com o SHA-256 de cada foto
+
+Cada foto é a original recebida do aplicador, localizada pela versão normalizada do item
+(fotos_derivadas). Se o original não foi mantido (FOTOS_MANTER_ORIGINAL=0), vai a versão
+normalizada; o manifesto e o relatório indicam qual versão foi incluída
+
+- Por sessão: gerado ao finalizar o checklist (em segundo plano, depois que as últimas fotos
+  terminam de ser normalizadas e verificadas) ou sob demanda
+- Por local de aplicação: uma pasta por sessão e um índice, gerado por um job em segundo plano
+
+Os pacotes ficam em cache em EXPORTACAO_DIR, identificados por uma impressão digital dos dados
+do checklist: qualquer alteração (item, foto, observação, status) gera um pacote novo.
+As fotos são copiadas em blocos do armazenamento para o ZIP, sem carregar o arquivo em memória.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import Environment
+
+from database.database import ChecklistDatabase, get_db
+from database.models import ChecklistItem, ChecklistSessao, FotoDerivada
+from services.definicoes import definicao_checklist
+from services.fotos import ArmazemFotos, armazem_fotos, detectar_mime, ler_ref
+from services.processamento_imagem import ProcessadorImagens, processador_imagens
+
+# === Configuração (variáveis de ambiente) ===
+EXPORTACAO_DIR = os.getenv("EXPORTACAO_DIR", "database/exportacoes")
+EXPORTACAO_AUTOMATICA = os.getenv("EXPORTACAO_AUTOMATICA", "1") == "1"  # pacote da sessão ao finalizar
+EXPORTACAO_WORKERS = int(os.getenv("EXPORTACAO_WORKERS", "1"))
+
+# Incrementar ao mudar o conteúdo dos pacotes (invalida o cache)
+FORMATO_EXPORTACAO = 3
+
+EXTENSOES = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+logger = logging.getLogger(__name__)
+
+RELATORIO_HTML = """<!doctype html>
+<html lang="pt-br"><head><meta charset="utf-8"><title>Checklist {{ sessao.sessao_id }} - Dia {{ sessao.dia }}</title>
+<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:1.5em}
+td,th{border:1px solid #ccc;padding:4px 8px;text-align:left;vertical-align:top}img{max-width:160px}</style></head><body>
+<h1>📋 Checklist {{ definicao.nome }} - Dia {{ sessao.dia }}</h1>
+<table>
+<tr><th>Sessão</th><td>{{ sessao.sessao_id }}</td></tr>
+<tr><th>Aplicador</th><td>{{ sessao.aplicador_nome or "" }}</td></tr>
+<tr><th>Local</th><td>{{ sessao.local_aplicacao or "" }}</td></tr>
+<tr><th>Status</th><td>{{ sessao.status_checklist }}</td></tr>
+<tr><th>Início</th><td>{{ sessao.timestamp_inicio or "" }}</td></tr>
+<tr><th>Fim</th><td>{{ sessao.timestamp_fim or "" }}</td></tr>
+<tr><th>Itens conferidos</th><td>{{ sessao.conferidos }}/{{ sessao.itens|length }}</td></tr>
+</table>
+<table><tr><th>#</th><th>Item</th><th>Conferido</th><th>OCR</th><th>Foto</th><th>Observação</th><th>Atualizado em</th></tr>
+{% for item in sessao.itens %}<tr><td>{{ loop.index }}</td><td>{{ item.rotulo }}</td><td>{{ "✅" if item.presente else "❌" }}</td>
+<td>{{ "%d%%"|format(item.confianca * 100) if item.confianca is not none else "" }}</td>
+<td>{% if item.arquivo %}<a href="{{ item.arquivo }}"><img src="{{ item.arquivo }}" alt="{{ item.rotulo }}"></a><br><small>{{ item.versao }} · sha256 {{ item.sha256[:16] }}…</small>
+{% elif item.foto_ref %}<small>foto indisponível</small>{% endif %}</td>
+<td>{{ item.observacao or "" }}</td><td>{{ item.atualizado_em or "" }}</td></tr>
+{% endfor %}</table>
+<p><small>Gerado em {{ gerado_em }} (UTC) · definição v{{ definicao.versao }} · {{ impressao[:16] }}</small></p>
+</body></html>"""
+
+INDICE_HTML = """<!doctype html>
+<html lang="pt-br"><head><meta charset="utf-8"><title>{{ local or "(sem local)" }} - Dia {{ dia }}</title>
+<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}
+td,th{border:1px solid #ccc;padding:4px 8px;text-align:left}</style></head><body>
+<h1>🏫 {{ local or "(sem local)" }} - Dia {{ dia }}</h1>
+<table><tr><th>Sessão</th><th>Aplicador</th><th>Status</th><th>Itens conferidos</th></tr>
+{% for sessao in sessoes %}<tr><td><a href="{{ sessao.pasta }}/relatorio.html">{{ sessao.sessao_id }}</a></td>
+<td>{{ sessao.aplicador_nome or "" }}</td><td>{{ sessao.status_checklist }}</td>
+<td>{{ sessao.conferidos }}/{{ sessao.itens|length }}</td></tr>{% endfor %}</table>
+<p><small>Gerado em {{ gerado_em }} (UTC) · {{ impressao[:16] }}</small></p>
+</body></html>"""
+
+_modelos = Environment(autoescape=True)
+relatorio_html = _modelos.from_string(RELATORIO_HTML)
+indice_html = _modelos.from_string(INDICE_HTML)
+
+
+def _nome_pasta(sessao_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", sessao_id)
+
+
+def _digest(*partes) -> str:
+    return hashlib.sha256("|".join(str(parte) for parte in partes).encode("utf-8")).hexdigest()
+
+
+def _data(valor: Optional[datetime]) -> Optional[str]:
+    return valor.isoformat(sep=" ", timespec="seconds") if valor else None
+
+
+def _originais(db, refs: List[str]) -> Dict[str, str]:
+    """
+    {foto_ref normalizada: hash da foto original recebida}
+    """
+    originais = {}
+    for inicio in range(0, len(refs), 500):
+        originais.update(
+            (foto_ref, hash_origem)
+            for foto_ref, hash_origem in db.query(FotoDerivada.foto_ref, FotoDerivada.hash_origem).filter(
+                FotoDerivada.variante == "normalizada", FotoDerivada.foto_ref.in_(refs[inicio:inicio + 500]),
+            )
+        )
+    return originais
+
+
+def ler_sessoes(dia: int, sessao_id: Optional[str] = None, local_aplicacao: Optional[str] = None) -> List[dict]:
+    """
+    Dados das sessões (de uma sessão ou de um local) e de seus itens, na ordem da definição.
+    Só referências das fotos (a do item e a do original): os arquivos são lidos ao escrever o ZIP
+    """
+    filtro = [ChecklistSessao.dia == dia]
+    if sessao_id is not None:
+        filtro.append(ChecklistSessao.sessao_id == sessao_id)
+    else:
+        filtro.append(ChecklistSessao.local_aplicacao == local_aplicacao if local_aplicacao
+                      else ChecklistSessao.local_aplicacao.is_(None) | (ChecklistSessao.local_aplicacao == ''))
+
+    checklist = definicao_checklist.dia(dia)
+    with get_db() as db:
+        sessoes = {}
+        for linha in db.query(
+            ChecklistSessao.sessao_id, ChecklistSessao.aplicador_nome, ChecklistSessao.local_aplicacao,
+            ChecklistSessao.status_checklist, ChecklistSessao.timestamp_inicio, ChecklistSessao.timestamp_fim,
+        ).filter(*filtro).order_by(ChecklistSessao.sessao_id):
+            sessoes[linha.sessao_id] = {
+                "sessao_id": linha.sessao_id, "dia": dia,
+                "aplicador_nome": linha.aplicador_nome, "local_aplicacao": linha.local_aplicacao,
+                "status_checklist": linha.status_checklist,
+                "timestamp_inicio": _data(linha.timestamp_inicio), "timestamp_fim": _data(linha.timestamp_fim),
+                "pasta": _nome_pasta(linha.sessao_id), "itens": [],
+            }
+        if not sessoes:
+            return []
+
+        itens = (
+            db.query(ChecklistItem.sessao_id, ChecklistItem.item_key, ChecklistItem.presente,
+                     ChecklistItem.confianca, ChecklistItem.foto_ref, ChecklistItem.observacao, ChecklistItem.updated_at)
+            .join(ChecklistSessao, (ChecklistSessao.sessao_id == ChecklistItem.sessao_id) & (ChecklistSessao.dia == ChecklistItem.dia))
+            .filter(*filtro)
+            .yield_per(1000)
+        )
+        for linha in itens:
+            sessoes[linha.sessao_id]["itens"].append({
+                "item": linha.item_key, "rotulo": checklist.rotulo(linha.item_key),
+                "presente": bool(linha.presente), "confianca": linha.confianca, "foto_ref": linha.foto_ref,
+                "observacao": linha.observacao, "atualizado_em": _data(linha.updated_at),
+            })
+
+        refs = sorted({item["foto_ref"] for sessao in sessoes.values() for item in sessao["itens"] if item["foto_ref"]})
+        originais = _originais(db, refs)
+        for sessao in sessoes.values():
+            for item in sessao["itens"]:
+                item["original"] = originais.get(item["foto_ref"])
+
+    fim = len(checklist.posicao)
+    for sessao in sessoes.values():
+        sessao["itens"].sort(key=lambda item: checklist.posicao.get(item["item"], fim))
+        sessao["conferidos"] = sum(1 for item in sessao["itens"] if item["presente"])
+    return list(sessoes.values())
+
+
+def impressao_digital(sessoes: List[dict]) -> str:
+    """
+    Muda quando qualquer dado exportado muda (o horário de atualização dos itens não entra)
+    """
+    conteudo = [
+        {chave: valor for chave, valor in sessao.items() if chave != "itens"}
+        | {"itens": [(i["item"], i["presente"], i["confianca"], i["foto_ref"], i["observacao"]) for i in sessao["itens"]]}
+        for sessao in sessoes
+    ]
+    return _digest(FORMATO_EXPORTACAO, definicao_checklist.versao, json.dumps(conteudo, sort_keys=True))
+
+
+class ExportadorEvidencias:
+    """
+    Gera e mantém em cache os pacotes de evidências (ZIP) por sessão e por local de aplicação
+    """
+
+    def __init__(self, armazem: ArmazemFotos = armazem_fotos, diretorio: str = EXPORTACAO_DIR,
+                 workers: int = EXPORTACAO_WORKERS, processador: ProcessadorImagens = processador_imagens):
+        self.armazem = armazem
+        self.processador = processador
+        self.diretorio = os.path.abspath(diretorio)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exportacao")
+        self._jobs: Dict[Tuple, Future] = {}
+        self._erros: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+        self.gerados = 0
+        self.reaproveitados = 0
+
+    # === Pacotes ===
+
+    def exportar_sessao(self, sessao_id: str, dia: int) -> Optional[str]:
+        """
+        Caminho do ZIP da sessão (gerado agora ou reaproveitado do cache); None se o checklist não existe
+        """
+        sessoes = ler_sessoes(dia, sessao_id=sessao_id)
+        if not sessoes:
+            return None
+        return self._pacote("sessoes", _digest(sessao_id, dia), sessoes, por_pasta=False)
+
+    def exportar_local(self, local_aplicacao: Optional[str], dia: int) -> Optional[str]:
+        """
+        Caminho do ZIP com todas as sessões do local; None se o local não tem checklists no dia
+        """
+        sessoes = ler_sessoes(dia, local_aplicacao=local_aplicacao)
+        if not sessoes:
+            return None
+        return self._pacote("locais", _digest(local_aplicacao or "", dia), sessoes, por_pasta=True,
+                            local=local_aplicacao, dia=dia)
+
+    def _pacote(self, tipo: str, chave: str, sessoes: List[dict], por_pasta: bool, **indice) -> str:
+        impressao = impressao_digital(sessoes)
+        pasta = os.path.join(self.diretorio, tipo)
+        caminho = os.path.join(pasta, f"{chave[:20]}-{impressao[:20]}.zip")
+        if os.path.exists(caminho):
+            with self._lock:
+                self.reaproveitados += 1
+            return caminho
+
+        os.makedirs(pasta, exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                self._escrever_zip(arquivo, sessoes, impressao, por_pasta, indice)
+            os.replace(temporario, caminho)
+        except BaseException:
+            os.remove(temporario)
+            raise
+
+        # Versões anteriores do mesmo pacote deixam de valer
+        for antigo in glob.glob(os.path.join(pasta, f"{chave[:20]}-*.zip")):
+            if antigo != caminho:
+                try:
+                    os.remove(antigo)
+                except OSError:
+                    pass
+        with self._lock:
+            self.gerados += 1
+        logger.info("📦 Pacote de evidências gerado", extra={"tipo": tipo, "sessoes": len(sessoes), "arquivo": caminho})
+        return caminho
+
+    def _escrever_zip(self, arquivo, sessoes: List[dict], impressao: str, por_pasta: bool, indice: dict):
+        gerado_em = datetime.utcnow().isoformat(sep=" ", timespec="seconds")
+        manifesto = {
+            "definicao": {"nome": definicao_checklist.nome, "versao": definicao_checklist.versao},
+            "gerado_em": gerado_em, "impressao": impressao, "sessoes": [],
+        }
+        with zipfile.ZipFile(arquivo, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as pacote:
+            for sessao in sessoes:
+                prefixo = f"{sessao['pasta']}/" if por_pasta else ""
+                fotos = {}
+                for numero, item in enumerate(sessao["itens"], start=1):
+                    item["arquivo"] = item["sha256"] = item["versao"] = None
+                    foto = self._escolher_foto(item)
+                    if foto is None:
+                        continue
+                    hash_foto, versao = foto
+                    blocos = self.armazem.ler_em_blocos(hash_foto)
+                    primeiro = next(blocos, b"")
+                    # O tamanho e o tipo do original não ficam no banco (só os da versão do item)
+                    mime = detectar_mime(primeiro) or ler_ref(item["foto_ref"]).mime
+                    nome = f"fotos/{numero:02d}_{item['item']}{EXTENSOES.get(mime, '')}"
+                    # Fotos já são comprimidas: gravadas sem compressão, em blocos
+                    info = zipfile.ZipInfo(prefixo + nome, date_time=datetime.utcnow().timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    tamanho = len(primeiro)
+                    with pacote.open(info, "w", force_zip64=True) as destino:
+                        destino.write(primeiro)
+                        for bloco in blocos:
+                            destino.write(bloco)
+                            tamanho += len(bloco)
+                    item["arquivo"], item["sha256"], item["versao"] = nome, hash_foto, versao
+                    fotos[prefixo + nome] = {
+                        "item": item["item"], "sha256": hash_foto, "tamanho": tamanho, "mime": mime, "versao": versao,
+                    }
+
+                pacote.writestr(prefixo + "relatorio.html", relatorio_html.render(
+                    sessao=sessao, definicao=definicao_checklist, gerado_em=gerado_em, impressao=impressao,
+                ))
+                manifesto["sessoes"].append({
+                    **{chave: valor for chave, valor in sessao.items() if chave != "itens"},
+                    "itens": [{c: v for c, v in item.items() if c not in ("rotulo", "arquivo")} for item in sessao["itens"]],
+                    "fotos": fotos,
+                })
+
+            if por_pasta:
+                pacote.writestr("index.html", indice_html.render(
+                    sessoes=sessoes, gerado_em=gerado_em, impressao=impressao, **indice,
+                ))
+            pacote.writestr("manifesto.json", json.dumps(manifesto, ensure_ascii=False, indent=2))
+
+    def _escolher_foto(self, item: dict) -> Optional[Tuple[str, str]]:
+        """
+        (hash, versão) da foto a exportar: a original, se ainda estiver no armazenamento,
+        ou a versão normalizada do item
+        """
+        ref = ler_ref(item["foto_ref"])
+        if ref is None:
+            return None
+        original = item.get("original")
+        if original is None:
+            # Sem versão normalizada: a foto do item é a recebida
+            return (ref.hash, "original") if self.armazem.existe(ref.hash) else None
+        if self.armazem.existe(original):
+            return original, "original"
+        return (ref.hash, "normalizada") if self.armazem.existe(ref.hash) else None
+
+    # === Jobs em segundo plano ===
+
+    def _agendar(self, chave: Tuple, funcao, *args) -> Future:
+        with self._lock:
+            job = self._jobs.get(chave)
+            if job is not None and not job.done():
+                return job
+            self._erros.pop(chave, None)
+            job = self._pool.submit(funcao, *args)
+            self._jobs[chave] = job
+        job.add_done_callback(lambda f: self._concluir(chave, f))
+        return job
+
+    def _concluir(self, chave: Tuple, job: Future):
+        with self._lock:
+            if self._jobs.get(chave) is job:
+                del self._jobs[chave]
+            erro = job.exception()
+            if erro is not None:
+                self._erros[chave] = str(erro)
+        if erro is not None:
+            logger.warning("⚠️ Erro na exportação %s: %s", chave, erro)
+
+    def agendar_sessao(self, sessao_id: str, dia: int, local_aplicacao: Optional[str] = None) -> Future:
+        """
+        Gera o pacote da sessão em segundo plano
+        """
+        return self._agendar(("sessao", sessao_id, dia), self.exportar_sessao, sessao_id, dia)
+
+    def exportar_ao_finalizar(self, sessao_id: str, dia: int, local_aplicacao: Optional[str] = None):
+        """
+        Agenda o pacote da sessão finalizada quando as fotos dela terminarem de ser processadas:
+        a normalização e o OCR ainda mudam foto_ref e confianca (e com eles o pacote)
+        """
+        self.processador.quando_concluir(sessao_id, dia, lambda: self.agendar_sessao(sessao_id, dia))
+
+    def solicitar_local(self, local_aplicacao: Optional[str], dia: int) -> dict:
+        """
+        {"status": "pronto", "arquivo"} se o pacote do local está em dia no cache; caso contrário
+        agenda o job e retorna {"status": "gerando"} (ou "erro"/"vazio")
+        """
+        chave = ("local", local_aplicacao or "", dia)
+        with self._lock:
+            job = self._jobs.get(chave)
+            erro = self._erros.pop(chave, None)
+        if job is not None:
+            return {"status": "gerando"}
+        if erro is not None:
+            return {"status": "erro", "erro": erro}
+
+        sessoes = ler_sessoes(dia, local_aplicacao=local_aplicacao)
+        if not sessoes:
+            return {"status": "vazio"}
+        pasta = os.path.join(self.diretorio, "locais")
+        caminho = os.path.join(pasta, f"{_digest(local_aplicacao or '', dia)[:20]}-{impressao_digital(sessoes)[:20]}.zip")
+        if os.path.exists(caminho):
+            return {"status": "pronto", "arquivo": caminho}
+        self._agendar(chave, self.exportar_local, local_aplicacao, dia)
+        return {"status": "gerando"}
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "gerados": self.gerados,
+                "reaproveitados": self.reaproveitados,
+                "em_andamento": [list(chave) for chave in self._jobs],
+            }
+
+    def encerrar(self):
+        self._pool.shutdown(wait=True)
+
+
+# Instância compartilhada pela aplicação
+exportador_evidencias = ExportadorEvidencias()
+
+if EXPORTACAO_AUTOMATICA:
+    ChecklistDatabase.ao_finalizar.append(exportador_evidencias.exportar_ao_finalizar)
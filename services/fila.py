@@ -0,0 +1,349 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import aliased
+
+from database.database import get_db
+from database.models import EventoWebhook, EventoWebhookFalho
+
+# === Configuração (variáveis de ambiente) ===
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_TENTATIVAS = int(os.getenv("WEBHOOK_MAX_TENTATIVAS", "5"))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", "2"))  # segundos
+WEBHOOK_BACKOFF_MAX = float(os.getenv("WEBHOOK_BACKOFF_MAX", "300"))
+WEBHOOK_PRAZO_PROCESSAMENTO = int(os.getenv("WEBHOOK_PRAZO_PROCESSAMENTO", "300"))  # segundos
+WEBHOOK_LOTE_MAXIMO = int(os.getenv("WEBHOOK_LOTE_MAXIMO", "30"))  # eventos agrupáveis reservados juntos
+WEBHOOK_ESPERA_LOTE_MAXIMA = float(os.getenv("WEBHOOK_ESPERA_LOTE_MAXIMA", "30"))  # s; teto da janela deslizante
+WEBHOOK_RETENCAO_DIAS = int(os.getenv("WEBHOOK_RETENCAO_DIAS", "7"))  # eventos concluídos mantidos na tabela
+
+# Intervalo de consulta à fila quando não há eventos novos neste processo
+INTERVALO_OCIOSO = 1.0
+
+# Intervalo entre limpezas dos eventos concluídos (segundos)
+INTERVALO_LIMPEZA = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _agora() -> datetime:
+    return datetime.utcnow()
+
+
+class FilaWebhook:
+    """
+    Fila durável (tabela fila_webhook) com pool de workers.
+
+    - Eventos do mesmo remoteJid são processados um de cada vez, na ordem de chegada
+    - Falhas são reprocessadas com backoff exponencial
+    - Após WEBHOOK_MAX_TENTATIVAS o evento vai para a tabela fila_webhook_falhas
+    - Com `processar_lote`, eventos `agrupavel` seguidos do mesmo remoteJid são reservados e
+      processados juntos (ex.: as fotos de um álbum)
+    """
+
+    def __init__(
+        self,
+        processar: Callable[[dict], None],
+        workers: int = WEBHOOK_WORKERS,
+        max_tentativas: int = WEBHOOK_MAX_TENTATIVAS,
+        backoff_base: float = WEBHOOK_BACKOFF_BASE,
+        ao_falhar: Optional[Callable[[dict, str], None]] = None,
+        processar_lote: Optional[Callable[[List[dict]], None]] = None,
+        agrupavel: Callable[[dict], bool] = lambda dados: False,
+        lote_maximo: int = WEBHOOK_LOTE_MAXIMO,
+    ):
+        self.processar = processar
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.ao_falhar = ao_falhar
+        self.processar_lote = processar_lote
+        self.agrupavel = agrupavel
+        self.lote_maximo = lote_maximo
+        self._threads = []
+        self._parar = threading.Event()
+        self._novo_evento = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_limpeza = threading.Lock()
+        self._proxima_limpeza = 0.0  # time.monotonic()
+
+    # === Produção ===
+
+    def enfileirar(self, dados: dict, atraso: float = 0) -> int:
+        """
+        Persiste o evento na fila e acorda os workers. Retorna o id do evento.
+        Com `atraso` (segundos) o evento só fica disponível para os workers depois desse tempo.
+        Para eventos agrupáveis a janela é deslizante: os anteriores do mesmo remetente que ainda
+        aguardam passam a esperar este (as fotos de um álbum saem num único lote), até
+        WEBHOOK_ESPERA_LOTE_MAXIMA segundos depois de recebidos
+        """
+        agora = _agora()
+        remote_jid = dados["data"]["key"]["remoteJid"]
+        disponivel_em = agora + timedelta(seconds=atraso)
+        with get_db() as db:
+            evento = EventoWebhook(
+                remote_jid=remote_jid,
+                evento=dados.get("event"),
+                payload=json.dumps(dados, ensure_ascii=False),
+                status='pendente',
+                tentativas=0,
+                recebido_em=agora,
+                disponivel_em=disponivel_em,
+                atualizado_em=agora,
+            )
+            db.add(evento)
+            db.flush()
+            evento_id = evento.id
+            if atraso > 0 and self.processar_lote is not None and self.agrupavel(dados):
+                aguardando = db.query(EventoWebhook).filter(
+                    EventoWebhook.remote_jid == remote_jid,
+                    EventoWebhook.status == 'pendente',
+                    EventoWebhook.tentativas == 0,
+                    EventoWebhook.id < evento_id,
+                    EventoWebhook.disponivel_em > agora,
+                    EventoWebhook.recebido_em >= disponivel_em - timedelta(seconds=WEBHOOK_ESPERA_LOTE_MAXIMA),
+                ).all()
+                for anterior in aguardando:
+                    if self.agrupavel(json.loads(anterior.payload)):
+                        anterior.disponivel_em = disponivel_em
+        self._novo_evento.set()
+        return evento_id
+
+    def pendentes(self) -> int:
+        """
+        Quantidade de eventos aguardando ou em processamento
+        """
+        with get_db() as db:
+            return db.query(EventoWebhook).filter(EventoWebhook.status.in_(('pendente', 'processando'))).count()
+
+    # === Consumo ===
+
+    def iniciar(self):
+        """
+        Inicia o pool de workers (idempotente)
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._parar.clear()
+            self.recuperar_orfaos()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._executar_worker, name=f"fila-webhook-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info("🧵 Fila do webhook iniciada com %d worker(s)", self.workers)
+
+    def parar(self, timeout: float = 10):
+        self._parar.set()
+        self._novo_evento.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def recuperar_orfaos(self) -> int:
+        """
+        Devolve para a fila eventos presos em 'processando' (ex.: processo reiniciado no meio do trabalho)
+        """
+        limite = _agora() - timedelta(seconds=WEBHOOK_PRAZO_PROCESSAMENTO)
+        with get_db() as db:
+            return db.query(EventoWebhook).filter(
+                EventoWebhook.status == 'processando',
+                EventoWebhook.atualizado_em < limite,
+            ).update({"status": 'pendente', "disponivel_em": _agora()}, synchronize_session=False)
+
+    def _executar_worker(self):
+        while not self._parar.is_set():
+            self._limpar_periodicamente()
+            try:
+                processou = self.processar_proximo()
+            except Exception as e:
+                logger.error("❌ Erro ao consultar a fila: %s", e)
+                processou = False
+
+            if not processou:
+                self._novo_evento.wait(INTERVALO_OCIOSO)
+                self._novo_evento.clear()
+
+    def processar_proximo(self) -> bool:
+        """
+        Reserva e processa o próximo evento disponível (ou lote), registrando o resultado.
+        Retorna False se não havia evento disponível. Os workers chamam em laço; os testes
+        chamam direto, sem threads
+        """
+        trabalho = self._reivindicar()
+        if trabalho is None:
+            return False
+
+        evento_id, dados, tentativas, lote = trabalho
+        try:
+            if lote is None:
+                self.processar(dados)
+            else:
+                self.processar_lote([dados] + [dados_lote for _, dados_lote, _ in lote])
+        except Exception as e:
+            logger.warning("❌ Erro ao processar evento %d (tentativa %d): %s", evento_id, tentativas + 1, e,
+                           extra={"evento_id": evento_id, "lote": len(lote) + 1 if lote else None})
+            self._registrar_falha(evento_id, dados, tentativas + 1, str(e))
+            # O lote falha junto; o aviso ao aplicador (ao_falhar) sai uma vez só, pelo primeiro evento
+            for id_lote, dados_lote, tentativas_lote in lote or []:
+                self._registrar_falha(id_lote, dados_lote, tentativas_lote + 1, str(e), notificar=False)
+        else:
+            self._concluir(evento_id, *(id_lote for id_lote, _, _ in lote or []))
+        return True
+
+    def _reivindicar(self):
+        """
+        Reserva o evento pendente mais antigo cujo remetente não tenha outro evento
+        em processamento ou anterior na fila (garante a ordem por remoteJid).
+        Retorna (id, dados, tentativas, lote): `lote` é None para processamento individual ou a
+        lista (id, dados, tentativas) dos eventos agrupáveis seguintes, reservados junto com ele
+        """
+        outro = aliased(EventoWebhook)
+        bloqueado = exists().where(
+            outro.remote_jid == EventoWebhook.remote_jid,
+            or_(
+                outro.status == 'processando',
+                and_(outro.status == 'pendente', outro.id < EventoWebhook.id),
+            ),
+        )
+        with get_db() as db:
+            for _ in range(3):
+                agora = _agora()
+                candidato = (
+                    db.query(EventoWebhook.id, EventoWebhook.payload, EventoWebhook.tentativas)
+                    .filter(
+                        EventoWebhook.status == 'pendente',
+                        EventoWebhook.disponivel_em <= agora,
+                        ~bloqueado,
+                    )
+                    .order_by(EventoWebhook.id)
+                    .first()
+                )
+                if candidato is None:
+                    return None
+
+                # Compare-and-set: outro worker pode ter reservado o mesmo evento
+                reservados = db.query(EventoWebhook).filter(
+                    EventoWebhook.id == candidato.id,
+                    EventoWebhook.status == 'pendente',
+                ).update({"status": 'processando', "atualizado_em": agora}, synchronize_session=False)
+                db.commit()
+                if reservados:
+                    dados = json.loads(candidato.payload)
+                    lote = None
+                    if self.processar_lote is not None and self.agrupavel(dados):
+                        lote = self._reivindicar_lote(db, candidato.id, dados["data"]["key"]["remoteJid"], agora)
+                    return candidato.id, dados, candidato.tentativas, lote
+        return None
+
+    def _reivindicar_lote(self, db, evento_id: int, remote_jid: str, agora: datetime) -> list:
+        """
+        Reserva os eventos agrupáveis que seguem `evento_id` na fila do mesmo remetente (até o
+        primeiro que não for agrupável ou ainda aguardar o backoff de uma falha, preservando a
+        ordem). Estão bloqueados pelo evento já reservado: nenhum outro worker disputa essas linhas.
+        O atraso de chegada (janela do álbum) não interrompe o lote: as fotos seguintes entram
+        junto com a primeira
+        """
+        seguintes = (
+            db.query(EventoWebhook.id, EventoWebhook.payload, EventoWebhook.tentativas, EventoWebhook.disponivel_em)
+            .filter(
+                EventoWebhook.remote_jid == remote_jid,
+                EventoWebhook.status == 'pendente',
+                EventoWebhook.id > evento_id,
+            )
+            .order_by(EventoWebhook.id)
+            .limit(self.lote_maximo - 1)
+            .all()
+        )
+        lote = []
+        for seguinte in seguintes:
+            if seguinte.tentativas > 0 and seguinte.disponivel_em > agora:
+                break
+            dados = json.loads(seguinte.payload)
+            if not self.agrupavel(dados):
+                break
+            lote.append((seguinte.id, dados, seguinte.tentativas))
+        if lote:
+            db.query(EventoWebhook).filter(EventoWebhook.id.in_([id_lote for id_lote, _, _ in lote])).update(
+                {"status": 'processando', "atualizado_em": agora}, synchronize_session=False
+            )
+            db.commit()
+        return lote
+
+    def _concluir(self, *eventos_ids: int):
+        with get_db() as db:
+            db.query(EventoWebhook).filter(EventoWebhook.id.in_(eventos_ids)).update(
+                {"status": 'concluido', "atualizado_em": _agora()}, synchronize_session=False
+            )
+        # Libera eventos do mesmo remetente que aguardavam este
+        self._novo_evento.set()
+
+    def _registrar_falha(self, evento_id: int, dados: dict, tentativas: int, erro: str, notificar: bool = True):
+        if tentativas < self.max_tentativas:
+            espera = min(self.backoff_base * (2 ** (tentativas - 1)), WEBHOOK_BACKOFF_MAX)
+            with get_db() as db:
+                db.query(EventoWebhook).filter(EventoWebhook.id == evento_id).update({
+                    "status": 'pendente',
+                    "tentativas": tentativas,
+                    "ultimo_erro": erro,
+                    "disponivel_em": _agora() + timedelta(seconds=espera),
+                    "atualizado_em": _agora(),
+                }, synchronize_session=False)
+            return
+
+        with get_db() as db:
+            evento = db.query(EventoWebhook).filter(EventoWebhook.id == evento_id).first()
+            db.add(EventoWebhookFalho(
+                evento_id=evento.id,
+                remote_jid=evento.remote_jid,
+                evento=evento.evento,
+                payload=evento.payload,
+                tentativas=tentativas,
+                erro=erro,
+                recebido_em=evento.recebido_em,
+            ))
+            db.delete(evento)
+        logger.error("☠️ Evento %d movido para fila_webhook_falhas após %d tentativa(s)", evento_id, tentativas)
+        self._novo_evento.set()
+
+        if self.ao_falhar and notificar:
+            try:
+                self.ao_falhar(dados, erro)
+            except Exception as e:
+                logger.warning("⚠️ Erro ao notificar falha do evento %d: %s", evento_id, e)
+
+    # === Manutenção ===
+
+    def _limpar_periodicamente(self):
+        """
+        A cada INTERVALO_LIMPEZA, um dos workers remove os eventos concluídos antigos (a tabela
+        não cresce sem limite e as consultas da fila continuam rápidas)
+        """
+        with self._lock_limpeza:
+            if time.monotonic() < self._proxima_limpeza:
+                return
+            self._proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+        try:
+            removidos = self.limpar_concluidos(WEBHOOK_RETENCAO_DIAS)
+        except Exception as e:
+            logger.warning("⚠️ Erro ao limpar eventos concluídos da fila: %s", e)
+            return
+        if removidos:
+            logger.info("🧹 %d evento(s) concluído(s) removido(s) da fila", removidos)
+
+    def limpar_concluidos(self, dias: int = 7) -> int:
+        """
+        Remove eventos concluídos há mais de `dias` dias
+        """
+        limite = _agora() - timedelta(days=dias)
+        with get_db() as db:
+            return db.query(EventoWebhook).filter(
+                EventoWebhook.status == 'concluido',
+                EventoWebhook.atualizado_em < limite,
+            ).delete(synchronize_session=False)
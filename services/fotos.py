@@ -0,0 +1,194 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+# Diretório padrão do armazenamento local das fotos
+FOTOS_DIR = os.getenv("FOTOS_DIR", "database/fotos")
+
+# Tamanho dos blocos usados na leitura/escrita em streaming
+TAMANHO_BLOCO = 64 * 1024
+
+# Prefixo das referências gravadas nas colunas *_foto
+PREFIXO_REF = "sha256:"
+
+# Assinaturas (magic bytes) dos formatos de imagem aceitos
+ASSINATURAS_MIME = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+@dataclass(frozen=True)
+class FotoRef:
+    """
+    Referência de uma foto no armazenamento: hash SHA-256, tamanho em bytes e tipo MIME
+    """
+    hash: str
+    tamanho: int
+    mime: str
+
+    def __str__(self):
+        return f"{PREFIXO_REF}{self.hash};{self.tamanho};{self.mime}"
+
+
+def ler_ref(valor: Optional[str]) -> Optional[FotoRef]:
+    """
+    Converte o texto de uma coluna *_foto em FotoRef (None se não for uma referência)
+    """
+    if not valor or not valor.startswith(PREFIXO_REF):
+        return None
+    try:
+        hash_foto, tamanho, mime = valor[len(PREFIXO_REF):].split(";", 2)
+        return FotoRef(hash=hash_foto, tamanho=int(tamanho), mime=mime)
+    except ValueError:
+        return None
+
+
+def hash_valido(hash_foto: str) -> bool:
+    """
+    Verifica se o texto é um hash SHA-256 em hexadecimal (evita caminhos arbitrários)
+    """
+    return re.fullmatch(r"[0-9a-f]{64}", hash_foto or "") is not None
+
+
+def detectar_mime(cabecalho: bytes) -> Optional[str]:
+    """
+    Identifica o tipo da imagem pelos primeiros bytes do arquivo
+    """
+    for assinatura, mime in ASSINATURAS_MIME:
+        if cabecalho.startswith(assinatura):
+            return mime
+    if cabecalho[:4] == b"RIFF" and cabecalho[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class BackendFotos(ABC):
+    """
+    Interface dos backends de armazenamento de fotos (endereçados pelo hash)
+    """
+
+    @abstractmethod
+    def existe(self, hash_foto: str) -> bool:
+        ...
+
+    @abstractmethod
+    def gravar(self, hash_foto: str, caminho_temporario: str):
+        """
+        Grava o conteúdo do arquivo temporário sob o hash informado e descarta o temporário
+        """
+        ...
+
+    @abstractmethod
+    def abrir(self, hash_foto: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def remover(self, hash_foto: str):
+        ...
+
+
+class BackendLocal(BackendFotos):
+    """
+    Armazena as fotos em um diretório local, particionado pelo hash (ab/cd/abcd...)
+    """
+
+    def __init__(self, diretorio: str = FOTOS_DIR):
+        self.diretorio = diretorio
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def caminho(self, hash_foto: str) -> str:
+        return os.path.join(self.diretorio, hash_foto[:2], hash_foto[2:4], hash_foto)
+
+    def existe(self, hash_foto: str) -> bool:
+        return os.path.exists(self.caminho(hash_foto))
+
+    def gravar(self, hash_foto: str, caminho_temporario: str):
+        destino = self.caminho(hash_foto)
+        if os.path.exists(destino):
+            # Conteúdo idêntico já armazenado
+            os.remove(caminho_temporario)
+            return
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(caminho_temporario, destino)
+
+    def abrir(self, hash_foto: str) -> BinaryIO:
+        return open(self.caminho(hash_foto), "rb")
+
+    def remover(self, hash_foto: str):
+        try:
+            os.remove(self.caminho(hash_foto))
+        except FileNotFoundError:
+            pass
+
+
+class ArmazemFotos:
+    """
+    Armazenamento de fotos endereçado por conteúdo: cada foto é gravada uma única vez
+    e o banco guarda apenas a referência (hash, tamanho e tipo MIME)
+    """
+
+    def __init__(self, backend: BackendFotos, diretorio_temporario: Optional[str] = None):
+        self.backend = backend
+        self.diretorio_temporario = diretorio_temporario or FOTOS_DIR
+        os.makedirs(self.diretorio_temporario, exist_ok=True)
+
+    def salvar_stream(self, blocos: Iterable[bytes], mime: Optional[str] = None) -> FotoRef:
+        """
+        Grava a foto bloco a bloco, calculando o hash durante a escrita
+        """
+        sha256 = hashlib.sha256()
+        tamanho = 0
+        cabecalho = b""
+        fd, caminho_temporario = tempfile.mkstemp(dir=self.diretorio_temporario, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as arquivo:
+                for bloco in blocos:
+                    if len(cabecalho) < 16:
+                        cabecalho += bloco[:16]
+                    sha256.update(bloco)
+                    tamanho += len(bloco)
+                    arquivo.write(bloco)
+            hash_foto = sha256.hexdigest()
+            self.backend.gravar(hash_foto, caminho_temporario)
+        except Exception:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+        return FotoRef(hash=hash_foto, tamanho=tamanho, mime=mime or detectar_mime(cabecalho) or "image/jpeg")
+
+    def salvar(self, dados: bytes, mime: Optional[str] = None) -> FotoRef:
+        """
+        Grava uma foto já carregada em memória
+        """
+        return self.salvar_stream([dados], mime)
+
+    def existe(self, hash_foto: str) -> bool:
+        return self.backend.existe(hash_foto)
+
+    def abrir(self, hash_foto: str) -> BinaryIO:
+        return self.backend.abrir(hash_foto)
+
+    def ler_em_blocos(self, hash_foto: str, tamanho_bloco: int = TAMANHO_BLOCO) -> Iterator[bytes]:
+        """
+        Lê a foto em blocos, sem carregar o arquivo inteiro em memória
+        """
+        with self.backend.abrir(hash_foto) as arquivo:
+            while True:
+                bloco = arquivo.read(tamanho_bloco)
+                if not bloco:
+                    break
+                yield bloco
+
+    def remover(self, hash_foto: str):
+        self.backend.remover(hash_foto)
+
+
+# Instância padrão usada pela aplicação
+armazem_fotos = ArmazemFotos(BackendLocal(FOTOS_DIR))
@@ -0,0 +1,133 @@
+import difflib
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from services.acoes import AcoesChecklist, MarcarConferido, ReiniciarChecklist, VerificarFaltantes
+from services.definicoes import DefinicaoChecklist, normalizar_texto
+
+# Confiança mínima para responder sem consultar o LLM
+LIMIAR_CONFIANCA = 0.85
+
+# Palavras ignoradas na extração dos itens
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "ja", "tambem", "um", "uma",
+    "uns", "umas", "meu", "minha", "meus", "minhas", "com", "que", "aqui", "esta", "estao",
+    "todos", "todas", "item", "itens", "foi", "foram", "eu", "tudo", "certo", "pronto",
+}
+
+PADRAO_FALTANTES = re.compile(
+    r"\b(falta|faltam|faltando|faltante|faltantes|pendente|pendentes|pendencia|pendencias|"
+    r"o que ainda|quais itens|status|progresso)\b"
+)
+PADRAO_REINICIAR = re.compile(
+    r"\b(reiniciar|reinicia|reinicie|recomecar|recomeca|recomece|resetar|reset|zerar|"
+    r"do zero|comecar de novo)\b"
+)
+PADRAO_MARCAR = re.compile(
+    r"\b(conferi|conferido|conferidos|conferida|conferidas|confere|confirmo|confirmado|confirmados|"
+    r"verifiquei|verificado|verificados|chequei|checado|checados|marcar|marca|marque|tenho|recebi|ok)\b"
+)
+
+
+class MotorIntencoes:
+    """
+    Interpretador local (regras + correspondência aproximada) para as mensagens mais comuns.
+    Retorna None quando a confiança é baixa, para que a mensagem siga para o LLM.
+    """
+
+    def __init__(self, definicao: DefinicaoChecklist, limiar: float = LIMIAR_CONFIANCA):
+        self.limiar = limiar
+        # Os aliases vêm do índice da definição; aqui só saem as stopwords, como nas mensagens
+        self._aliases: Dict[int, Dict[str, str]] = {}
+        for dia, checklist in definicao.dias.items():
+            aliases = {}
+            for forma, item in checklist.aliases.items():
+                forma = " ".join(t for t in forma.split() if t not in STOPWORDS)
+                if forma:
+                    aliases.setdefault(forma, item)
+            self._aliases[dia] = aliases
+        self._lock = threading.Lock()
+        self.total = 0
+        self.resolvidas = 0
+
+    # === Interpretação ===
+
+    def interpretar(self, texto: str, dia: int = 1) -> Optional[AcoesChecklist]:
+        acao, confianca = self.classificar(texto, dia)
+        with self._lock:
+            self.total += 1
+            if acao is not None and confianca >= self.limiar:
+                self.resolvidas += 1
+                return acao
+        return None
+
+    def classificar(self, texto: str, dia: int = 1) -> Tuple[Optional[AcoesChecklist], float]:
+        """
+        Retorna a ação identificada e a confiança (0 a 1)
+        """
+        normalizado = normalizar_texto(texto)
+        faltantes = PADRAO_FALTANTES.search(normalizado) is not None
+        reiniciar = PADRAO_REINICIAR.search(normalizado) is not None
+        marcar = PADRAO_MARCAR.search(normalizado) is not None
+
+        # Mais de uma intenção na mesma mensagem: deixa para o LLM
+        if faltantes + reiniciar + marcar != 1:
+            return None, 0.0
+        if faltantes:
+            return VerificarFaltantes(action="verificar_faltantes"), 1.0
+        if reiniciar:
+            return ReiniciarChecklist(action="reiniciar_checklist"), 1.0
+
+        restante = PADRAO_MARCAR.sub(" ", normalizado)
+        itens, confianca = self._extrair_itens(restante, dia)
+        if not itens:
+            return None, 0.0
+        return MarcarConferido(action="marcar_conferido", itens=itens), confianca
+
+    def _extrair_itens(self, texto: str, dia: int) -> Tuple[List[str], float]:
+        """
+        Casa a maior sequência de palavras possível com os nomes dos itens.
+        Palavras que não casam com nenhum item derrubam a confiança.
+        """
+        aliases = self._aliases.get(dia, {})
+        tokens = [t for t in texto.split() if t not in STOPWORDS]
+        itens: List[str] = []
+        confianca = 1.0
+        i = 0
+        while i < len(tokens):
+            encontrado = None
+            maximo = min(5, len(tokens) - i)
+            # Primeiro a correspondência exata, depois a aproximada (erros de digitação)
+            for n in range(maximo, 0, -1):
+                trecho = " ".join(tokens[i:i + n])
+                if trecho in aliases:
+                    encontrado = (aliases[trecho], n, 1.0)
+                    break
+            if encontrado is None:
+                for n in range(maximo, 0, -1):
+                    trecho = " ".join(tokens[i:i + n])
+                    parecido = difflib.get_close_matches(trecho, aliases.keys(), n=1, cutoff=self.limiar)
+                    if parecido:
+                        razao = difflib.SequenceMatcher(None, trecho, parecido[0]).ratio()
+                        encontrado = (aliases[parecido[0]], n, razao)
+                        break
+            if encontrado is None:
+                return itens, 0.0
+            item, n, razao = encontrado
+            if item not in itens:
+                itens.append(item)
+            confianca = min(confianca, razao)
+            i += n
+        return itens, confianca
+
+    # === Métricas ===
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "mensagens": self.total,
+                "resolvidas_localmente": self.resolvidas,
+                "encaminhadas_llm": self.total - self.resolvidas,
+                "taxa_acerto": round(self.resolvidas / self.total, 3) if self.total else None,
+            }
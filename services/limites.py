@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# === Limites (variáveis de ambiente) ===
+LIMITE_REMETENTE_TAXA = float(os.getenv("LIMITE_REMETENTE_TAXA", "0.5"))  # mensagens/s por remoteJid
+LIMITE_REMETENTE_RAJADA = float(os.getenv("LIMITE_REMETENTE_RAJADA", "10"))
+LIMITE_GLOBAL_TAXA = float(os.getenv("LIMITE_GLOBAL_TAXA", "20"))  # mensagens/s no total
+LIMITE_GLOBAL_RAJADA = float(os.getenv("LIMITE_GLOBAL_RAJADA", "100"))
+LIMITE_FILA_MAXIMA = int(os.getenv("LIMITE_FILA_MAXIMA", "1000"))  # eventos pendentes antes de recusar
+LIMITE_ATRASO_MAXIMO = float(os.getenv("LIMITE_ATRASO_MAXIMO", "300"))  # segundos de atraso para imagens
+LIMITE_AVISO_INTERVALO = float(os.getenv("LIMITE_AVISO_INTERVALO", "60"))  # um "aguarde" por remetente
+LIMITE_MAX_REMETENTES = int(os.getenv("LIMITE_MAX_REMETENTES", "10000"))  # baldes mantidos em memória
+
+# Por quanto tempo a profundidade da fila é reaproveitada (evita um COUNT por requisição)
+INTERVALO_PROFUNDIDADE = 1.0
+
+
+class BaldeTokens:
+    """
+    Token bucket. O saldo pode ficar negativo quando um evento é aceito com atraso:
+    a "dívida" espaça os próximos eventos do mesmo balde
+    """
+
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self._atualizado = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self._atualizado) * self.taxa)
+        self._atualizado = agora
+
+    def espera(self) -> float:
+        """
+        Segundos até haver um token disponível (0 = disponível agora)
+        """
+        self._repor()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def consumir(self):
+        self._repor()
+        self.tokens -= 1
+
+    def estado(self) -> dict:
+        self._repor()
+        return {"tokens": round(self.tokens, 2), "taxa": self.taxa, "capacidade": self.capacidade}
+
+
+@dataclass
+class Decisao:
+    """
+    Resultado da avaliação de um evento:
+    - aceitar: processar agora (atraso = 0) ou enfileirar com atraso (segundos)
+    - recusar: responder sem processar; `avisar` indica se cabe o "aguarde" ao remetente
+    """
+    aceitar: bool
+    atraso: float = 0.0
+    motivo: Optional[str] = None
+    avisar: bool = False
+    retry_after: Optional[int] = None
+
+
+class LimitadorWebhook:
+    """
+    Rate limiting do /webhook: um token bucket por remoteJid, um global e
+    backpressure pela profundidade da fila. Imagens acima do limite são
+    enfileiradas com atraso; textos são recusados com um único "aguarde" por intervalo.
+    """
+
+    def __init__(
+        self,
+        profundidade_fila: Callable[[], int],
+        taxa_remetente: float = LIMITE_REMETENTE_TAXA,
+        rajada_remetente: float = LIMITE_REMETENTE_RAJADA,
+        taxa_global: float = LIMITE_GLOBAL_TAXA,
+        rajada_global: float = LIMITE_GLOBAL_RAJADA,
+        fila_maxima: int = LIMITE_FILA_MAXIMA,
+    ):
+        self.profundidade_fila = profundidade_fila
+        self.taxa_remetente = taxa_remetente
+        self.rajada_remetente = rajada_remetente
+        self.fila_maxima = fila_maxima
+        self._global = BaldeTokens(taxa_global, rajada_global)
+        self._remetentes: "OrderedDict[str, BaldeTokens]" = OrderedDict()
+        self._avisos: "OrderedDict[str, float]" = OrderedDict()  # remoteJid -> último "aguarde"
+        self._lock = threading.Lock()
+        self._profundidade = (0.0, 0)  # (medida_em, valor)
+        # Contadores
+        self.aceitos = 0
+        self.atrasados = 0
+        self.recusados = 0
+        self.avisos_enviados = 0
+
+    def _balde(self, remote_jid: str) -> BaldeTokens:
+        # Chamado com self._lock adquirido
+        balde = self._remetentes.get(remote_jid)
+        if balde is None:
+            balde = BaldeTokens(self.taxa_remetente, self.rajada_remetente)
+            self._remetentes[remote_jid] = balde
+            while len(self._remetentes) > LIMITE_MAX_REMETENTES:
+                self._remetentes.popitem(last=False)
+        self._remetentes.move_to_end(remote_jid)
+        return balde
+
+    def _fila_atual(self) -> int:
+        medida_em, valor = self._profundidade
+        if time.monotonic() - medida_em > INTERVALO_PROFUNDIDADE:
+            valor = self.profundidade_fila()
+            self._profundidade = (time.monotonic(), valor)
+        return valor
+
+    def _pode_avisar(self, remote_jid: str) -> bool:
+        # Chamado com self._lock adquirido: coalesce os "aguarde" de um remetente
+        agora = time.monotonic()
+        if agora - self._avisos.get(remote_jid, -LIMITE_AVISO_INTERVALO) < LIMITE_AVISO_INTERVALO:
+            return False
+        self._avisos[remote_jid] = agora
+        self._avisos.move_to_end(remote_jid)
+        while len(self._avisos) > LIMITE_MAX_REMETENTES:
+            self._avisos.popitem(last=False)
+        self.avisos_enviados += 1
+        return True
+
+    def avaliar(self, remote_jid: str, imagem: bool) -> Decisao:
+        fila = self._fila_atual()
+        with self._lock:
+            if fila >= self.fila_maxima:
+                self.recusados += 1
+                return Decisao(False, motivo="fila cheia", retry_after=30)
+
+            balde = self._balde(remote_jid)
+            espera = max(balde.espera(), self._global.espera())
+            if espera == 0:
+                balde.consumir()
+                self._global.consumir()
+                self.aceitos += 1
+                return Decisao(True)
+
+            if imagem and espera <= LIMITE_ATRASO_MAXIMO:
+                # Imagem excedente: aceita com atraso (fica na fila, não é perdida)
+                balde.consumir()
+                self._global.consumir()
+                self.atrasados += 1
+                return Decisao(True, atraso=espera, motivo="limite excedido", avisar=self._pode_avisar(remote_jid))
+
+            self.recusados += 1
+            return Decisao(False, motivo="limite excedido", avisar=self._pode_avisar(remote_jid),
+                           retry_after=int(espera) + 1)
+
+    def estado(self, remetentes: int = 20) -> dict:
+        """
+        Configuração, baldes mais consumidos e contadores (para ajuste dos limites)
+        """
+        with self._lock:
+            baldes = sorted(
+                ((remote_jid, balde.estado()) for remote_jid, balde in self._remetentes.items()),
+                key=lambda par: par[1]["tokens"],
+            )[:remetentes]
+            return {
+                "configuracao": {
+                    "remetente_taxa": self.taxa_remetente,
+                    "remetente_rajada": self.rajada_remetente,
+                    "fila_maxima": self.fila_maxima,
+                    "atraso_maximo": LIMITE_ATRASO_MAXIMO,
+                    "aviso_intervalo": LIMITE_AVISO_INTERVALO,
+                },
+                "global": self._global.estado(),
+                "fila_pendentes": self._profundidade[1],
+                "remetentes_ativos": len(self._remetentes),
+                "remetentes_mais_limitados": [{"remote_jid": jid, **estado} for jid, estado in baldes],
+                "aceitos": self.aceitos,
+                "atrasados": self.atrasados,
+                "recusados": self.recusados,
+                "avisos_enviados": self.avisos_enviados,
+            }
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from typing import Dict, Iterator
+from urllib.parse import urlparse
+
+import requests
+
+from services.fotos import TAMANHO_BLOCO, ArmazemFotos, FotoRef, armazem_fotos, detectar_mime
+
+# === Limites do download (variáveis de ambiente) ===
+MIDIA_TAMANHO_MAXIMO = int(os.getenv("MIDIA_TAMANHO_MAXIMO", str(15 * 1024 * 1024)))  # bytes
+MIDIA_PRAZO = float(os.getenv("MIDIA_PRAZO", "30"))  # segundos para o download completo
+MIDIA_TIMEOUT_CONEXAO = float(os.getenv("MIDIA_TIMEOUT_CONEXAO", "5"))
+MIDIA_MAX_DOWNLOADS = int(os.getenv("MIDIA_MAX_DOWNLOADS", "16"))  # simultâneos, no total
+MIDIA_MAX_POR_HOST = int(os.getenv("MIDIA_MAX_POR_HOST", "4"))  # simultâneos, por host
+
+
+class ErroMidia(Exception):
+    """
+    Falha no download da mídia. `temporario` indica se vale a pena tentar de novo
+    """
+
+    def __init__(self, mensagem: str, temporario: bool = False):
+        super().__init__(mensagem)
+        self.temporario = temporario
+
+
+class BaixadorMidia:
+    """
+    Download de imagens em streaming, direto para o armazenamento de fotos:
+    memória limitada a um bloco por download, tamanho máximo, prazo total,
+    limite de downloads simultâneos (global e por host) e tipo detectado pelos magic bytes.
+    """
+
+    def __init__(
+        self,
+        armazem: ArmazemFotos = armazem_fotos,
+        tamanho_maximo: int = MIDIA_TAMANHO_MAXIMO,
+        prazo: float = MIDIA_PRAZO,
+        max_downloads: int = MIDIA_MAX_DOWNLOADS,
+        max_por_host: int = MIDIA_MAX_POR_HOST,
+    ):
+        self.armazem = armazem
+        self.tamanho_maximo = tamanho_maximo
+        self.prazo = prazo
+        self.max_por_host = max_por_host
+        self._limite_global = threading.BoundedSemaphore(max_downloads)
+        self._limites_host: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _sessao(self) -> requests.Session:
+        # requests.Session não é thread-safe: uma por thread, reaproveitando conexões
+        if not hasattr(self._local, "sessao"):
+            self._local.sessao = requests.Session()
+        return self._local.sessao
+
+    def _limite_host(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._limites_host:
+                self._limites_host[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._limites_host[host]
+
+    def baixar(self, url: str) -> FotoRef:
+        """
+        Baixa a imagem e grava no armazenamento. Retorna a referência (hash, tamanho, mime)
+        """
+        host = urlparse(url).hostname or ""
+        inicio = time.monotonic()
+
+        if not self._limite_global.acquire(timeout=self.prazo):
+            raise ErroMidia("muitos downloads simultâneos", temporario=True)
+        try:
+            limite_host = self._limite_host(host)
+            if not limite_host.acquire(timeout=max(0.0, self.prazo - (time.monotonic() - inicio))):
+                raise ErroMidia(f"muitos downloads simultâneos de {host}", temporario=True)
+            try:
+                return self._baixar(url, inicio)
+            finally:
+                limite_host.release()
+        finally:
+            self._limite_global.release()
+
+    def _baixar(self, url: str, inicio: float) -> FotoRef:
+        restante = self.prazo - (time.monotonic() - inicio)
+        with self._sessao().get(
+            url,
+            stream=True,
+            timeout=(MIDIA_TIMEOUT_CONEXAO, max(1.0, restante)),
+        ) as resposta:
+            if resposta.status_code != 200:
+                raise ErroMidia(f"Erro HTTP {resposta.status_code}", temporario=resposta.status_code >= 500)
+
+            tamanho_declarado = resposta.headers.get("Content-Length")
+            if tamanho_declarado and tamanho_declarado.isdigit() and int(tamanho_declarado) > self.tamanho_maximo:
+                raise ErroMidia(f"imagem maior que {self.tamanho_maximo // (1024 * 1024)} MB")
+
+            return self.armazem.salvar_stream(self._ler_blocos(resposta, inicio))
+
+    def _ler_blocos(self, resposta: requests.Response, inicio: float) -> Iterator[bytes]:
+        """
+        Repassa os blocos do corpo verificando prazo, tamanho e o tipo real do arquivo
+        """
+        cabecalho = b""
+        verificado = False
+        tamanho = 0
+        for bloco in resposta.iter_content(chunk_size=TAMANHO_BLOCO):
+            if not bloco:
+                continue
+            tamanho += len(bloco)
+            if tamanho > self.tamanho_maximo:
+                raise ErroMidia(f"imagem maior que {self.tamanho_maximo // (1024 * 1024)} MB")
+            if time.monotonic() - inicio > self.prazo:
+                raise ErroMidia("tempo limite do download excedido", temporario=True)
+            if not verificado:
+                cabecalho += bloco[:16]
+                if len(cabecalho) >= 16:
+                    self._verificar_tipo(cabecalho)
+                    verificado = True
+            yield bloco
+        if not verificado:
+            self._verificar_tipo(cabecalho)
+
+    @staticmethod
+    def _verificar_tipo(cabecalho: bytes):
+        if detectar_mime(cabecalho) is None:
+            raise ErroMidia("o arquivo recebido não é uma imagem JPEG, PNG, GIF ou WebP")
+
+
+# Instância compartilhada pela aplicação
+baixador_midia = BaixadorMidia()
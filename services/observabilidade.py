@@ -0,0 +1,306 @@
+"""
+Logs estruturados e métricas do processamento do webhook
+
+- Logs: o logging padrão com um QueueHandler (quem loga só enfileira o registro) e um
+  QueueListener que formata (JSON por padrão) e escreve em thread própria
+- Métricas: histogramas por etapa (parse, intencao, download, banco, envio, evento),
+  contadores e medidores, exportados no formato texto do Prometheus em /metrics
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# === Configuração (variáveis de ambiente) ===
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json")  # json ou texto
+
+# Limites dos baldes dos histogramas de duração (segundos)
+BALDES_DURACAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+
+# Identificador da mensagem em processamento, anexado a todos os logs da mesma thread/tarefa
+rastreio: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rastreio", default=None)
+
+
+# === Logs ===
+
+# Atributos de todo LogRecord; o que sobra veio de `extra=` e vira campo do JSON
+_CAMPOS_REGISTRO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "rastreio"}
+
+
+class FormatadorJson(logging.Formatter):
+    """
+    Uma linha JSON por registro: ts, nivel, logger, msg, rastreio e os campos de `extra=`
+    """
+
+    def format(self, registro: logging.LogRecord) -> str:
+        dados = {
+            "ts": datetime.utcfromtimestamp(registro.created).isoformat(timespec="milliseconds") + "Z",
+            "nivel": registro.levelname,
+            "logger": registro.name,
+            "msg": registro.getMessage(),
+        }
+        if getattr(registro, "rastreio", None):
+            dados["rastreio"] = registro.rastreio
+        for campo, valor in vars(registro).items():
+            if campo not in _CAMPOS_REGISTRO:
+                dados[campo] = valor
+        if registro.exc_info:
+            dados["erro"] = self.formatException(registro.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class _FiltroRastreio(logging.Filter):
+    # Lê o contextvar na thread de quem loga (o listener roda em outra thread)
+    def filter(self, registro: logging.LogRecord) -> bool:
+        registro.rastreio = rastreio.get()
+        return True
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def configurar_logs(nivel: str = LOG_NIVEL, formato: str = LOG_FORMATO):
+    """
+    Direciona o logger raiz para a fila assíncrona (idempotente)
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        saida = logging.StreamHandler(sys.stdout)
+        if formato == "json":
+            saida.setFormatter(FormatadorJson())
+        else:
+            saida.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(rastreio)s] %(message)s"))
+
+        fila = queue.SimpleQueue()
+        entrada = logging.handlers.QueueHandler(fila)
+        entrada.addFilter(_FiltroRastreio())
+
+        raiz = logging.getLogger()
+        raiz.handlers[:] = [entrada]
+        raiz.setLevel(nivel)
+
+        _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=True)
+        _listener.start()
+        atexit.register(encerrar_logs)
+
+
+def encerrar_logs():
+    """
+    Escreve os registros pendentes e para a thread do listener
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        listener, _listener = _listener, None
+    listener.stop()
+
+
+def definir_rastreio(dados: dict) -> contextvars.Token:
+    """
+    Usa o id da mensagem (data.key.id) como rastreio dos logs seguintes
+    """
+    chave = dados.get("data", {}).get("key", {})
+    return rastreio.set(str(chave.get("id") or chave.get("remoteJid") or "") or None)
+
+
+# === Métricas ===
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Contador:
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor: float = 1, **rotulos):
+        chave = tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for chave, valor in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}")
+        return linhas
+
+
+class Histograma:
+    """
+    Histograma cumulativo no modelo do Prometheus (_bucket, _sum, _count) por combinação de rótulos
+    """
+
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = (), baldes=BALDES_DURACAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.baldes = tuple(sorted(baldes))
+        self._series: Dict[Tuple, list] = {}  # rótulos -> [contagens por balde..., soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [0] * len(self.baldes) + [0.0, 0]
+            for indice, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    serie[indice] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = sorted((chave, list(serie)) for chave, serie in self._series.items())
+        for chave, serie in series:
+            acumulado = 0
+            for limite, contagem in zip(self.baldes, serie):
+                acumulado += contagem
+                le = f'le="{limite}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {serie[-1]}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {serie[-2]:.6f}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {serie[-1]}")
+        return linhas
+
+    def resumo(self, percentis=(0.5, 0.95, 0.99)) -> List[dict]:
+        """
+        Por série: rótulos, contagem, média e percentis estimados pelos baldes (interpolação linear)
+        """
+        with self._lock:
+            series = sorted((chave, list(serie)) for chave, serie in self._series.items())
+        resultado = []
+        for chave, serie in series:
+            total = serie[-1]
+            item = {**dict(zip(self.rotulos, chave)), "contagem": total, "media": serie[-2] / total if total else None}
+            for percentil in percentis:
+                alvo, acumulado, anterior = percentil * total, 0, 0.0
+                estimativa = self.baldes[-1]
+                for limite, contagem in zip(self.baldes, serie):
+                    if contagem and acumulado + contagem >= alvo:
+                        estimativa = anterior + (limite - anterior) * (alvo - acumulado) / contagem
+                        break
+                    acumulado += contagem
+                    anterior = limite
+                item[f"p{round(percentil * 100)}"] = estimativa
+            resultado.append(item)
+        return resultado
+
+
+class Medidor:
+    """
+    Valor instantâneo lido no momento da coleta (ex.: profundidade da fila)
+    """
+
+    def __init__(self, nome: str, descricao: str, funcao: Callable[[], float]):
+        self.nome = nome
+        self.descricao = descricao
+        self.funcao = funcao
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} gauge"]
+        try:
+            linhas.append(f"{self.nome} {_numero(self.funcao())}")
+        except Exception as e:
+            logger.warning("Erro ao coletar o medidor %s: %s", self.nome, e)
+        return linhas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome: str, descricao: str, rotulos: Iterable[str] = ()) -> Contador:
+        return self._registrar(Contador(nome, descricao, rotulos))
+
+    def histograma(self, nome: str, descricao: str, rotulos: Iterable[str] = (), baldes=BALDES_DURACAO) -> Histograma:
+        return self._registrar(Histograma(nome, descricao, rotulos, baldes))
+
+    def medidor(self, nome: str, descricao: str, funcao: Callable[[], float]) -> Medidor:
+        return self._registrar(Medidor(nome, descricao, funcao))
+
+    def exportar(self) -> str:
+        """
+        Todas as métricas no formato texto do Prometheus (text/plain; version=0.0.4)
+        """
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+# Instância compartilhada pela aplicação
+registro_metricas = RegistroMetricas()
+
+DURACAO_ETAPA = registro_metricas.histograma(
+    "checklist_etapa_duracao_segundos",
+    "Duração de cada etapa do processamento (parse, intencao, download, banco, envio, evento)",
+    ("etapa", "tipo", "resultado"),
+)
+
+
+@contextmanager
+def medir(etapa: str, tipo: str = ""):
+    """
+    Span de uma etapa: observa a duração no histograma e, em DEBUG, loga o span.
+    O bloco pode ajustar span["tipo"] quando só descobre o tipo no meio (ex.: local/cache/llm)
+    """
+    span = {"tipo": tipo}
+    resultado = "ok"
+    inicio = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        resultado = "erro"
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        DURACAO_ETAPA.observar(duracao, etapa=etapa, tipo=span["tipo"], resultado=resultado)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span", extra={
+                "etapa": etapa, "tipo": span["tipo"], "resultado": resultado,
+                "duracao_ms": round(duracao * 1000, 3),
+            })
@@ -0,0 +1,173 @@
+"""
+Verificação das fotos por OCR: o texto impresso na foto (envelopes, listas, atas) é extraído
+localmente (Tesseract, via pytesseract) no pool de processos das imagens e comparado com as
+palavras esperadas do item (`palavras` na definição do checklist). O resultado, de 0 a 1,
+fica em checklist_item.confianca, ao lado de `presente`.
+
+Roda depois da normalização da foto, em segundo plano: nunca atrasa a resposta do webhook.
+O texto extraído fica em cache pelo hash da foto (a mesma foto não é lida duas vezes).
+"""
+import difflib
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Optional, Tuple
+
+from database.database import ChecklistDatabase, get_db, insert_dialeto
+from database.models import TextoOcr
+from services.definicoes import definicao_checklist, normalizar_texto
+from services.eventos import barramento_eventos
+from services.fotos import ArmazemFotos, armazem_fotos, ler_ref
+from services.processamento_imagem import Image, ImageOps, ProcessadorImagens, processador_imagens
+
+try:
+    import pytesseract
+except ImportError:  # pytesseract é opcional (e requer o executável tesseract): sem ele não há verificação
+    pytesseract = None
+
+# === Configuração (variáveis de ambiente) ===
+OCR_VERIFICACAO = os.getenv("OCR_VERIFICACAO", "0") == "1"
+OCR_IDIOMA = os.getenv("OCR_IDIOMA", "por")
+OCR_SEMELHANCA = float(os.getenv("OCR_SEMELHANCA", "0.8"))  # tolerância a erros de leitura em cada palavra
+OCR_CONFIANCA_MINIMA = float(os.getenv("OCR_CONFIANCA_MINIMA", "0.5"))  # abaixo disso a foto é sinalizada
+
+logger = logging.getLogger(__name__)
+
+
+def extrair_texto(armazem: ArmazemFotos, hash_foto: str, idioma: str) -> str:
+    """
+    Executada no pool de processos: texto da foto, normalizado (sem acentos e pontuação)
+    """
+    with armazem.abrir(hash_foto) as arquivo:
+        imagem = ImageOps.exif_transpose(Image.open(arquivo)).convert("L")
+    return normalizar_texto(pytesseract.image_to_string(imagem, lang=idioma))
+
+
+def calcular_confianca(texto: str, palavras: Tuple[str, ...], semelhanca: float = OCR_SEMELHANCA) -> float:
+    """
+    Fração das palavras esperadas encontradas no texto (iguais ou quase iguais)
+    """
+    lidas = set(texto.split())
+    encontradas = sum(
+        1 for palavra in palavras
+        if palavra in lidas or difflib.get_close_matches(palavra, lidas, n=1, cutoff=semelhanca)
+    )
+    return round(encontradas / len(palavras), 2)
+
+
+class VerificadorOcr:
+    """
+    Agenda o OCR da versão final da foto de cada item e grava a confiança da verificação
+    """
+
+    def __init__(self, processador: ProcessadorImagens = processador_imagens, armazem: ArmazemFotos = armazem_fotos,
+                 idioma: str = OCR_IDIOMA, confianca_minima: float = OCR_CONFIANCA_MINIMA):
+        self.processador = processador
+        self.armazem = armazem
+        self.idioma = idioma
+        self.confianca_minima = confianca_minima
+        self._lock = threading.Lock()
+        self.verificadas = 0
+        self.do_cache = 0
+        self.divergentes = 0
+        self.erros = 0
+
+    @property
+    def habilitado(self) -> bool:
+        return OCR_VERIFICACAO and pytesseract is not None and Image is not None
+
+    def agendar(self, sessao_id: str, dia: int, campo: str, foto_ref: str) -> Optional[Future]:
+        """
+        Agenda a verificação da foto do item. Retorna None se já resolvida pelo cache ou se
+        o item não tem palavras esperadas (ex.: alicate, canetas)
+        """
+        checklist = definicao_checklist.dias.get(dia)
+        palavras = checklist.palavras.get(campo) if checklist else None
+        ref = ler_ref(foto_ref)
+        if not self.habilitado or not palavras or ref is None:
+            return None
+
+        texto = self.buscar_texto(ref.hash)
+        if texto is not None:
+            with self._lock:
+                self.do_cache += 1
+            self._aplicar(sessao_id, dia, campo, foto_ref, palavras, texto)
+            return None
+
+        futuro = self.processador.executar(extrair_texto, self.armazem, ref.hash, self.idioma)
+        futuro.add_done_callback(lambda f: self._concluir(f, sessao_id, dia, campo, foto_ref, palavras))
+        return futuro
+
+    def _concluir(self, futuro: Future, sessao_id: str, dia: int, campo: str, foto_ref: str, palavras: Tuple[str, ...]):
+        try:
+            texto = futuro.result()
+        except Exception as e:
+            # A foto continua registrada: apenas fica sem verificação (confianca = None)
+            with self._lock:
+                self.erros += 1
+            logger.warning("⚠️ Erro no OCR da foto de %s/%s: %s", sessao_id, campo, e)
+            return
+        try:
+            self._guardar_texto(ler_ref(foto_ref).hash, texto)
+        except Exception as e:
+            # Só o cache fica sem o texto: a verificação do item segue com ele
+            logger.warning("⚠️ Erro ao guardar o texto do OCR da foto de %s/%s: %s", sessao_id, campo, e)
+        try:
+            self._aplicar(sessao_id, dia, campo, foto_ref, palavras, texto)
+        except Exception as e:
+            with self._lock:
+                self.erros += 1
+            logger.warning("⚠️ Erro ao registrar o OCR da foto de %s/%s: %s", sessao_id, campo, e)
+
+    def _aplicar(self, sessao_id: str, dia: int, campo: str, foto_ref: str, palavras: Tuple[str, ...], texto: str):
+        confianca = calcular_confianca(texto, palavras)
+        if not ChecklistDatabase.registrar_confianca(sessao_id, dia, campo, foto_ref, confianca):
+            return  # a foto do item mudou enquanto era verificada
+        divergente = confianca < self.confianca_minima
+        with self._lock:
+            self.verificadas += 1
+            self.divergentes += divergente
+        if divergente:
+            logger.warning("🔎 Texto da foto não confere com o item", extra={
+                "sessao_id": sessao_id, "dia": dia, "item": campo, "confianca": confianca,
+            })
+            try:
+                barramento_eventos.publicar(
+                    "foto_divergente", sessao_id=sessao_id, dia=dia, item=campo, confianca=confianca,
+                )
+            except Exception as e:
+                logger.warning("⚠️ Erro ao publicar evento foto_divergente: %s", e)
+
+    # === Cache do texto extraído ===
+
+    def buscar_texto(self, hash_foto: str) -> Optional[str]:
+        with get_db() as db:
+            return db.query(TextoOcr.texto).filter(
+                TextoOcr.foto_hash == hash_foto, TextoOcr.idioma == self.idioma,
+            ).scalar()
+
+    def _guardar_texto(self, hash_foto: str, texto: str):
+        # A mesma foto pode ser lida por dois workers ao mesmo tempo: o primeiro texto fica
+        inserir = insert_dialeto()(TextoOcr.__table__).values(foto_hash=hash_foto, idioma=self.idioma, texto=texto)
+        with get_db() as db:
+            db.execute(inserir.on_conflict_do_nothing(index_elements=["foto_hash", "idioma"]))
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "habilitado": self.habilitado,
+                "verificadas": self.verificadas,
+                "do_cache": self.do_cache,
+                "divergentes": self.divergentes,
+                "erros": self.erros,
+            }
+
+
+# Instância compartilhada pela aplicação
+verificador_ocr = VerificadorOcr()
+
+if OCR_VERIFICACAO:
+    if pytesseract is None:
+        logger.warning("⚠️ OCR_VERIFICACAO=1, mas o pytesseract não está instalado: fotos sem verificação")
+    processador_imagens.ao_processar.append(verificador_ocr.agendar)
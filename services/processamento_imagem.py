@@ -0,0 +1,219 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database.database import ChecklistDatabase, get_db, insert_dialeto
+from database.models import FotoDerivada
+from services.fotos import ArmazemFotos, FotoRef, armazem_fotos, ler_ref
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional: sem ele as fotos ficam como foram recebidas
+    Image = None
+    ImageOps = None
+
+# === Configuração (variáveis de ambiente) ===
+IMAGEM_PROCESSAMENTO = os.getenv("IMAGEM_PROCESSAMENTO", "1") == "1"
+IMAGEM_PROCESSOS = int(os.getenv("IMAGEM_PROCESSOS", str(max(1, (os.cpu_count() or 2) // 2))))
+IMAGEM_MAX_DIMENSAO = int(os.getenv("IMAGEM_MAX_DIMENSAO", "1600"))  # px, maior lado
+IMAGEM_QUALIDADE = int(os.getenv("IMAGEM_QUALIDADE", "80"))
+IMAGEM_FORMATO = os.getenv("IMAGEM_FORMATO", "WEBP").upper()  # WEBP ou JPEG
+MINIATURA_DIMENSAO = int(os.getenv("MINIATURA_DIMENSAO", "256"))
+FOTOS_MANTER_ORIGINAL = os.getenv("FOTOS_MANTER_ORIGINAL", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+MIME_FORMATO = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def _gerar_versao(imagem, dimensao: int, formato: str, qualidade: int) -> bytes:
+    copia = imagem.copy()
+    copia.thumbnail((dimensao, dimensao), Image.LANCZOS)
+    saida = io.BytesIO()
+    # Sem o parâmetro exif: os metadados (GPS, câmera...) não são copiados
+    copia.save(saida, format=formato, quality=qualidade, optimize=True)
+    return saida.getvalue()
+
+
+def normalizar_foto(armazem: ArmazemFotos, hash_origem: str, max_dimensao: int, miniatura: int,
+                    formato: str, qualidade: int) -> dict:
+    """
+    Executada no pool de processos: orienta, reduz, recomprime e gera a miniatura.
+    Retorna as referências das versões geradas
+    """
+    with armazem.abrir(hash_origem) as arquivo:
+        imagem = Image.open(arquivo)
+        imagem = ImageOps.exif_transpose(imagem)
+        if imagem.mode not in ("RGB", "L"):
+            imagem = imagem.convert("RGB")
+        imagem.load()
+
+    mime = MIME_FORMATO[formato]
+    normalizada = armazem.salvar(_gerar_versao(imagem, max_dimensao, formato, qualidade), mime)
+    reduzida = armazem.salvar(_gerar_versao(imagem, miniatura, formato, qualidade), mime)
+    return {"normalizada": str(normalizada), "miniatura": str(reduzida)}
+
+
+class ProcessadorImagens:
+    """
+    Normaliza as fotos recebidas em um pool de processos, fora do processamento do webhook.
+    Ao terminar, troca a referência do item pela versão normalizada e registra a miniatura.
+    """
+
+    def __init__(self, armazem: ArmazemFotos = armazem_fotos, processos: int = IMAGEM_PROCESSOS):
+        self.armazem = armazem
+        self.processos = processos
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Chamadas (sessao_id, dia, item, foto_ref) com a versão final da foto do item
+        # (a normalizada ou, sem processamento, a recebida). Ex.: verificação por OCR.
+        # Se retornarem um Future, o trabalho conta como pendente da sessão (ver quando_concluir)
+        self.ao_processar: List[Callable[[str, int, str, str], Optional[Future]]] = []
+        # (sessao_id, dia) -> trabalhos em andamento e funções à espera do fim deles
+        self._pendentes: Dict[Tuple[str, int], int] = {}
+        self._ao_concluir: Dict[Tuple[str, int], List[Callable[[], None]]] = {}
+
+    @property
+    def habilitado(self) -> bool:
+        return IMAGEM_PROCESSAMENTO and Image is not None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processos)
+            return self._pool
+
+    def executar(self, funcao, *args) -> Future:
+        """
+        Executa `funcao(*args)` no pool de processos (usado também por outras análises das fotos)
+        """
+        return self._executor().submit(funcao, *args)
+
+    def agendar(self, sessao_id: str, dia: int, campo: str, foto_ref: str) -> Optional[Future]:
+        """
+        Agenda a normalização da foto de um item. Retorna None se o processamento estiver desligado
+        """
+        ref = ler_ref(foto_ref)
+        if ref is None:
+            return None
+        if not self.habilitado:
+            self._notificar(sessao_id, dia, campo, foto_ref)
+            return None
+
+        # Mesma foto já normalizada antes (armazenamento endereçado por conteúdo)
+        derivadas = self.buscar_derivadas(ref.hash)
+        if "normalizada" in derivadas:
+            self._aplicar(sessao_id, dia, campo, ref, derivadas)
+            return None
+
+        futuro = self.executar(
+            normalizar_foto, self.armazem, ref.hash,
+            IMAGEM_MAX_DIMENSAO, MINIATURA_DIMENSAO, IMAGEM_FORMATO, IMAGEM_QUALIDADE,
+        )
+        futuro.add_done_callback(lambda f: self._concluir(f, sessao_id, dia, campo, ref))
+        self._acompanhar(sessao_id, dia, futuro)
+        return futuro
+
+    def _concluir(self, futuro: Future, sessao_id: str, dia: int, campo: str, ref: FotoRef):
+        try:
+            derivadas = futuro.result()
+            self._registrar_derivadas(ref.hash, derivadas)
+            self._aplicar(sessao_id, dia, campo, ref, derivadas)
+        except Exception as e:
+            # A foto original continua válida: apenas não foi otimizada
+            logger.warning("⚠️ Erro ao normalizar a foto %s de %s/%s: %s", ref.hash[:12], sessao_id, campo, e)
+            self._notificar(sessao_id, dia, campo, str(ref))
+
+    def _aplicar(self, sessao_id: str, dia: int, campo: str, ref: FotoRef, derivadas: dict):
+        substituida, em_uso = ChecklistDatabase.substituir_foto(sessao_id, dia, campo, str(ref), derivadas["normalizada"])
+        normalizada = ler_ref(derivadas["normalizada"])
+        # O original só sai do armazenamento quando nenhum item o referencia (a mesma foto
+        # enviada para outro item ainda aguarda a própria troca)
+        if substituida and not em_uso and not FOTOS_MANTER_ORIGINAL and normalizada.hash != ref.hash:
+            self.armazem.remover(ref.hash)
+        if substituida:
+            self._notificar(sessao_id, dia, campo, derivadas["normalizada"])
+
+    def _notificar(self, sessao_id: str, dia: int, campo: str, foto_ref: str):
+        for funcao in self.ao_processar:
+            try:
+                resultado = funcao(sessao_id, dia, campo, foto_ref)
+            except Exception as e:
+                logger.warning("⚠️ Erro ao notificar o processamento da foto de %s/%s: %s", sessao_id, campo, e)
+            else:
+                if isinstance(resultado, Future):
+                    self._acompanhar(sessao_id, dia, resultado)
+
+    # === Trabalhos pendentes por sessão ===
+
+    def _acompanhar(self, sessao_id: str, dia: int, futuro: Future):
+        # Registrado depois do callback que conclui o trabalho: ele roda antes de _liberar e
+        # já acompanha o que agendar em seguida (ex.: o OCR da versão normalizada)
+        chave = (sessao_id, dia)
+        with self._lock:
+            self._pendentes[chave] = self._pendentes.get(chave, 0) + 1
+        futuro.add_done_callback(lambda f: self._liberar(chave))
+
+    def _liberar(self, chave: Tuple[str, int]):
+        with self._lock:
+            restantes = self._pendentes[chave] - 1
+            if restantes:
+                self._pendentes[chave] = restantes
+                return
+            del self._pendentes[chave]
+            funcoes = self._ao_concluir.pop(chave, [])
+        for funcao in funcoes:
+            try:
+                funcao()
+            except Exception as e:
+                logger.warning("⚠️ Erro ao notificar o fim do processamento das fotos de %s: %s", chave[0], e)
+
+    def quando_concluir(self, sessao_id: str, dia: int, funcao: Callable[[], None]):
+        """
+        Chama `funcao` quando as fotos da sessão terminarem de ser processadas (normalização e
+        os trabalhos de ao_processar, como o OCR); na hora, se não houver nenhuma em andamento
+        """
+        chave = (sessao_id, dia)
+        with self._lock:
+            if self._pendentes.get(chave):
+                self._ao_concluir.setdefault(chave, []).append(funcao)
+                return
+        funcao()
+
+    # === Versões derivadas ===
+
+    @staticmethod
+    def _registrar_derivadas(hash_origem: str, derivadas: dict):
+        linhas = [
+            {"hash_origem": hash_origem, "variante": variante, "foto_ref": foto_ref}
+            for variante, foto_ref in derivadas.items()
+        ]
+        # A versão normalizada é a referência final: sua miniatura é a mesma
+        normalizada = ler_ref(derivadas["normalizada"])
+        if normalizada.hash != hash_origem:
+            linhas.append({"hash_origem": normalizada.hash, "variante": "miniatura", "foto_ref": derivadas["miniatura"]})
+        # Upsert: dois workers podem normalizar a mesma foto ao mesmo tempo
+        inserir = insert_dialeto()(FotoDerivada.__table__)
+        with get_db() as db:
+            for linha in linhas:
+                db.execute(inserir.values(**linha).on_conflict_do_update(
+                    index_elements=["hash_origem", "variante"], set_={"foto_ref": linha["foto_ref"]},
+                ))
+
+    @staticmethod
+    def buscar_derivadas(hash_origem: str) -> dict:
+        """
+        Retorna {variante: foto_ref} das versões geradas a partir da foto
+        """
+        with get_db() as db:
+            linhas = db.query(FotoDerivada.variante, FotoDerivada.foto_ref).filter(
+                FotoDerivada.hash_origem == hash_origem
+            ).all()
+            return {variante: foto_ref for variante, foto_ref in linhas}
+
+
+# Instância compartilhada pela aplicação
+processador_imagens = ProcessadorImagens()
@@ -1,19 +1,329 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
 import httpx
 
-async def enviar_mensagem_whatsapp(telefone: str, mensagem: str):
-    url = "http://localhost:8080/message/sendText/cebraspe-checklist"
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": "3846A760F91E-4FD3-A3D7-898ABC4B7EC8"
-    }
-    payload = {
-        "number": telefone,
-        "text": mensagem
-    }
+from database.database import get_db
+from database.models import MensagemPendente
+from services.observabilidade import medir
+
+# === Configuração do Evolution API ===
+EVOLUTION_API_URL = os.getenv("EVOLUTION_API_URL", "http://localhost:8080")
+EVOLUTION_INSTANCIA = os.getenv("EVOLUTION_INSTANCIA", "cebraspe-checklist")
+EVOLUTION_API_KEY = os.getenv("EVOLUTION_API_KEY", "3846A760F91E-4FD3-A3D7-898ABC4B7EC8")
+
+# Pool de conexões keep-alive
+WHATSAPP_MAX_CONEXOES = int(os.getenv("WHATSAPP_MAX_CONEXOES", "20"))
+WHATSAPP_TIMEOUT = float(os.getenv("WHATSAPP_TIMEOUT", "15"))  # segundos
+
+# Reenvio das mensagens não entregues (tabela whatsapp_pendentes)
+WHATSAPP_REENVIO_INTERVALO = float(os.getenv("WHATSAPP_REENVIO_INTERVALO", "10"))  # segundos; base do backoff
+WHATSAPP_REENVIO_BACKOFF_MAX = float(os.getenv("WHATSAPP_REENVIO_BACKOFF_MAX", "600"))
+WHATSAPP_REENVIO_MAX_TENTATIVAS = int(os.getenv("WHATSAPP_REENVIO_MAX_TENTATIVAS", "8"))
+
+# Mensagens pendentes reservadas por rodada de reenvio
+LOTE_REENVIO = 20
+
+logger = logging.getLogger(__name__)
+
+
+def _agora() -> datetime:
+    return datetime.utcnow()
+
+
+class EnviadorWhatsApp:
+    """
+    Serviço de envio de mensagens com um único event loop (em thread própria) e
+    um único httpx.AsyncClient, reaproveitando as conexões com o Evolution API.
+
+    Pode ser chamado de qualquer thread: enviar() agenda o envio e devolve um Future.
+    Mensagens não entregues vão para a outbox (whatsapp_pendentes) e são reenviadas em
+    segundo plano, com backoff: quem processou o evento não precisa repeti-lo.
+    """
+
+    def __init__(
+        self,
+        base_url: str = EVOLUTION_API_URL,
+        instancia: str = EVOLUTION_INSTANCIA,
+        api_key: str = EVOLUTION_API_KEY,
+        max_conexoes: int = WHATSAPP_MAX_CONEXOES,
+        timeout: float = WHATSAPP_TIMEOUT,
+        intervalo_reenvio: float = WHATSAPP_REENVIO_INTERVALO,
+        max_tentativas: int = WHATSAPP_REENVIO_MAX_TENTATIVAS,
+    ):
+        self.base_url = base_url
+        self.instancia = instancia
+        self.api_key = api_key
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self.intervalo_reenvio = intervalo_reenvio
+        self.max_tentativas = max_tentativas
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._reenvio: Optional[Future] = None
+        self._lock = threading.Lock()
+        # Métricas de envio
+        self._latencias = deque(maxlen=1000)  # ms dos últimos envios
+        self.enviadas = 0
+        self.falhas = 0
+        self.guardadas = 0
+        self.reenviadas = 0
+
+    # === Ciclo de vida ===
+
+    def iniciar(self):
+        """
+        Cria o event loop e o cliente HTTP (idempotente)
+        """
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            pronto = threading.Event()
+
+            def executar():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers={"Content-Type": "application/json", "apikey": self.api_key},
+                    limits=httpx.Limits(
+                        max_connections=self.max_conexoes,
+                        max_keepalive_connections=self.max_conexoes,
+                        keepalive_expiry=60,
+                    ),
+                    timeout=self.timeout,
+                )
+                pronto.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=executar, name="whatsapp-enviador", daemon=True)
+            self._thread.start()
+            pronto.wait()
+            self._loop = loop
+            if self.intervalo_reenvio > 0:
+                self._reenvio = asyncio.run_coroutine_threadsafe(self._reenviar_periodicamente(), loop)
+
+    def encerrar(self, timeout: float = 5):
+        with self._lock:
+            if self._loop is None:
+                return
+            loop, self._loop = self._loop, None
+            if self._reenvio is not None:
+                self._reenvio.cancel()
+                self._reenvio = None
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+
+    # === Envio ===
+
+    async def _enviar(self, telefone: str, mensagem: str) -> dict:
+        inicio = time.perf_counter()
+        try:
+            with medir("envio", tipo="texto"):
+                response = await self._client.post(
+                    f"/message/sendText/{self.instancia}",
+                    json={"number": telefone, "text": mensagem},
+                )
+                response.raise_for_status()
+                resultado = response.json()
+        except Exception:
+            self.falhas += 1
+            raise
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        self._latencias.append(latencia_ms)
+        self.enviadas += 1
+        logger.debug("📤 Mensagem enviada", extra={"telefone": telefone, "latencia_ms": round(latencia_ms, 1)})
+        return resultado
+
+    async def _enviar_ou_guardar(self, telefone: str, mensagem: str) -> dict:
+        try:
+            return await self._enviar(telefone, mensagem)
+        except Exception as e:
+            try:
+                await asyncio.to_thread(self._guardar_pendente, telefone, mensagem, e)
+            except Exception as erro_banco:
+                logger.error("❌ Mensagem para %s perdida (outbox indisponível): %s", telefone, erro_banco)
+            raise
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, json=payload)
-        print("📤 Resposta:", response.json())
+    def enviar(self, telefone: str, mensagem: str) -> Future:
+        """
+        Agenda o envio de uma mensagem (thread-safe). Falhas são registradas no log e a
+        mensagem fica na outbox para reenvio
+        """
+        self.iniciar()
+        futuro = asyncio.run_coroutine_threadsafe(self._enviar_ou_guardar(telefone, mensagem), self._loop)
+        futuro.add_done_callback(_registrar_falha_envio(telefone))
+        return futuro
 
+    def enviar_lote(self, mensagens: Iterable[Tuple[str, str]], timeout: Optional[float] = None) -> List:
+        """
+        Envia várias mensagens em paralelo pelo mesmo pool de conexões e aguarda todas.
+        Retorna, na mesma ordem, a resposta de cada envio ou a exceção ocorrida
+        """
+        self.iniciar()
 
+        async def enviar_todas():
+            return await asyncio.gather(
+                *(self._enviar(telefone, mensagem) for telefone, mensagem in mensagens),
+                return_exceptions=True,
+            )
 
+        return asyncio.run_coroutine_threadsafe(enviar_todas(), self._loop).result(timeout)
+
+    # === Outbox (mensagens não entregues) ===
+
+    def _espera(self, tentativas: int) -> float:
+        return min(self.intervalo_reenvio * (2 ** (tentativas - 1)), WHATSAPP_REENVIO_BACKOFF_MAX)
+
+    def _guardar_pendente(self, telefone: str, mensagem: str, erro: Exception):
+        with get_db() as db:
+            db.add(MensagemPendente(
+                telefone=telefone,
+                mensagem=mensagem,
+                status='pendente',
+                tentativas=1,
+                ultimo_erro=str(erro) or type(erro).__name__,
+                disponivel_em=_agora() + timedelta(seconds=self._espera(1)),
+            ))
+        self.guardadas += 1
+
+    def _reservar_pendentes(self) -> list:
+        """
+        Reserva as mensagens pendentes já disponíveis, na ordem em que foram geradas. A reserva
+        adia `disponivel_em` (outro processo não reenvia a mesma mensagem) e expira sozinha se
+        este processo parar no meio da rodada
+        """
+        agora = _agora()
+        reserva = agora + timedelta(seconds=self.timeout * (LOTE_REENVIO + 1))
+        with get_db() as db:
+            candidatas = (
+                db.query(MensagemPendente.id, MensagemPendente.telefone, MensagemPendente.mensagem,
+                         MensagemPendente.tentativas, MensagemPendente.disponivel_em)
+                .filter(MensagemPendente.status == 'pendente', MensagemPendente.disponivel_em <= agora)
+                .order_by(MensagemPendente.id)
+                .limit(LOTE_REENVIO)
+                .all()
+            )
+            reservadas = []
+            for candidata in candidatas:
+                # Compare-and-set pelo disponivel_em lido
+                if db.query(MensagemPendente).filter(
+                    MensagemPendente.id == candidata.id,
+                    MensagemPendente.disponivel_em == candidata.disponivel_em,
+                ).update({"disponivel_em": reserva}, synchronize_session=False):
+                    reservadas.append((candidata.id, candidata.telefone, candidata.mensagem, candidata.tentativas))
+        return reservadas
+
+    def _concluir_pendente(self, pendente_id: int, tentativas: int, erro: Optional[Exception]):
+        with get_db() as db:
+            consulta = db.query(MensagemPendente).filter(MensagemPendente.id == pendente_id)
+            if erro is None:
+                consulta.delete(synchronize_session=False)
+                return
+            descartada = tentativas >= self.max_tentativas
+            consulta.update({
+                "status": 'falhou' if descartada else 'pendente',
+                "tentativas": tentativas,
+                "ultimo_erro": str(erro) or type(erro).__name__,
+                "disponivel_em": _agora() + timedelta(seconds=self._espera(tentativas)),
+            }, synchronize_session=False)
+        if descartada:
+            logger.error("☠️ Mensagem pendente %d descartada após %d tentativa(s): %s", pendente_id, tentativas, erro)
+
+    async def _reenviar_pendentes(self) -> int:
+        reenviadas = 0
+        bloqueados = set()
+        for pendente_id, telefone, mensagem, tentativas in await asyncio.to_thread(self._reservar_pendentes):
+            # Depois de uma falha, as seguintes do mesmo telefone esperam (mantém a ordem)
+            if telefone in bloqueados:
+                continue
+            try:
+                await self._enviar(telefone, mensagem)
+            except Exception as e:
+                bloqueados.add(telefone)
+                await asyncio.to_thread(self._concluir_pendente, pendente_id, tentativas + 1, e)
+            else:
+                await asyncio.to_thread(self._concluir_pendente, pendente_id, tentativas, None)
+                reenviadas += 1
+        self.reenviadas += reenviadas
+        return reenviadas
+
+    async def _reenviar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo_reenvio)
+            try:
+                await self._reenviar_pendentes()
+            except Exception as e:
+                logger.warning("⚠️ Erro ao reenviar mensagens pendentes: %s", e)
+
+    def reenviar_pendentes(self, timeout: Optional[float] = None) -> int:
+        """
+        Reenvia agora as mensagens pendentes já disponíveis (o serviço faz isso sozinho a cada
+        `intervalo_reenvio` segundos). Retorna quantas foram entregues
+        """
+        self.iniciar()
+        return asyncio.run_coroutine_threadsafe(self._reenviar_pendentes(), self._loop).result(timeout)
+
+    @staticmethod
+    def pendentes() -> int:
+        """
+        Mensagens aguardando reenvio
+        """
+        with get_db() as db:
+            return db.query(MensagemPendente).filter(MensagemPendente.status == 'pendente').count()
+
+    def estatisticas(self) -> dict:
+        """
+        Latência dos últimos envios (ms) e contadores
+        """
+        latencias = sorted(self._latencias)
+
+        def percentil(p):
+            if not latencias:
+                return None
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))], 1)
+
+        return {
+            "enviadas": self.enviadas,
+            "falhas": self.falhas,
+            "guardadas": self.guardadas,
+            "reenviadas": self.reenviadas,
+            "latencia_p50_ms": percentil(0.50),
+            "latencia_p95_ms": percentil(0.95),
+            "latencia_max_ms": round(latencias[-1], 1) if latencias else None,
+        }
+
+
+def _registrar_falha_envio(telefone: str):
+    def callback(futuro: Future):
+        erro = futuro.exception()
+        if erro is not None:
+            logger.error("❌ Falha ao enviar mensagem para %s (fica para reenvio): %s", telefone, erro)
+    return callback
+
+
+# Instância compartilhada pela aplicação
+enviador_whatsapp = EnviadorWhatsApp()
+
+
+def enviar_mensagem(telefone: str, mensagem: str) -> Future:
+    """
+    Envia uma mensagem pelo serviço compartilhado, sem bloquear quem chama
+    """
+    return enviador_whatsapp.enviar(telefone, mensagem)
+
+
+async def enviar_mensagem_whatsapp(telefone: str, mensagem: str):
+    """
+    Versão assíncrona, para quem já está dentro de um event loop
+    """
+    return await asyncio.wrap_future(enviador_whatsapp.enviar(telefone, mensagem))
@@ -0,0 +1,72 @@
+# servidor.py
+"""
+Servidor de produção: a entrada ASGI (asgi.py) no uvicorn, com um processo por núcleo.
+
+Uso:
+    python servidor.py [--porta 5001] [--workers N]
+
+Com mais de um processo e sem EVENTOS_BROKER configurado, sobe também o broker local de
+eventos, para que o /eventos de qualquer processo receba as alterações feitas nos outros.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+# === Configuração (variáveis de ambiente) ===
+SERVIDOR_HOST = os.getenv("SERVIDOR_HOST", "0.0.0.0")
+SERVIDOR_PORTA = int(os.getenv("SERVIDOR_PORTA", "5001"))
+SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", "0"))  # 0 = um por núcleo
+SERVIDOR_MAX_WORKERS = int(os.getenv("SERVIDOR_MAX_WORKERS", "8"))  # escritas no SQLite não escalam além disso
+EVENTOS_BROKER_PORTA = int(os.getenv("EVENTOS_BROKER_PORTA", "5055"))
+
+
+def calcular_workers(configurado: int = SERVIDOR_WORKERS) -> int:
+    """
+    Processos do uvicorn: o configurado ou um por núcleo, limitado a SERVIDOR_MAX_WORKERS.
+    Cada processo é assíncrono: atende muitas conexões sem uma thread por requisição
+    """
+    if configurado > 0:
+        return configurado
+    return max(1, min(os.cpu_count() or 1, SERVIDOR_MAX_WORKERS))
+
+
+def _iniciar_broker() -> subprocess.Popen:
+    broker = subprocess.Popen(
+        [sys.executable, "-m", "services.eventos", "--broker", "--porta", str(EVENTOS_BROKER_PORTA)]
+    )
+    time.sleep(0.5)
+    os.environ["EVENTOS_BROKER"] = f"127.0.0.1:{EVENTOS_BROKER_PORTA}"
+    return broker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor ASGI do Bot Checklist CEBRASPE")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PORTA)
+    parser.add_argument("--workers", type=int, default=SERVIDOR_WORKERS, help="0 = um por núcleo")
+    args = parser.parse_args()
+
+    workers = calcular_workers(args.workers)
+    broker = _iniciar_broker() if workers > 1 and not os.getenv("EVENTOS_BROKER") else None
+    print(f"🚀 Servidor ASGI em {args.host}:{args.porta} com {workers} worker(s)")
+    try:
+        uvicorn.run(
+            "asgi:aplicacao",
+            host=args.host,
+            port=args.porta,
+            workers=workers,
+            proxy_headers=True,
+            log_config=None,  # os logs seguem a configuração de services/observabilidade.py
+            timeout_graceful_shutdown=10,
+        )
+    finally:
+        if broker is not None:
+            broker.terminate()
+
+
+if __name__ == "__main__":
+    main()
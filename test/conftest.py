@@ -0,0 +1,106 @@
+"""
+Ambiente dos testes: banco e pastas temporários, Evolution API inacessível e relógio falso.
+As variáveis são definidas antes de importar o app (engine e serviços nascem na importação)
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASTA_TESTES = tempfile.mkdtemp(prefix="checklist_testes_")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(PASTA_TESTES, 'testes.db')}",
+    "FOTOS_DIR": os.path.join(PASTA_TESTES, "fotos"),
+    "EXPORTACAO_DIR": os.path.join(PASTA_TESTES, "exportacoes"),
+    "OPENAI_API_KEY": "teste",
+    "EVOLUTION_API_URL": "http://127.0.0.1:9",  # porta fechada: todo envio falha
+    "WHATSAPP_TIMEOUT": "2",
+    "WHATSAPP_REENVIO_INTERVALO": "3600",  # o reenvio só acontece quando o teste pede
+    "ALBUM_JANELA": "3",
+    "EXPORTACAO_AUTOMATICA": "0",
+    "IMAGEM_PROCESSAMENTO": "0",
+    "LOG_NIVEL": "WARNING",
+})
+sys.path.insert(0, RAIZ)
+
+from database import init_database  # noqa: E402
+from database.database import get_db  # noqa: E402
+from database.models import EventoWebhook, EventoWebhookFalho, MensagemPendente  # noqa: E402
+
+init_database()
+
+
+class RelogioFalso:
+    """
+    Substitui o _agora() da fila e da outbox: o tempo só anda quando o teste manda
+    """
+
+    def __init__(self):
+        self.agora = datetime(2026, 1, 1, 12, 0, 0)
+
+    def __call__(self) -> datetime:
+        return self.agora
+
+    def avancar(self, segundos: float):
+        self.agora += timedelta(seconds=segundos)
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    import services.fila
+    import services.whatsapp
+
+    relogio = RelogioFalso()
+    monkeypatch.setattr(services.fila, "_agora", relogio)
+    monkeypatch.setattr(services.whatsapp, "_agora", relogio)
+    return relogio
+
+
+@pytest.fixture
+def banco_limpo():
+    """
+    Esvazia a fila e a outbox (os testes compartilham o mesmo banco)
+    """
+    def limpar():
+        with get_db() as db:
+            for tabela in (EventoWebhook, EventoWebhookFalho, MensagemPendente):
+                db.query(tabela).delete(synchronize_session=False)
+
+    limpar()
+    yield
+    limpar()
+
+
+@pytest.fixture
+def evolution_falso():
+    """
+    Evolution API local que aceita todos os envios. Retorna (url, mensagens recebidas)
+    """
+    recebidas = []
+
+    class Manipulador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            tamanho = int(self.headers["Content-Length"])
+            recebidas.append(json.loads(self.rfile.read(tamanho)))
+            corpo = b'{"key": {"id": "ENVIADA"}}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manipulador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}", recebidas
+    servidor.shutdown()
+    servidor.server_close()
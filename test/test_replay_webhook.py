@@ -0,0 +1,375 @@
+"""
+Testes de replay: eventos gravados do Evolution API passam pela admissão e pela fila com
+relógio falso (services.fila._agora), sem threads nem esperas reais
+"""
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from conftest import RAIZ
+
+import app
+from database.database import get_db
+from database.models import CacheInterpretacao, EventoWebhook, EventoWebhookFalho, MensagemPendente
+from services.acoes import MarcarConferido, ReiniciarChecklist, VerificarFaltantes
+from services.cache_llm import CacheLLM
+from services.deduplicacao import Deduplicador
+from services.definicoes import compilar_definicao
+from services.estado_fluxo import criar_flow_state_store
+from services.fila import FilaWebhook
+from services.intencoes import MotorIntencoes
+from services.whatsapp import EnviadorWhatsApp
+
+ALBUM_GRAVADO = os.path.join(RAIZ, "test", "dados", "album_8_fotos.json")
+
+
+def evento_texto(remote_jid: str, mensagem_id: str, texto: str) -> dict:
+    return {
+        "event": "messages.upsert",
+        "data": {
+            "key": {"remoteJid": remote_jid, "fromMe": False, "id": mensagem_id},
+            "message": {"conversation": texto},
+        },
+    }
+
+
+def ids(eventos: list) -> list:
+    return [dados["data"]["key"]["id"] for dados in eventos]
+
+
+def drenar(fila: FilaWebhook, relogio, limite: float = 120, passo: float = 0.5):
+    """
+    Processa a fila avançando o relógio falso até não sobrar evento pendente
+    """
+    for _ in range(int(limite / passo)):
+        if fila.processar_proximo():
+            continue
+        if fila.pendentes() == 0:
+            return
+        relogio.avancar(passo)
+    raise AssertionError(f"{fila.pendentes()} evento(s) ainda pendente(s) após {limite}s")
+
+
+def esperar(condicao, prazo: float = 5):
+    limite = time.monotonic() + prazo
+    while not condicao():
+        if time.monotonic() > limite:
+            raise AssertionError("condição não atingida no prazo")
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def fila_do_app(monkeypatch):
+    """
+    Troca a fila do app por uma sem workers: o teste processa cada evento com processar_proximo()
+    """
+    def instalar(**parametros) -> FilaWebhook:
+        fila = FilaWebhook(**parametros)
+        monkeypatch.setattr(fila, "iniciar", lambda: None)
+        monkeypatch.setattr(app, "fila_webhook", fila)
+        return fila
+    return instalar
+
+
+# === Fila: ordem por remetente e reprocessamento ===
+
+def test_ordem_por_remetente_com_backoff(relogio, banco_limpo):
+    processados = []
+    falhas = []
+
+    def processar(dados):
+        mensagem_id = dados["data"]["key"]["id"]
+        if mensagem_id == "A2" and not falhas:
+            falhas.append(mensagem_id)
+            raise RuntimeError("falha temporária")
+        processados.append(mensagem_id)
+
+    fila = FilaWebhook(processar, max_tentativas=3, backoff_base=2)
+    for remote_jid, mensagem_id in [("A", "A1"), ("B", "B1"), ("A", "A2"), ("B", "B2"), ("A", "A3")]:
+        fila.enfileirar(evento_texto(remote_jid, mensagem_id, "oi"))
+
+    while fila.processar_proximo():
+        pass
+    # A2 falhou e segura A3; o remetente B não espera
+    assert processados == ["A1", "B1", "B2"]
+
+    relogio.avancar(1.9)
+    assert not fila.processar_proximo()
+    relogio.avancar(0.2)
+    drenar(fila, relogio)
+    assert processados == ["A1", "B1", "B2", "A2", "A3"]
+
+
+def test_evento_esgotado_vai_para_falhas_e_libera_o_remetente(relogio, banco_limpo):
+    avisos = []
+    processados = []
+
+    def processar(dados):
+        if dados["data"]["key"]["id"] == "X1":
+            raise RuntimeError("sempre falha")
+        processados.append(dados["data"]["key"]["id"])
+
+    fila = FilaWebhook(processar, max_tentativas=2, backoff_base=1,
+                       ao_falhar=lambda dados, erro: avisos.append((ids([dados]), erro)))
+    fila.enfileirar(evento_texto("X", "X1", "oi"))
+    fila.enfileirar(evento_texto("X", "X2", "oi"))
+    drenar(fila, relogio)
+
+    assert processados == ["X2"]
+    assert avisos == [(["X1"], "sempre falha")]
+    with get_db() as db:
+        falho = db.query(EventoWebhookFalho).one()
+        assert (falho.tentativas, falho.erro) == (2, "sempre falha")
+
+
+# === Álbuns (regressão: fotos em lotes de uma) ===
+
+def carregar_album() -> list:
+    with open(ALBUM_GRAVADO, encoding="utf-8") as arquivo:
+        return json.load(arquivo)["eventos"]
+
+
+def test_album_gravado_sai_em_um_lote(relogio, banco_limpo, fila_do_app):
+    individuais = []
+    lotes = []
+    fila = fila_do_app(processar=individuais.append, processar_lote=lotes.append, agrupavel=app.eh_foto_album)
+
+    gravados = carregar_album()
+    for entrada in gravados:
+        relogio.avancar(entrada["intervalo"])
+        resposta, status, _ = app.admitir_evento(entrada["evento"], sincrono=False)
+        assert status == 200 and resposta["status"] == "enfileirado"
+        # Worker consultando a fila enquanto o álbum ainda chega
+        fila.processar_proximo()
+    drenar(fila, relogio)
+
+    assert individuais == []
+    assert [ids(lote) for lote in lotes] == [ids([entrada["evento"] for entrada in gravados])]
+
+
+def test_lote_nao_para_no_atraso_de_chegada(relogio, banco_limpo):
+    lotes = []
+    fila = FilaWebhook(lambda dados: None, processar_lote=lotes.append, agrupavel=lambda dados: True)
+    fila.enfileirar(evento_texto("G", "G1", "foto"))
+    # As seguintes chegaram com atraso (limite por remetente): entram no lote da primeira
+    fila.enfileirar(evento_texto("G", "G2", "foto"), atraso=5)
+    fila.enfileirar(evento_texto("G", "G3", "foto"), atraso=5)
+
+    assert fila.processar_proximo()
+    assert [ids(lote) for lote in lotes] == [["G1", "G2", "G3"]]
+
+
+def test_lote_para_no_evento_em_backoff(relogio, banco_limpo):
+    lotes = []
+    fila = FilaWebhook(lambda dados: None, processar_lote=lotes.append, agrupavel=lambda dados: True)
+    for mensagem_id in ["F1", "F2", "F3"]:
+        fila.enfileirar(evento_texto("F", mensagem_id, "foto"))
+    with get_db() as db:
+        db.query(EventoWebhook).filter(EventoWebhook.payload.contains('"F2"')).update({
+            "tentativas": 1,
+            "disponivel_em": relogio() + timedelta(seconds=10),
+        }, synchronize_session=False)
+
+    assert fila.processar_proximo()
+    assert not fila.processar_proximo()
+    relogio.avancar(10)
+    drenar(fila, relogio)
+    assert [ids(lote) for lote in lotes] == [["F1"], ["F2", "F3"]]
+
+
+# === Envio (regressão: falha no envio reprocessava o evento) ===
+
+def test_falha_no_envio_vai_para_outbox_sem_repetir_o_evento(relogio, banco_limpo, evolution_falso):
+    processados = []
+
+    def processar(dados):
+        processados.append(ids([dados])[0])
+        app.processar_evento(dados)
+
+    fila = FilaWebhook(processar, max_tentativas=3)
+    fila.enfileirar(evento_texto("5561999990002@s.whatsapp.net", "3EB0INICIAR", "iniciar"))
+    assert fila.processar_proximo()
+
+    # O Evolution API está fora do ar: a resposta fica na outbox e o evento é concluído
+    esperar(lambda: EnviadorWhatsApp.pendentes() == 1)
+    url, recebidas = evolution_falso
+    enviador = EnviadorWhatsApp(base_url=url, intervalo_reenvio=0)
+    try:
+        assert enviador.reenviar_pendentes(timeout=10) == 0
+        # O reenvio entrega só a mensagem, quando o backoff da outbox vence
+        relogio.avancar(3600)
+        assert not fila.processar_proximo()
+        assert enviador.reenviar_pendentes(timeout=10) == 1
+    finally:
+        enviador.encerrar()
+    with get_db() as db:
+        evento = db.query(EventoWebhook).one()
+        assert (evento.status, evento.tentativas) == ("concluido", 0)
+    assert [mensagem["number"] for mensagem in recebidas] == ["5561999990002@s.whatsapp.net"]
+    assert EnviadorWhatsApp.pendentes() == 0
+    assert processados == ["3EB0INICIAR"]
+
+
+def test_outbox_mantem_a_ordem_por_telefone(relogio, banco_limpo, evolution_falso):
+    url, recebidas = evolution_falso
+    with get_db() as db:
+        for texto in ["primeira", "segunda"]:
+            db.add(MensagemPendente(telefone="556100", mensagem=texto, status='pendente', tentativas=1,
+                                    disponivel_em=relogio()))
+    enviador = EnviadorWhatsApp(base_url=url, intervalo_reenvio=0)
+    try:
+        assert enviador.reenviar_pendentes(timeout=10) == 2
+    finally:
+        enviador.encerrar()
+    assert [mensagem["text"] for mensagem in recebidas] == ["primeira", "segunda"]
+
+
+# === Deduplicação ===
+
+def test_reentregas_sao_admitidas_uma_vez(banco_limpo, fila_do_app):
+    fila = fila_do_app(processar=lambda dados: None)
+    dados = evento_texto("5561999990003@s.whatsapp.net", "3EB0REENTREGA", "o que falta?")
+
+    status = [app.admitir_evento(dados, sincrono=False)[0]["status"] for _ in range(5)]
+
+    assert status == ["enfileirado"] + ["duplicado"] * 4
+    assert fila.pendentes() == 1
+
+
+def test_deduplicacao_pelo_banco_entre_processos():
+    dados = evento_texto("5561999990004@s.whatsapp.net", "3EB0CONCORRENTE", "oi")
+    # Um Deduplicador por "processo": só o banco é compartilhado
+    deduplicadores = [Deduplicador() for _ in range(8)]
+    barreira = threading.Barrier(len(deduplicadores))
+    aceitos = []
+
+    def registrar(deduplicador):
+        barreira.wait()
+        aceitos.append(deduplicador.registrar(dados))
+
+    threads = [threading.Thread(target=registrar, args=(d,)) for d in deduplicadores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(aceitos) == [False] * 7 + [True]
+    assert Deduplicador().registrar(dados) is False
+
+
+# === Estado do fluxo (compare-and-set) ===
+
+@pytest.mark.parametrize("backend", ["memoria", "banco"])
+def test_compare_and_set_aceita_um_escritor(backend):
+    store = criar_flow_state_store(backend)
+    sessao_id = f"cas-{backend}"
+    versao = store.definir(sessao_id, dia=1)["versao"]
+
+    resultados = []
+    barreira = threading.Barrier(2)
+
+    def avancar(indice):
+        barreira.wait()
+        resultados.append(store.comparar_e_definir(sessao_id, versao, 1, indice))
+
+    threads = [threading.Thread(target=avancar, args=(indice,)) for indice in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(resultados) == [False, True]
+    estado = store.obter(sessao_id)
+    assert estado["versao"] == versao + 1 and estado["indice"] in (1, 2)
+
+
+@pytest.mark.parametrize("backend", ["memoria", "banco"])
+def test_compare_and_set_apos_remover_e_recriar(backend):
+    store = criar_flow_state_store(backend)
+    sessao_id = f"aba-{backend}"
+    antigo = store.definir(sessao_id, dia=1)
+
+    assert store.remover(sessao_id)
+    assert store.obter(sessao_id) is None
+    novo = store.definir(sessao_id, dia=1)
+
+    assert novo["versao"] > antigo["versao"]
+    assert not store.comparar_e_definir(sessao_id, antigo["versao"], 1, 3)
+    assert store.obter(sessao_id)["indice"] == 0
+
+
+# === Interpretador local ===
+
+@pytest.fixture
+def motor():
+    definicao = compilar_definicao({
+        "versao": 1,
+        "dias": {"1": [
+            {"chave": "canetas"},
+            {"chave": "alicate"},
+            {"chave": "lacres", "aliases": ["envelopes de lacre"]},
+        ]},
+    })
+    return MotorIntencoes(definicao)
+
+
+def test_interpretador_reconhece_as_intencoes(motor):
+    assert isinstance(motor.interpretar("O que ainda falta?"), VerificarFaltantes)
+    assert isinstance(motor.interpretar("quero reiniciar tudo"), ReiniciarChecklist)
+
+    acao = motor.interpretar("Conferi as canetas e o alicate")
+    assert isinstance(acao, MarcarConferido)
+    assert acao.itens == ["canetas", "alicate"]
+    assert motor.interpretar("conferi os envelopes de lacre").itens == ["lacres"]
+
+
+@pytest.mark.parametrize("texto", [
+    "conferi as canetas, o que falta?",  # duas intenções
+    "conferi o guarda-chuva",  # item desconhecido
+    "bom dia",
+])
+def test_interpretador_deixa_o_ambiguo_para_o_llm(motor, texto):
+    assert motor.interpretar(texto) is None
+
+
+# === Cache do LLM ===
+
+def test_cache_llm_ida_e_volta_e_versao_do_prompt():
+    resposta = {"action": "marcar_conferido", "itens": ["canetas"]}
+    cache = CacheLLM(modelo="teste", versao_prompt="v1")
+    assert cache.obter("Conferi as canetas") is None
+
+    cache.guardar("Conferi as canetas", resposta)
+
+    assert cache.obter("conferi as canetas") == resposta
+    # Outro processo (memória vazia) encontra a resposta no banco
+    assert CacheLLM(modelo="teste", versao_prompt="v1").obter("Conferi as canetas") == resposta
+    # Nova versão do prompt invalida as entradas antigas
+    assert CacheLLM(modelo="teste", versao_prompt="v2").obter("Conferi as canetas") is None
+
+
+def test_cache_llm_gravacoes_simultaneas():
+    texto = "conferi o alicate"
+    caches = [CacheLLM(modelo="teste", versao_prompt="concorrente") for _ in range(8)]
+    barreira = threading.Barrier(len(caches))
+    erros = []
+
+    def guardar(cache, numero):
+        barreira.wait()
+        try:
+            cache.guardar(texto, {"action": "marcar_conferido", "itens": ["alicate"], "n": numero})
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=guardar, args=(cache, n)) for n, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == []
+    with get_db() as db:
+        assert db.query(CacheInterpretacao).filter(CacheInterpretacao.chave == caches[0].chave(texto)).count() == 1